@@ -0,0 +1,140 @@
+"""Building blocks shared by the REST API viewsets in each app.
+
+Every resource is paged with a cursor over ``updated_at``, can be cut down
+with ``?fields=a,b``, filtered to recent changes with ``?updated_since=``
+and revalidated with ETag/Last-Modified, so a sync job that polls an
+unchanged resource gets a 304 without anything being serialized.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.pagination import CursorPagination
+
+from orders.models import start_of_day
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The request conflicts with the current state of the resource.'
+    default_code = 'conflict'
+
+
+def requested_fields(request):
+    """Field names asked for with ``?fields=``, or None for all of them."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    value = request.query_params.get('fields', '')
+    fields = {name.strip() for name in value.split(',') if name.strip()}
+    return fields or None
+
+
+class SparseFieldsSerializer(serializers.ModelSerializer):
+    """ModelSerializer that only renders the fields named in ``?fields=``.
+
+    Unknown names are ignored. Writes always get the full representation
+    back.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class UpdatedCursorPagination(CursorPagination):
+    """Stable pages in the order rows last changed, for incremental sync."""
+    ordering = ('updated_at', 'pk')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class UpdatedSinceFilter(BaseFilterBackend):
+    """``?updated_since=<ISO date or datetime>`` keeps rows changed since then.
+
+    The bound is inclusive: a client that passes back the newest
+    ``updated_at`` it has seen may get that row again but never misses one
+    changed in the same instant.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get('updated_since')
+        if not value:
+            return queryset
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({'updated_since': 'Expected an ISO 8601 date or datetime.'})
+            since = start_of_day(day)
+        elif timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return queryset.filter(**{f'{view.modified_field}__gte': since})
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified revalidation for ``list`` and ``retrieve``.
+
+    Validators come from ``modified_field`` with one small query, checked
+    before the page is fetched or serialized. A list ETag covers the keys of
+    the page being served and whether more follow. That costs one LIMIT
+    query on the (updated_at, pk) index, however many rows match. A change
+    to any row on the page moves its updated_at, so the row leaves the page
+    and the ETag changes.
+    """
+    modified_field = 'updated_at'
+
+    def _etag(self, request, *parts):
+        key = '|'.join([
+            self.get_queryset().model._meta.label,
+            request.accepted_renderer.format,
+            request.get_full_path(),
+            *map(str, parts),
+        ])
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def _conditional(self, request, etag, last_modified, respond, *args, **kwargs):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Anything can change at any time: clients may keep bodies but must revalidate
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        # Same cursor, same page size: the keys of exactly the rows list() would serve
+        paginator = self.pagination_class()
+        keys = paginator.paginate_queryset(
+            self.filter_queryset(self.get_queryset()).prefetch_related(None).values('pk', self.modified_field),
+            request, view=self,
+        )
+        etag = self._etag(request, paginator.has_next, paginator.has_previous,
+                          *(f"{row['pk']}@{row[self.modified_field].isoformat()}" for row in keys))
+        # No Last-Modified: a deletion doesn't move the newest timestamp
+        return self._conditional(request, etag, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            modified = (self.get_queryset().prefetch_related(None).filter(**lookup)
+                        .values_list(self.modified_field, flat=True).first())
+        except (TypeError, ValueError, DjangoValidationError):
+            modified = None
+        if modified is None:
+            # Not found (or a malformed key): let get_object() answer with its 404
+            return super().retrieve(request, *args, **kwargs)
+        etag = self._etag(request, modified.isoformat())
+        return self._conditional(request, etag, int(modified.timestamp()), super().retrieve, *args, **kwargs)
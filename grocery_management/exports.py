@@ -0,0 +1,31 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+# Rows fetched per round trip when streaming exports from the database
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() just hands the value back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream_response(filename, header, rows):
+    """Stream ``header`` followed by ``rows`` as a CSV attachment.
+
+    ``rows`` should be a lazy iterable (e.g. ``QuerySet.iterator()``) so that
+    nothing is materialised in memory and the first bytes go out immediately.
+    """
+    writer = csv.writer(Echo())
+
+    def generate():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,234 @@
+"""Per-view request metrics, kept in process memory and served at /metrics.
+
+RequestMetricsMiddleware times every request and records its response
+size; a streamed response is measured once its body has been sent. For a
+sample of requests (METRICS_SAMPLE_RATE) it also counts SQL queries and
+their time, and flags a query shape repeated METRICS_N_PLUS_ONE_THRESHOLD
+times or more as a likely N+1. Only sampled requests pay for the SQL
+wrapper. All values go into fixed-bucket
+histograms keyed by the resolved view name.
+
+Each worker process keeps its own numbers. Prometheus should scrape every
+worker, or treat a scrape as a sample of one process.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# The view name used for requests that didn't resolve (404s, redirects in middleware)
+UNRESOLVED = '<unresolved>'
+
+
+def sample_rate():
+    return getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 10)
+
+
+class Histogram:
+    """Counts per bucket plus sum and count, in Prometheus' cumulative form on export."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        # Bucket bounds are inclusive ("le"), which bisect_left gives directly
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.bounds, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+# name -> (help, type, buckets or None)
+METRICS = {
+    'http_request_duration_seconds': ('Wall time spent in the view and middleware.', 'histogram', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Size of response bodies, streamed ones included.', 'histogram', SIZE_BUCKETS),
+    'http_request_queries': ('SQL queries per sampled request.', 'histogram', QUERY_COUNT_BUCKETS),
+    'http_request_sql_duration_seconds': ('SQL time per sampled request.', 'histogram', DURATION_BUCKETS),
+    'http_request_n_plus_one_total': ('Sampled requests that repeated one query shape past the threshold.',
+                                      'counter', None),
+}
+
+_lock = threading.Lock()
+# (metric, view) -> Histogram, or an int for counters
+_values = {}
+
+
+def observe(metric, view, value):
+    key = (metric, view)
+    with _lock:
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = Histogram(METRICS[metric][2])
+        histogram.observe(value)
+
+
+def increment(metric, view, amount=1):
+    key = (metric, view)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def reset():
+    with _lock:
+        _values.clear()
+
+
+def snapshot():
+    """``{(metric, view): value}`` with histograms as ``(buckets, sum, count)``."""
+    with _lock:
+        return {
+            key: (list(value.cumulative()), value.sum, value.count) if isinstance(value, Histogram) else value
+            for key, value in _values.items()
+        }
+
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def query_shape(sql):
+    """SQL with IN-lists of any length folded together."""
+    return _IN_LIST.sub('(%s, ...)', sql)
+
+
+class QueryRecorder:
+    """execute_wrapper that counts, times and groups a request's queries by shape."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql] += 1
+
+    def repeated(self, threshold):
+        shapes = Counter()
+        for sql, count in self.shapes.items():
+            shapes[query_shape(sql)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+class RequestMetricsMiddleware:
+    """Goes first in MIDDLEWARE so the timings cover the rest of the stack."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder() if random.random() < sample_rate() else None
+        start = time.perf_counter()
+        with _recording(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            # Exports run their queries while the body is sent, after the view has returned
+            response.streaming_content = self._streamed(request, recorder, start, response.streaming_content)
+        else:
+            self._record(request, recorder, time.perf_counter() - start, len(response.content))
+        return response
+
+    def _streamed(self, request, recorder, start, content):
+        size = 0
+        try:
+            with _recording(recorder):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._record(request, recorder, time.perf_counter() - start, size)
+
+    @staticmethod
+    def _record(request, recorder, elapsed, size):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else UNRESOLVED
+        observe('http_request_duration_seconds', view, elapsed)
+        observe('http_response_size_bytes', view, size)
+        if recorder is not None:
+            observe('http_request_queries', view, recorder.count)
+            observe('http_request_sql_duration_seconds', view, recorder.seconds)
+            repeated = recorder.repeated(n_plus_one_threshold())
+            if repeated:
+                increment('http_request_n_plus_one_total', view)
+                shape, count = repeated[0]
+                logger.warning('Possible N+1 in %s (%s): %d x %s', view, request.path, count, shape)
+
+
+@contextmanager
+def _recording(recorder):
+    """Route every connection's queries through ``recorder``, if the request is sampled."""
+    with ExitStack() as stack:
+        if recorder is not None:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """The current values in the Prometheus text exposition format."""
+    values = snapshot()
+    lines = []
+    for metric, (help_text, kind, _) in METRICS.items():
+        rows = sorted((view, value) for (name, view), value in values.items() if name == metric)
+        if not rows:
+            continue
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for view, value in rows:
+            view = _label(view)
+            if kind == 'counter':
+                lines.append(f'{metric}{{view="{view}"}} {value}')
+                continue
+            buckets, total, count = value
+            for bound, cumulative in buckets:
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {total}')
+            lines.append(f'{metric}_count{{view="{view}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """Serve render() to staff users, or to scrapers holding METRICS_TOKEN."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = (
+        (token and request.headers.get('Authorization') == f'Bearer {token}')
+        or (request.user.is_authenticated and request.user.is_staff)
+    )
+    if not authorized:
+        return HttpResponseForbidden('Metrics need a staff login or the METRICS_TOKEN bearer token')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,81 @@
+"""Send the reads of reports and exports to a read-only connection.
+
+Which models a request reads says little about whether it is a report (the
+sales report reads the same orders as the till), so the choice is made per
+request instead. ReportReadsMiddleware marks the reports app's views and
+the exports in REPORT_VIEWS, and ReportsRouter sends their reads to the
+REPORTS_DATABASE alias while the mark is set. Writes and every other
+request stay on ``default``. Without the alias configured all of this does
+nothing, which is how development and the test suite run.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Views outside the reports app that read like one
+REPORT_VIEWS = {'products:product_export', 'orders:invoice_batch_export'}
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def reports_alias():
+    """The read-only alias for reports, or None when it isn't configured."""
+    alias = getattr(settings, 'REPORTS_DATABASE', 'reports')
+    return alias if alias in settings.DATABASES else None
+
+
+def is_report_view(match):
+    return match is not None and ('reports' in match.namespaces or match.view_name in REPORT_VIEWS)
+
+
+@contextmanager
+def reads_from(alias):
+    """Route reads made inside the block to ``alias``."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReportsRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same file
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class ReportReadsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            alias, token = getattr(request, '_report_reads', (None, None))
+            if token is not None:
+                _read_alias.reset(token)
+        if alias is not None and response.streaming:
+            # Exports run their queries while the body is sent, after the view has returned
+            response.streaming_content = self._streamed(alias, response.streaming_content)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = reports_alias()
+        if alias is not None and is_report_view(request.resolver_match):
+            request._report_reads = alias, _read_alias.set(alias)
+
+    @staticmethod
+    def _streamed(alias, content):
+        with reads_from(alias):
+            yield from content
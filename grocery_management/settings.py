@@ -24,11 +24,15 @@ INSTALLED_APPS = [
     'reports',
     'django_filters',
     'django_tables2',
+    'rest_framework',
+    'rest_framework.authtoken',
 ]
 SITE_ID = 1 
 
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below; see METRICS_SAMPLE_RATE
+    'grocery_management.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +40,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Last, so it marks the request just before the view runs
+    'grocery_management.routers.ReportReadsMiddleware',
 ]
 
 ROOT_URLCONF = 'grocery_management.urls'
@@ -62,9 +68,59 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # A file-backed test database lets threaded tests use real separate connections
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
+# Production SQLite profile (GROCERY_DB_PROFILE=production): WAL and tuned pragmas on
+# every connection (grocery_management/sqlite/base.py), plus a read-only connection
+# to the same file that ReportsRouter gives the reads of reports and exports
+if os.environ.get('GROCERY_DB_PROFILE') == 'production':
+    DATABASES['default']['ENGINE'] = 'grocery_management.sqlite'
+    DATABASES['reports'] = {
+        'ENGINE': 'grocery_management.sqlite',
+        'NAME': DATABASES['default']['NAME'],
+        'OPTIONS': {'read_only': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# One cache shared by every worker process, so the invalidation that signals do
+# (reports/cache.py, users/dashboard.py) reaches all of them: Redis when
+# GROCERY_REDIS_URL is set, otherwise files next to the database
+if os.environ.get('GROCERY_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['GROCERY_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('GROCERY_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+DATABASE_ROUTERS = ['grocery_management.routers.ReportsRouter']
+# Alias ReportsRouter reads reports from; unused unless it is in DATABASES
+REPORTS_DATABASE = 'reports'
+
+# Order and stock writes through one group-committing writer thread per database
+# (grocery_management/writer.py); worth it when many tills share one SQLite file
+WRITE_QUEUE = os.environ.get('GROCERY_WRITE_QUEUE') == '1'
+# Seconds the writer waits for more writes before committing a batch
+WRITE_QUEUE_WINDOW = 0.002
+WRITE_QUEUE_MAX_BATCH = 200
+
+# Share of requests RequestMetricsMiddleware also counts SQL queries for
+# (grocery_management/metrics.py): every one while developing, a tenth in production
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0 if DEBUG else 0.1))
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -103,9 +159,12 @@ LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # coreapi isn't a dependency (and is deprecated); use DRF's built-in OpenAPI schemas
+    'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
+        # Logged-in back-office users can browse the API too
+        'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
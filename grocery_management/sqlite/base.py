@@ -0,0 +1,49 @@
+"""SQLite backend tuned for serving a shop from one database file.
+
+Every new connection gets the pragmas below, overridable per alias with
+``OPTIONS['pragmas']``. WAL lets report reads run alongside checkout writes
+instead of queueing behind them. ``OPTIONS['read_only']`` opens the file
+with ``mode=ro`` and ``query_only``, so a connection meant for reports
+can't take the write lock even by mistake.
+"""
+import os
+from urllib.request import pathname2url
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at each checkpoint rather than each commit; WAL keeps the file consistent either way
+    'synchronous': 'NORMAL',
+    # Milliseconds a writer waits for the lock before "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative: KiB rather than pages
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Ours, not sqlite3.connect()'s
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.read_only = params.pop('read_only', False)
+        if self.read_only and not self.is_in_memory_db():
+            name = str(params['database'])
+            if not name.startswith('file:'):
+                name = 'file:' + pathname2url(os.path.abspath(name))
+            params['database'] = name + ('&' if '?' in name else '?') + 'mode=ro'
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            # The journal mode is stored in the file; only a writer can change it
+            if name == 'journal_mode' and self.read_only:
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
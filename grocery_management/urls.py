@@ -3,7 +3,18 @@ from django.urls import path, include
 from django.conf import settings
 from django.contrib.auth import views as auth_views
 from users.views import user_login, user_logout, dashboard
+from .metrics import metrics
 from django.conf.urls.static import static
+from rest_framework.authtoken.views import obtain_auth_token
+from rest_framework.routers import DefaultRouter
+from orders.api import OrderItemViewSet, OrderViewSet
+from products.api import CategoryViewSet, ProductViewSet
+
+api_router = DefaultRouter()
+api_router.register('categories', CategoryViewSet, basename='api-category')
+api_router.register('products', ProductViewSet, basename='api-product')
+api_router.register('orders', OrderViewSet, basename='api-order')
+api_router.register('order-items', OrderItemViewSet, basename='api-orderitem')
 
 
 urlpatterns = [
@@ -19,6 +30,11 @@ urlpatterns = [
     path('orders/', include('orders.urls')),
     path('users/', include('users.urls')),
     path('reports/', include('reports.urls')),
+
+    # REST API for tills and sync jobs
+    path('api/', include(api_router.urls)),
+    path('api/token/', obtain_auth_token, name='api_token'),
+    path('metrics', metrics, name='metrics'),
     
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -0,0 +1,174 @@
+"""Single-writer group commit for order and stock writes.
+
+SQLite takes one writer at a time, and every checkout request used to run
+its own short write transaction. Under load those requests queue on the
+file lock, and some give up with "database is locked". With WRITE_QUEUE
+on, functions decorated with @queued_write are handed to one writer thread
+per database alias instead of being run by the request. The writer takes
+whatever has queued up, waiting up to WRITE_QUEUE_WINDOW seconds for more,
+and runs the batch in one transaction. Each call gets its own savepoint,
+so one failure (say InsufficientStock) only undoes that call. After the
+commit, each caller gets its return value or its exception back.
+
+If the batch transaction itself fails, every caller in it gets that
+exception and nothing was written. The model instances they passed in
+may still have been changed by their call, e.g. an order's total_amount
+or a product's stock. Reload them before using them again.
+
+Callers already inside a transaction run inline, because their
+transaction must see the write, and because waiting on the writer while
+holding the lock would deadlock. The same goes for code already running
+on the writer. Writers are per process, so each server worker still
+commits on its own.
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return getattr(settings, 'WRITE_QUEUE', False)
+
+
+def window():
+    return getattr(settings, 'WRITE_QUEUE_WINDOW', 0.002)
+
+
+def max_batch():
+    return getattr(settings, 'WRITE_QUEUE_MAX_BATCH', 200)
+
+
+class Writer(threading.Thread):
+    """Runs queued calls for one database alias, a batch per transaction."""
+
+    def __init__(self, alias):
+        super().__init__(name=f'writer-{alias}', daemon=True)
+        self.alias = alias
+        self.jobs = queue.SimpleQueue()
+        self.batches = 0
+        self.calls = 0
+
+    def submit(self, function, args, kwargs):
+        future = Future()
+        self.jobs.put((future, function, args, kwargs))
+        return future
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def run(self):
+        try:
+            while (batch := self._collect()) is not None:
+                self._commit(batch)
+                connections[self.alias].close_if_unusable_or_obsolete()
+        finally:
+            connections[self.alias].close()
+
+    def _collect(self):
+        """The next batch, or None once stopped (after the calls queued before stop())."""
+        job = self.jobs.get()
+        if job is None:
+            return None
+        batch = [job]
+        deadline = time.monotonic() + window()
+        while len(batch) < max_batch():
+            try:
+                # What queued during the last commit is taken at once, then wait out the window
+                job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _commit(self, batch):
+        outcomes = []
+        committed = []
+        try:
+            with transaction.atomic(using=self.alias):
+                # Runs first among the on_commit hooks: later ones may raise after the commit
+                transaction.on_commit(lambda: committed.append(True), using=self.alias)
+                for future, function, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.alias):
+                            outcomes.append((future, function(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            if not committed:
+                # Nothing in the batch was written, though the calls may have
+                # changed the instances they were given (see the module docstring)
+                for future, _, _, _ in batch:
+                    if future.running():
+                        future.set_exception(e)
+                return
+            logger.exception('on_commit hook failed after a write batch was committed')
+        self.batches += 1
+        self.calls += len(outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def writer(alias=DEFAULT_DB_ALIAS):
+    """The writer thread for ``alias``, started on first use."""
+    with _writers_lock:
+        thread = _writers.get(alias)
+        if thread is None or not thread.is_alive():
+            thread = _writers[alias] = Writer(alias)
+            thread.start()
+        return thread
+
+
+def stats():
+    """``{alias: (calls, batches)}`` committed by the running writers."""
+    with _writers_lock:
+        return {alias: (thread.calls, thread.batches) for alias, thread in _writers.items()}
+
+
+def shutdown():
+    """Stop every writer once its queue is drained, and wait for them."""
+    with _writers_lock:
+        threads = list(_writers.values())
+        _writers.clear()
+    for thread in threads:
+        thread.stop()
+    for thread in threads:
+        thread.join()
+
+
+def run_queued(alias, function, *args, **kwargs):
+    """Call ``function`` on the writer for ``alias`` and wait for its commit, or inline if it can't be queued."""
+    if (
+        not enabled()
+        or connections[alias].in_atomic_block
+        or isinstance(threading.current_thread(), Writer)
+    ):
+        return function(*args, **kwargs)
+    return writer(alias).submit(function, args, kwargs).result()
+
+
+def queued_write(method):
+    """Send calls of ``method`` through run_queued(); a ``using`` argument picks the writer."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        return run_queued(kwargs.get('using') or DEFAULT_DB_ALIAS, method, *args, **kwargs)
+    return wrapper
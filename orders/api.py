@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import F
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from grocery_management.api import (
+    Conflict, ConditionalGetMixin, UpdatedCursorPagination, UpdatedSinceFilter, requested_fields,
+)
+from products.models import InsufficientStock
+from .invoices import prebuild_invoice
+from .models import Order, OrderItem
+from .serializers import OrderItemSerializer, OrderSerializer
+
+
+def _check_pending(order):
+    # Items of completed or cancelled orders have already been accounted for
+    if order.status != 'pending':
+        raise Conflict(f'Cannot change items of a {order.get_status_display().lower()} order.')
+
+
+class OrderViewSet(ConditionalGetMixin,
+                   mixins.CreateModelMixin,
+                   mixins.RetrieveModelMixin,
+                   mixins.UpdateModelMixin,
+                   mixins.ListModelMixin,
+                   viewsets.GenericViewSet):
+    """Orders with their items. There is no DELETE: orders are cancelled,
+    which puts their stock back."""
+    serializer_class = OrderSerializer
+    pagination_class = UpdatedCursorPagination
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, UpdatedSinceFilter]
+    filterset_fields = ['status', 'order_number']
+
+    def get_queryset(self):
+        orders = Order.objects.all()
+        fields = requested_fields(self.request)
+        if fields is None or 'items' in fields:
+            orders = orders.prefetch_related('items')
+        return orders
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        order = self.get_object()
+        if not order.cancel():
+            raise Conflict('Order was already cancelled.')
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        order = self.get_object()
+        if order.status != 'pending':
+            raise Conflict(f'Cannot complete a {order.get_status_display().lower()} order.')
+        if not order.items.exists():
+            raise Conflict('Cannot complete an empty order.')
+        order.status = 'completed'
+        order.save()
+        transaction.on_commit(lambda: prebuild_invoice(order.id))
+        return Response(self.get_serializer(self.get_object()).data)
+
+
+class OrderItemViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """Order lines; writes take or return stock like the order pages do."""
+    # Items change together with their order, which carries the timestamp
+    queryset = OrderItem.objects.annotate(updated_at=F('order__updated_at'))
+    serializer_class = OrderItemSerializer
+    pagination_class = UpdatedCursorPagination
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, UpdatedSinceFilter]
+    filterset_fields = ['order', 'product']
+
+    def perform_create(self, serializer):
+        _check_pending(serializer.validated_data['order'])
+        self._write(serializer.save)
+
+    def perform_update(self, serializer):
+        _check_pending(serializer.instance.order)
+        self._write(serializer.save)
+
+    def perform_destroy(self, instance):
+        _check_pending(instance.order)
+        self._write(instance.delete)
+
+    def _write(self, write):
+        try:
+            write()
+        except InsufficientStock:
+            raise Conflict('Not enough stock for this product.')
@@ -0,0 +1,218 @@
+"""Bulk load of historical orders from CSV or JSON Lines.
+
+History is written as it happened: items are inserted with bulk_create and
+never touch live stock, and order totals are summed in memory instead of
+through OrderItem.save(). Each chunk of orders is one transaction, so an
+interrupted load keeps every chunk it finished, and orders whose number is
+already in the database are skipped, so a load can simply be re-run.
+
+Input is one record per order line with the fields ``order`` (the source
+order number, optional), ``created_at`` (ISO 8601), ``customer_name``,
+``customer_phone``, ``customer_email``, ``customer_address``, ``status``,
+``barcode``, ``quantity`` and ``price``. Lines of one order must be
+consecutive. JSON Lines may instead hold one order per line with its lines
+in an ``items`` list.
+
+Derived aggregates (the daily sales rollup, product sales counters) are not
+maintained during the load and have to be rebuilt afterwards.
+"""
+import csv
+import itertools
+import json
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product
+from .models import Order, OrderItem, sales_day
+
+INGEST_CHUNK_SIZE = getattr(settings, 'ORDER_INGEST_CHUNK_SIZE', 5000)
+
+STATUSES = {value for value, _ in Order.ORDER_STATUS}
+# Prices, line totals and order totals are all DecimalField(max_digits=10, decimal_places=2)
+AMOUNT_LIMIT = Decimal(10) ** (OrderItem._meta.get_field('total').max_digits
+                               - OrderItem._meta.get_field('total').decimal_places)
+# Rows per INSERT for order lines
+ITEM_BATCH_SIZE = 1000
+
+
+class IngestResult:
+    def __init__(self):
+        self.orders = 0
+        self.lines = 0
+        self.skipped = 0
+        self.errors = []
+        self.elapsed = 0.0
+        self.first_day = None
+        self.last_day = None
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'{self.orders} orders with {self.lines} lines, {self.skipped} already loaded, '
+                f'{len(self.errors)} rejected in {self.elapsed:.1f}s ({self.lines_per_second:.0f} lines/s)')
+
+
+def csv_records(lines):
+    """Yield ``(line_number, record)`` for each CSV row."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def jsonl_records(lines):
+    """Yield ``(line_number, record)`` for each JSON Lines record, flattening ``items``."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, {'error': f'Invalid JSON: {e}'}
+            continue
+        items = record.pop('items', None)
+        if items is None:
+            yield number, record
+            continue
+        for item in items:
+            yield number, {**record, **item}
+
+
+def _group(records):
+    """Group consecutive records into ``(line_number, [records])`` per order."""
+    # Unnumbered orders are one CSV row, or one JSON line with its items
+    key = lambda pair: pair[1].get('order') or f'line-{pair[0]}'
+    for _, group in itertools.groupby(records, key=key):
+        group = list(group)
+        yield group[0][0], [record for _, record in group]
+
+
+def _parse_created_at(value):
+    created_at = datetime.fromisoformat(value.strip())
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    return created_at
+
+
+def _build_order(records, product_ids):
+    """Return an unsaved Order and its ``(product_id, quantity, price, total)`` lines.
+
+    Raises ValueError if any line of the order is invalid.
+    """
+    first = records[0]
+    if 'error' in first:
+        raise ValueError(first['error'])
+    try:
+        created_at = _parse_created_at(str(first.get('created_at') or ''))
+    except ValueError:
+        raise ValueError(f"created_at must be an ISO 8601 timestamp, got {first.get('created_at')!r}")
+    status = first.get('status') or 'completed'
+    if status not in STATUSES:
+        raise ValueError(f'Unknown status {status!r}')
+
+    items = []
+    total = Decimal('0')
+    for record in records:
+        barcode = str(record.get('barcode') or '').strip()
+        product_id = product_ids.get(barcode)
+        if product_id is None:
+            raise ValueError(f'Unknown product barcode {barcode!r}')
+        try:
+            quantity = int(record.get('quantity'))
+            price = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+        except (TypeError, ValueError, InvalidOperation):
+            raise ValueError(f"Bad quantity or price for {barcode}: {record.get('quantity')!r}, {record.get('price')!r}")
+        if quantity < 1:
+            raise ValueError(f'Quantity for {barcode} must be at least 1')
+        # NaN gets through quantize() and would only fail inside bulk_create, mid-ingest
+        if not price.is_finite() or price < 0:
+            raise ValueError(f"Price for {barcode} must be a number of at least 0, got {record.get('price')!r}")
+        line_total = price * quantity
+        if line_total >= AMOUNT_LIMIT:
+            raise ValueError(f'Line total for {barcode} must be less than {AMOUNT_LIMIT}')
+        total += line_total
+        items.append((product_id, quantity, price, line_total))
+    if total >= AMOUNT_LIMIT:
+        raise ValueError(f'Order total must be less than {AMOUNT_LIMIT}')
+
+    # Same format as Order.save() for orders without a source number
+    order_number = str(first.get('order') or '').strip() or uuid.uuid4().hex[:20].upper()
+    if len(order_number) > 20:
+        raise ValueError(f'Order number {order_number!r} is longer than 20 characters')
+
+    order = Order(
+        order_number=order_number,
+        customer_name=first.get('customer_name') or '',
+        customer_phone=first.get('customer_phone') or '',
+        customer_email=first.get('customer_email') or '',
+        customer_address=first.get('customer_address') or '',
+        created_at=created_at,
+        status=status,
+        total_amount=total,
+    )
+    return order, items
+
+
+def _write_chunk(chunk, result):
+    """Write ``(line_number, order, items)`` triples, skipping orders already loaded."""
+    numbers = [order.order_number for _, order, _ in chunk]
+    loaded = set(Order.objects.filter(order_number__in=numbers).values_list('order_number', flat=True))
+    pending = []
+    seen = set()
+    for line, order, items in chunk:
+        if order.order_number in loaded:
+            result.skipped += 1
+        elif order.order_number in seen:
+            result.errors.append((line, f'Order number {order.order_number!r} appears more than once'))
+        else:
+            seen.add(order.order_number)
+            pending.append((order, items))
+    if not pending:
+        return
+
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([order for order, _ in pending])
+        lines = OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price=price, total=total)
+                for order, (_, items) in zip(orders, pending)
+                for product_id, quantity, price, total in items
+            ],
+            batch_size=ITEM_BATCH_SIZE,
+        )
+
+    result.orders += len(pending)
+    result.lines += len(lines)
+    days = [sales_day(order.created_at) for order in orders]
+    result.first_day = min(result.first_day or min(days), min(days))
+    result.last_day = max(result.last_day or max(days), max(days))
+
+
+def ingest_orders(records, chunk_size=INGEST_CHUNK_SIZE):
+    """Load ``(line_number, record)`` pairs from csv_records/jsonl_records; returns an IngestResult."""
+    result = IngestResult()
+    started = time.perf_counter()
+    product_ids = dict(Product.objects.exclude(barcode='').values_list('barcode', 'pk'))
+
+    chunk = []
+    for line, records in _group(records):
+        try:
+            chunk.append((line, *_build_order(records, product_ids)))
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, result)
+            chunk = []
+    if chunk:
+        _write_chunk(chunk, result)
+
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,292 @@
+"""Invoice PDFs rendered in a bounded process pool and cached on disk.
+
+Cached files are named after a fingerprint of everything printed on the
+invoice, so a download of an unchanged order is a plain file read and any
+change to its lines, totals or status produces a fresh PDF.
+
+INVOICE_ENGINE picks how PDFs are produced: 'xhtml2pdf' (the default)
+converts the invoice template, 'reportlab' draws the invoice directly and is
+much faster. INVOICE_FONT / INVOICE_FONT_BOLD may point at TrueType files
+for the reportlab engine.
+"""
+import glob
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils.dateformat import format as format_date
+
+from .pdf import LAYOUT_VERSION, html_to_pdf, invoice_to_pdf
+
+TEMPLATE_NAME = 'orders/invoice_pdf.html'
+
+STORE = getattr(settings, 'STORE_INFO', {
+    'name': 'Grocery Store',
+    'address': 'Pimpri, Pune, Maharashtra 411017',
+    'phone': '9699970785',
+    'email': 'omvirshette@gmail.com'
+})
+
+RENDER_WORKERS = getattr(settings, 'INVOICE_RENDER_WORKERS', min(2, os.cpu_count() or 1))
+RENDER_TIMEOUT = getattr(settings, 'INVOICE_RENDER_TIMEOUT', 60)
+BATCH_CHUNK_SIZE = 200
+BATCH_PROGRESS_TIMEOUT = 60 * 60
+
+_pool = None
+_pool_lock = threading.Lock()
+_prebuilder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoice-prebuild')
+_template = None
+
+
+class InvoiceRenderError(Exception):
+    def __init__(self, html):
+        super().__init__('Invoice HTML could not be converted to PDF')
+        self.html = html
+
+
+def invoice_engine():
+    return getattr(settings, 'INVOICE_ENGINE', 'xhtml2pdf')
+
+
+def cache_dir():
+    return getattr(settings, 'INVOICE_CACHE_DIR', None) or os.path.join(settings.BASE_DIR, 'invoice_cache')
+
+
+def render_pool():
+    """The process pool invoices are converted in, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _invoice_template():
+    global _template
+    if _template is None:
+        template = get_template(TEMPLATE_NAME)
+        source = getattr(getattr(template, 'template', None), 'source', '')
+        _template = template, hashlib.sha256(source.encode()).hexdigest()
+    return _template
+
+
+def invoice_queryset():
+    from .models import Order, OrderItem
+    return Order.objects.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('pk'))
+    )
+
+
+def invoice_fingerprint(order):
+    """Hash of every value the invoice prints; ``order`` needs its items prefetched."""
+    engine = invoice_engine()
+    if engine == 'reportlab':
+        layout = repr((LAYOUT_VERSION, invoice_fonts()))
+    else:
+        _, layout = _invoice_template()
+    parts = [
+        engine, layout, repr(sorted(STORE.items())),
+        order.order_number, order.status, str(order.total_amount), order.created_at.date().isoformat(),
+        order.customer_name, order.customer_address, order.customer_phone, order.customer_email,
+    ]
+    for item in order.items.all():
+        parts += [item.product.name, str(item.quantity), str(item.price), str(item.total)]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def invoice_path(order, fingerprint):
+    return os.path.join(cache_dir(), f'{order.order_number}-{fingerprint[:32]}.pdf')
+
+
+def render_invoice_html(order):
+    template, _ = _invoice_template()
+    return template.render({'order': order, 'store': STORE})
+
+
+def invoice_fonts():
+    """``(regular, bold)`` TrueType font paths for the reportlab engine, or None for Helvetica."""
+    return getattr(settings, 'INVOICE_FONT', None), getattr(settings, 'INVOICE_FONT_BOLD', None)
+
+
+def invoice_data(order):
+    """Plain, picklable values the reportlab engine draws; ``order`` needs its items prefetched."""
+    customer = [order.customer_name]
+    if order.customer_address:
+        customer.append(order.customer_address)
+    if order.customer_phone:
+        customer.append(f'Phone: {order.customer_phone}')
+    if order.customer_email:
+        customer.append(f'Email: {order.customer_email}')
+    return {
+        'number': order.order_number,
+        'date': format_date(order.created_at, 'F j, Y'),
+        'customer': customer,
+        'items': [
+            (item.product.name, item.quantity, str(item.price), str(item.total))
+            for item in order.items.all()
+        ],
+        'total': str(order.total_amount),
+    }
+
+
+def submit_invoice(order):
+    """Start converting ``order`` with the configured engine; returns ``(future, html)``.
+
+    ``html`` is None for the reportlab engine, which never reports errors.
+    """
+    if invoice_engine() == 'reportlab':
+        store = tuple(sorted(STORE.items()))
+        return render_pool().submit(invoice_to_pdf, invoice_data(order), store, *invoice_fonts()), None
+    html = render_invoice_html(order)
+    return render_pool().submit(html_to_pdf, html), html
+
+
+def get_invoice_pdf(order):
+    """Return the path of an up-to-date PDF for ``order``, rendering it if needed.
+
+    Raises InvoiceRenderError if xhtml2pdf reports errors.
+    """
+    path = invoice_path(order, invoice_fingerprint(order))
+    if os.path.exists(path):
+        return path
+
+    future, html = submit_invoice(order)
+    pdf, errors = future.result(timeout=RENDER_TIMEOUT)
+    if errors:
+        raise InvoiceRenderError(html)
+    return store_invoice_pdf(order, path, pdf)
+
+
+def store_invoice_pdf(order, path, pdf):
+    """Atomically write ``pdf`` to ``path`` and drop older versions of the invoice."""
+    os.makedirs(cache_dir(), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir(), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(pdf)
+    os.replace(tmp_path, path)
+
+    for stale in glob.glob(os.path.join(cache_dir(), f'{glob.escape(order.order_number)}-*.pdf')):
+        if stale != path:
+            try:
+                os.unlink(stale)
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def _prebuild(order_id):
+    try:
+        order = invoice_queryset().filter(pk=order_id).first()
+        if order is not None:
+            get_invoice_pdf(order)
+    except InvoiceRenderError:
+        pass
+    finally:
+        connections.close_all()
+
+
+def prebuild_invoice(order_id):
+    """Build an order's invoice in the background so the first download is a file read."""
+    return _prebuilder.submit(_prebuild, order_id)
+
+
+class _ZipStream:
+    """Write-only, unseekable sink that zipfile writes into and we drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _progress_key(job_id):
+    return f'orders:invoice-batch:{job_id}'
+
+
+def batch_progress(job_id):
+    return cache.get(_progress_key(job_id))
+
+
+def batch_invoice_zip(orders, job_id):
+    """Yield a ZIP archive of invoices for ``orders`` as each PDF becomes ready.
+
+    Cached PDFs are added straight away; the rest are converted in the process
+    pool with at most ``2 * RENDER_WORKERS`` conversions in flight, so only a
+    handful of invoices are ever held in memory. Progress is kept in the cache
+    under ``job_id`` for batch_progress().
+    """
+    progress = {'total': orders.count(), 'done': 0, 'failed': [], 'finished': False}
+    cache.set(_progress_key(job_id), progress, BATCH_PROGRESS_TIMEOUT)
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED)
+    pending = {}
+
+    def add(order, path=None, pdf=None):
+        name = f'Invoice_{order.order_number}.pdf'
+        if path is not None:
+            archive.write(path, name)
+        else:
+            archive.writestr(name, pdf)
+        progress['done'] += 1
+        cache.set(_progress_key(job_id), progress, BATCH_PROGRESS_TIMEOUT)
+
+    def collect(futures):
+        for future in futures:
+            order, path = pending.pop(future)
+            pdf, errors = future.result(timeout=RENDER_TIMEOUT)
+            if errors:
+                progress['failed'].append(order.order_number)
+                cache.set(_progress_key(job_id), progress, BATCH_PROGRESS_TIMEOUT)
+                continue
+            store_invoice_pdf(order, path, pdf)
+            add(order, pdf=pdf)
+
+    try:
+        for order in orders.iterator(chunk_size=BATCH_CHUNK_SIZE):
+            path = invoice_path(order, invoice_fingerprint(order))
+            if os.path.exists(path):
+                add(order, path=path)
+            else:
+                future, _ = submit_invoice(order)
+                pending[future] = (order, path)
+                if len(pending) >= 2 * RENDER_WORKERS:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            yield stream.drain()
+        collect(list(pending))
+        if progress['failed']:
+            archive.writestr('errors.txt', 'Could not render invoices for orders:\n' + '\n'.join(progress['failed']))
+        archive.close()
+        yield stream.drain()
+    finally:
+        for future in pending:
+            future.cancel()
+        progress['finished'] = True
+        cache.set(_progress_key(job_id), progress, BATCH_PROGRESS_TIMEOUT)
@@ -0,0 +1,263 @@
+"""Concurrent till load test for the checkout write path.
+
+Each worker thread plays one till with its own test client and database
+connection. It creates an order, scans and adds items picked from a skewed
+popularity distribution, then completes the order, all through the real
+views. Only orders that end up completed count as checkouts; orders whose
+every line was refused for stock are counted as left empty. A request that fails with "database is locked" is retried like a
+till would, and counted. Afterwards the stock, ledger and order totals the
+run touched are checked against each other.
+
+Requests go through django.test.Client in-process, so the GIL is in the
+measurement too. Use it to compare write paths against each other rather
+than as a capacity figure for a multi-process server.
+"""
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import OperationalError, connection
+from django.db.models import Max, Sum
+from django.test import Client
+from django.urls import resolve, reverse
+
+from products.models import Product, StockMovement
+from .models import Order, OrderItem
+
+STEPS = ('create', 'scan', 'add', 'basket', 'complete')
+CENT = Decimal('0.01')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class LoadTestResult:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # step -> [seconds]
+        self.checkouts = 0  # orders completed
+        self.abandoned = 0
+        self.empty = 0  # orders left open because every line was refused
+        self.refused_lines = 0
+        self.locked = 0
+        self.errors = Counter()
+        self.order_ids = []
+        self.elapsed = 0.0
+        self.violations = []
+        self._lock = threading.Lock()
+
+    @property
+    def requests(self):
+        return sum(len(values) for values in self.latencies.values())
+
+    def merge(self, other):
+        with self._lock:
+            for step, values in other.latencies.items():
+                self.latencies[step].extend(values)
+            self.checkouts += other.checkouts
+            self.abandoned += other.abandoned
+            self.empty += other.empty
+            self.refused_lines += other.refused_lines
+            self.locked += other.locked
+            self.errors.update(other.errors)
+            self.order_ids.extend(other.order_ids)
+
+    def report(self):
+        """Lines of a human readable summary."""
+        elapsed = self.elapsed or 1
+        yield (f'{self.checkouts} checkouts in {self.elapsed:.1f}s: {self.checkouts / elapsed:.1f} checkouts/s, '
+               f'{self.requests / elapsed:.1f} requests/s')
+        yield (f'{self.abandoned} abandoned, {self.empty} left empty, {self.refused_lines} lines refused '
+               f'for stock, {self.locked} "database is locked" errors (retried)')
+        for step in STEPS:
+            values = self.latencies.get(step)
+            if values:
+                ms = [value * 1000 for value in values]
+                yield (f'  {step:<9} {len(ms):>7} requests  p50 {percentile(ms, 50):8.1f} ms  '
+                       f'p90 {percentile(ms, 90):8.1f} ms  p99 {percentile(ms, 99):8.1f} ms  max {max(ms):8.1f} ms')
+        for error, count in self.errors.most_common():
+            yield f'  error: {count} x {error}'
+        yield f'{len(self.violations)} consistency violations'
+        for violation in self.violations[:20]:
+            yield f'  {violation}'
+
+
+class Abandon(Exception):
+    """A request kept failing; the till gives up on this checkout."""
+
+
+class Till:
+    def __init__(self, number, user, products, weights, options, deadline, remaining):
+        self.number = number
+        self.products = products
+        self.weights = weights
+        self.options = options
+        self.deadline = deadline
+        self.remaining = remaining
+        self.rng = random.Random(options['seed'] * 1000 + number)
+        self.result = LoadTestResult()
+        self.client = Client()
+        self.client.force_login(user)
+
+    def request(self, step, method, path, data=None, **extra):
+        for attempt in itertools.count():
+            started = time.perf_counter()
+            try:
+                response = getattr(self.client, method)(path, data, follow=self.options['follow'], **extra)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                self.result.locked += 1
+                if attempt >= self.options['retries']:
+                    raise Abandon(f'{step}: database is locked')
+                time.sleep(self.rng.uniform(0, 0.01 * 2 ** attempt))
+                continue
+            self.result.latencies[step].append(time.perf_counter() - started)
+            return response
+
+    def redirected_to(self, response):
+        """The view a redirect ended on, or None if the response wasn't one."""
+        if self.options['follow']:
+            target = response.redirect_chain[-1][0] if response.redirect_chain else None
+        else:
+            target = response.get('Location')
+        return resolve(target) if target else None
+
+    def checkout(self):
+        response = self.request('create', 'post', reverse('orders:order_create'), {
+            'customer_name': f'Till {self.number}', 'customer_phone': f'{self.number:04d}',
+        })
+        match = self.redirected_to(response)
+        if match is None:
+            raise Abandon(f'create: status {response.status_code}')
+        order_id = match.kwargs['order_id']
+        self.result.order_ids.append(order_id)
+
+        count = max(1, round(self.rng.expovariate(1 / self.options['lines'])))
+        basket = []
+        added_any = False
+        for product_id, barcode in self.rng.choices(self.products, cum_weights=self.weights, k=count):
+            quantity = self.rng.choice((1, 1, 1, 2, 3))
+            scan = self.request('scan', 'post', reverse('products:barcode_scan'), {'barcode': barcode})
+            if scan.status_code != 200:
+                raise Abandon(f'scan: status {scan.status_code}')
+            if self.options['flow'] == 'basket':
+                basket.append({'barcode': barcode, 'quantity': quantity})
+                continue
+            added = self.request('add', 'post', reverse('orders:order_add_items', args=[order_id]), {
+                'product': product_id, 'quantity': quantity,
+            })
+            # Added items redirect back to the page; a re-rendered form is a refusal
+            if added.status_code == 200 and not getattr(added, 'redirect_chain', None):
+                self.result.refused_lines += 1
+            else:
+                added_any = True
+        if basket:
+            response = self.request('basket', 'post', reverse('orders:order_add_basket', args=[order_id]),
+                                    data=json.dumps({'items': basket}), content_type='application/json')
+            if response.status_code == 409:
+                self.result.refused_lines += len(basket)
+            added_any = response.status_code == 200
+
+        if not added_any:
+            # Nothing to sell: the order stays open and empty, like a till walking away
+            self.result.empty += 1
+            return
+        response = self.request('complete', 'get', reverse('orders:order_complete', args=[order_id]))
+        # A completed order goes back to the list; a refused one back to its items
+        match = self.redirected_to(response)
+        if match is None or match.view_name != 'orders:order_list':
+            raise Abandon(f'complete: not completed (status {response.status_code})')
+        self.result.checkouts += 1
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline and self.remaining():
+                try:
+                    self.checkout()
+                except Abandon as e:
+                    self.result.abandoned += 1
+                    self.result.errors[str(e)] += 1
+                except Exception as e:
+                    self.result.abandoned += 1
+                    self.result.errors[f'{type(e).__name__}: {e}'] += 1
+        finally:
+            connection.close()
+
+
+def popular_products(limit):
+    """``[(product_id, barcode), ...]`` of in-stock products, best sellers first."""
+    return list(
+        Product.objects.filter(stock__gt=0).exclude(barcode='')
+        .order_by('-units_sold', 'pk').values_list('pk', 'barcode')[:limit]
+    )
+
+
+def check_consistency(before, order_ids, user, last_order_id):
+    """Compare stock, the stock ledger and order totals after a run; returns violations."""
+    violations = []
+    # Orders the tills never saw: written by a request that then failed and was retried
+    orphans = (Order.objects.filter(pk__gt=last_order_id, created_by=user)
+               .exclude(pk__in=order_ids).values_list('pk', flat=True))
+    violations.extend(f'order {pk}: left behind by a failed request' for pk in orphans)
+    orders = Order.objects.filter(pk__in=order_ids)
+    numbers = list(orders.values_list('order_number', flat=True))
+    sold = dict(
+        OrderItem.objects.filter(order__in=orders).exclude(order__status='cancelled')
+        .values('product_id').annotate(quantity=Sum('quantity')).values_list('product_id', 'quantity')
+    )
+    ledger = dict(
+        StockMovement.objects.filter(reference__in=numbers)
+        .values('product_id').annotate(delta=Sum('delta')).values_list('product_id', 'delta')
+    )
+    after = dict(Product.objects.filter(pk__in=before).values_list('pk', 'stock'))
+    for product_id, stock in before.items():
+        expected = stock - sold.get(product_id, 0)
+        if after.get(product_id) != expected:
+            violations.append(f'product {product_id}: stock {after.get(product_id)}, expected {expected}')
+        if after.get(product_id, 0) < 0:
+            violations.append(f'product {product_id}: negative stock {after[product_id]}')
+        if ledger.get(product_id, 0) != -sold.get(product_id, 0):
+            violations.append(f'product {product_id}: ledger {ledger.get(product_id, 0)}, '
+                              f'sold {sold.get(product_id, 0)}')
+    # Compared in Python: SQLite sums decimals as floats
+    for order in orders.annotate(items_total=Sum('items__total')):
+        items_total = Decimal(str(order.items_total or 0)).quantize(CENT)
+        if items_total != order.total_amount:
+            violations.append(f'order {order.pk}: total {order.total_amount}, items {items_total}')
+    return violations
+
+
+def run(user, workers, seconds, options, checkouts=None):
+    """Run ``workers`` tills for ``seconds`` (or until ``checkouts`` are done); returns a LoadTestResult."""
+    products = popular_products(options['products'])
+    if not products:
+        raise ValueError('No products in stock to sell')
+    weights = list(itertools.accumulate(1 / (rank + 1) ** options['skew'] for rank in range(len(products))))
+    before = dict(Product.objects.filter(pk__in=[pk for pk, _ in products]).values_list('pk', 'stock'))
+    last_order_id = Order.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    started_count = itertools.count()
+    remaining = (lambda: next(started_count) < checkouts) if checkouts else (lambda: True)
+    deadline = time.monotonic() + seconds
+    tills = [Till(n, user, products, weights, options, deadline, remaining) for n in range(workers)]
+    threads = [threading.Thread(target=till.run) for till in tills]
+
+    result = LoadTestResult()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    for till in tills:
+        result.merge(till.result)
+    result.violations = check_consistency(before, result.order_ids, user, last_order_id)
+    return result
@@ -0,0 +1,72 @@
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.invoices import STORE, invoice_data, invoice_fonts, render_invoice_html
+from orders.pdf import html_to_pdf, invoice_to_pdf
+
+
+def synthetic_order(lines, seed=0):
+    """An order-shaped object with ``lines`` items that both engines can render."""
+    rng = random.Random(seed)
+    items = []
+    for n in range(lines):
+        price = Decimal(rng.randint(100, 50000)) / 100
+        quantity = rng.randint(1, 12)
+        items.append(SimpleNamespace(
+            product=SimpleNamespace(name=f'Product {rng.randrange(100000)} {"x" * rng.randint(0, 20)}'),
+            quantity=quantity, price=price, total=price * quantity,
+        ))
+    return SimpleNamespace(
+        order_number='ORD20240101000001', status='completed',
+        created_at=timezone.make_aware(datetime(2024, 1, 1, 12)),
+        customer_name='Customer', customer_address='12 Market Road, Pune',
+        customer_phone='9000000000', customer_email='customer@example.com',
+        total_amount=sum(item.total for item in items),
+        items=SimpleNamespace(all=lambda: items),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Compare invoice throughput of the xhtml2pdf and reportlab engines, '
+            'in-process, at several line counts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[5, 50, 200],
+                            help='Line items per invoice')
+        parser.add_argument('--seconds', type=float, default=3.0,
+                            help='Minimum time to spend on each engine and line count')
+        parser.add_argument('--engine', choices=['xhtml2pdf', 'reportlab'], action='append',
+                            help='Only run the given engine(s)')
+
+    def _run(self, engine, lines, render, seconds):
+        render()  # warm up fonts, template and the cached header
+        count = 0
+        size = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            pdf, errors = render()
+            size = len(pdf)
+            count += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{engine:<10} {lines:>5} lines  {count:>6} invoices  '
+                          f'{count / elapsed:9.1f} invoices/s  {size / 1024:7.1f} KiB')
+
+    def handle(self, *args, **options):
+        engines = options['engine'] or ['xhtml2pdf', 'reportlab']
+        store = tuple(sorted(STORE.items()))
+        fonts = invoice_fonts()
+        for lines in options['lines']:
+            order = synthetic_order(lines)
+            if 'xhtml2pdf' in engines:
+                # Template rendering is part of the cost of this engine
+                self._run('xhtml2pdf', lines, lambda: html_to_pdf(render_invoice_html(order)),
+                          options['seconds'])
+            if 'reportlab' in engines:
+                self._run('reportlab', lines, lambda: invoice_to_pdf(invoice_data(order), store, *fonts),
+                          options['seconds'])
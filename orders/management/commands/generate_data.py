@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.ingest import INGEST_CHUNK_SIZE
+from orders.models import Order
+from orders.synthetic import SCALES, generate
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Fill an empty database with a deterministic synthetic catalogue and order history '
+            'for benchmarking. See orders/synthetic.py for the shape of the data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small',
+                            help=', '.join(f'{name}: {p} products, {o} orders, ~{l} lines/order'
+                                           for name, (p, o, l) in SCALES.items()))
+        parser.add_argument('--products', type=int, help='Override the number of products')
+        parser.add_argument('--orders', type=int, help='Override the number of orders')
+        parser.add_argument('--lines', type=float, help='Override the mean lines per order')
+        parser.add_argument('--days', type=int, default=730, help='Days of history')
+        parser.add_argument('--end-date', type=date.fromisoformat, default=date.today(),
+                            help='Last day of history, YYYY-MM-DD (default: today)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE,
+                            help='Orders written per transaction')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Skip rebuilding the sales rollup and product sales counters')
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or Order.objects.exists():
+            raise CommandError('The database already has products or orders; generate into an empty one.')
+        products, orders, lines = SCALES[options['scale']]
+        result = generate(
+            products=options['products'] or products,
+            orders=options['orders'] or orders,
+            mean_lines=options['lines'] or lines,
+            end=options['end_date'],
+            days=options['days'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {options["products"] or products} products and {result}.'))
+
+        if result.orders and not options['no_rebuild']:
+            call_command('rebuild_sales_rollup', '--start', result.first_day.isoformat(),
+                         '--end', result.last_day.isoformat(), stdout=self.stdout)
+            call_command('rebuild_product_sales', stdout=self.stdout)
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.ingest import INGEST_CHUNK_SIZE, csv_records, ingest_orders, jsonl_records
+
+
+class Command(BaseCommand):
+    help = ('Bulk load historical orders from CSV or JSON Lines without touching stock, '
+            'then rebuild the sales aggregates. See orders/ingest.py for the record format.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to load, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension, else csv)')
+        parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE,
+                            help='Orders written per transaction')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Skip rebuilding the sales rollup and product sales counters')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        read = jsonl_records if fmt == 'jsonl' else csv_records
+        try:
+            if path == '-':
+                result = ingest_orders(read(sys.stdin), options['chunk_size'])
+            else:
+                with open(path, newline='', encoding='utf-8-sig', buffering=1 << 20) as f:
+                    result = ingest_orders(read(f), options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Loaded {result}.'))
+
+        if result.orders and not options['no_rebuild']:
+            call_command('rebuild_sales_rollup', '--start', result.first_day.isoformat(),
+                         '--end', result.last_day.isoformat(), stdout=self.stdout)
+            call_command('rebuild_product_sales', stdout=self.stdout)
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from grocery_management import writer
+from orders import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Drive concurrent tills through create order -> scan/add items -> complete against '
+            'the configured database and report throughput, latency percentiles, "database is '
+            'locked" errors and stock consistency. Writes real orders and takes real stock: run '
+            'it against a copy, e.g. one filled with generate_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent tills')
+        parser.add_argument('--seconds', type=float, default=30.0, help='How long to run')
+        parser.add_argument('--checkouts', type=int, help='Stop after this many checkouts have been started in total')
+        parser.add_argument('--flow', choices=['items', 'basket'], default='items',
+                            help='Add lines one form post at a time, or as one basket post')
+        parser.add_argument('--lines', type=float, default=5.0, help='Mean lines per checkout')
+        parser.add_argument('--products', type=int, default=500,
+                            help='Sell from this many best-selling in-stock products')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of product popularity (0 = uniform)')
+        parser.add_argument('--retries', type=int, default=5,
+                            help='Retries of a request that hit "database is locked"')
+        parser.add_argument('--follow', action='store_true',
+                            help='Also load the pages the tills are redirected to, like a browser')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--write-queue', action='store_true',
+                            help='Send order and stock writes through the group-commit writer (WRITE_QUEUE)')
+        parser.add_argument('--strict', action='store_true',
+                            help='Exit non-zero on any consistency violation')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        user, _ = get_user_model().objects.get_or_create(username='loadtest')
+        # Production-like: no per-query debug logging, and the test client's host allowed
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                               WRITE_QUEUE=options['write_queue'] or writer.enabled()):
+            try:
+                result = loadtest.run(user, options['workers'], options['seconds'], options,
+                                      checkouts=options['checkouts'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            finally:
+                stats = writer.stats()
+                writer.shutdown()
+        for line in result.report():
+            self.stdout.write(line)
+        for alias, (calls, batches) in stats.items():
+            self.stdout.write(f'write queue ({alias}): {calls} writes in {batches} commits')
+        if result.violations and options['strict']:
+            raise CommandError(f'{len(result.violations)} consistency violations')
@@ -1,9 +1,40 @@
 import uuid
-from django.db import models
+from datetime import datetime, time, timedelta
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.core.validators import MinValueValidator
-from products.models import Product
+from products.models import Product, StockMovement
 from users.models import User
 from django.utils import timezone
+from grocery_management.writer import queued_write
+from .signals import order_total_changed
+
+def start_of_day(day):
+    """The aware datetime at which local calendar day ``day`` begins."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def sales_day(value):
+    """Return the local calendar day a ``created_at`` timestamp falls on."""
+    if timezone.is_aware(value):
+        return timezone.localdate(value)
+    return value.date()
+
+
+class OrderQuerySet(models.QuerySet):
+    def created_between(self, start=None, end=None):
+        """Orders created on local days ``start`` through ``end`` inclusive.
+
+        Filters on a created_at range rather than created_at__date, which
+        wraps the column in a function and can't use its index.
+        """
+        queryset = self
+        if start:
+            queryset = queryset.filter(created_at__gte=start_of_day(start))
+        if end:
+            queryset = queryset.filter(created_at__lt=start_of_day(end + timedelta(days=1)))
+        return queryset
+
 
 class Order(models.Model):
     ORDER_STATUS = (
@@ -19,18 +50,106 @@ class Order(models.Model):
     customer_address = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # Bumped by status changes and by every item write through add_to_total()
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=ORDER_STATUS, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     notes = models.TextField(blank=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Sales reports and exports: status filter + date range/ordering
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # Order list keyset pages, dashboard "today" and recent orders
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # API delta sync: ?updated_since= and cursor pages in update order
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+
+    @queued_write
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate a unique order number
             self.order_number = str(uuid.uuid4().hex)[:20].upper()
-        super().save(*args, **kwargs)
+        # The sales rollup is updated by post_save; keep both in one commit
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order #{self.order_number} - {self.customer_name}"
 
+    @queued_write
+    def cancel(self):
+        """Cancel the order and put its items back in stock.
+
+        Returns False if the order was already cancelled.
+        """
+        with transaction.atomic():
+            status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=self.pk)
+            if status == 'cancelled':
+                return False
+            quantities = (
+                self.items.values('product_id')
+                .annotate(quantity=Sum('quantity'), total=Sum('total'))
+                .order_by()
+            )
+            for row in quantities:
+                Product.adjust_stock(row['product_id'], row['quantity'],
+                                     reason=StockMovement.RESTOCK, reference=self.order_number)
+            Product.record_sales(sales_day(self.created_at), {
+                row['product_id']: (-row['quantity'], -row['total']) for row in quantities
+            })
+            self.status = 'cancelled'
+            self.save(update_fields=['status', 'updated_at'])
+        return True
+
+    @queued_write
+    def add_items(self, lines):
+        """Add ``[(product, quantity), ...]`` to the order in one transaction.
+
+        Stock for every product is taken with a single UPDATE and the items
+        are bulk inserted, so the query count doesn't grow with the basket.
+        Raises InsufficientStock without writing anything if a line can't be
+        filled. Returns the created items.
+        """
+        items = [
+            OrderItem(order=self, product=product, quantity=quantity,
+                      price=product.price, total=product.price * quantity)
+            for product, quantity in lines
+        ]
+        quantities = {}
+        sales = {}
+        for item in items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            units, revenue = sales.get(item.product_id, (0, 0))
+            sales[item.product_id] = (units + item.quantity, revenue + item.total)
+        with transaction.atomic():
+            Product.take_stock(quantities, reference=self.order_number)
+            OrderItem.objects.bulk_create(items)
+            if self.status != 'cancelled':
+                Product.record_sales(sales_day(self.created_at), sales)
+            Order.add_to_total(
+                self.pk,
+                sum(item.total for item in items),
+                order=self,
+                quantity=sum(quantities.values()),
+            )
+        return items
+
+    @staticmethod
+    def add_to_total(order_id, delta, order=None, quantity=0):
+        """Add ``delta`` to an order's total_amount with an UPDATE instead of re-summing its items."""
+        if not (delta or quantity):
+            return
+        updated_at = timezone.now()
+        Order.objects.filter(pk=order_id).update(total_amount=F('total_amount') + delta, updated_at=updated_at)
+        if order is not None:
+            order.total_amount += delta
+            order.updated_at = updated_at
+        order_total_changed.send(sender=Order, order_id=order_id, order=order, delta=delta, quantity=quantity)
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -41,14 +160,59 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+    @queued_write
     def save(self, *args, **kwargs):
         self.total = self.quantity * self.price
-        super().save(*args, **kwargs)
-        
-        # Update product stock
-        self.product.stock -= self.quantity
-        self.product.save()
-        
-        # Update order total
-        self.order.total_amount = sum(item.total for item in self.order.items.all())
-        self.order.save()
\ No newline at end of file
+        with transaction.atomic():
+            if self._state.adding:
+                old_product_id, old_quantity, old_total = None, 0, 0
+            else:
+                old_product_id, old_quantity, old_total = OrderItem.objects.values_list(
+                    'product_id', 'quantity', 'total'
+                ).get(pk=self.pk)
+            super().save(*args, **kwargs)
+
+            # Update product stock
+            if old_product_id == self.product_id:
+                self._adjust_stock(self.product_id, old_quantity - self.quantity)
+            else:
+                if old_product_id is not None:
+                    Product.adjust_stock(old_product_id, old_quantity, reason=StockMovement.RESTOCK,
+                                         reference=self.order.order_number)
+                self._adjust_stock(self.product_id, -self.quantity)
+
+            # Update product sales counters
+            sales = {self.product_id: (self.quantity, self.total)}
+            if old_product_id is not None:
+                units, revenue = sales.get(old_product_id, (0, 0))
+                sales[old_product_id] = (units - old_quantity, revenue - old_total)
+            self._record_sales(sales)
+
+            # Update order total
+            Order.add_to_total(self.order_id, self.total - old_total, self._cached_order())
+
+    @queued_write
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self._adjust_stock(self.product_id, self.quantity)
+            self._record_sales({self.product_id: (-self.quantity, -self.total)})
+            Order.add_to_total(self.order_id, -self.total, self._cached_order())
+        return result
+
+    def _cached_order(self):
+        return self._state.fields_cache.get('order')
+
+    def _record_sales(self, sales):
+        # Cancelled orders were already taken out of the counters by cancel()
+        if self.order.status != 'cancelled':
+            Product.record_sales(sales_day(self.order.created_at), sales)
+
+    def _adjust_stock(self, product_id, delta):
+        if not delta:
+            return
+        reason = StockMovement.SALE if delta < 0 else StockMovement.RESTOCK
+        Product.adjust_stock(product_id, delta, reason=reason, reference=self.order.order_number)
+        product = self._state.fields_cache.get('product')
+        if product is not None and product.pk == product_id:
+            product.stock += delta
@@ -0,0 +1,70 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Return ``(created_at, pk)`` from a cursor, or None if it is malformed."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of a queryset walked newest-first on ``(created_at, id)``.
+
+    Unlike offset pagination the cost of a page doesn't depend on how deep
+    it is: each page is an index range scan starting at the cursor.
+    """
+
+    def __init__(self, queryset, per_page, after=None, before=None):
+        after, before = decode_cursor(after), decode_cursor(before)
+        if before:
+            created_at, pk = before
+            rows = list(
+                queryset
+                .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+                .order_by('created_at', 'id')[:per_page + 1]
+            )
+            if len(rows) > per_page:
+                self.has_previous = self.has_next = True
+                self.object_list = rows[:per_page][::-1]
+                return
+            # Walking back onto the newest page: serve a normal, full first page
+            after = None
+
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        self.has_next = len(rows) > per_page
+        self.has_previous = after is not None and bool(rows)
+        self.object_list = rows[:per_page]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        last = self.object_list[-1]
+        return encode_cursor(last.created_at, last.pk)
+
+    @property
+    def previous_cursor(self):
+        first = self.object_list[0]
+        return encode_cursor(first.created_at, first.pk)
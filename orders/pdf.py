@@ -0,0 +1,161 @@
+"""Invoice PDF engines run inside the invoice process pool.
+
+Kept free of Django imports so spawned workers can load it without setting
+Django up. ``html_to_pdf`` converts the rendered invoice template with
+xhtml2pdf; ``invoice_to_pdf`` draws the same invoice straight onto a
+reportlab canvas from plain data and skips HTML/CSS layout entirely.
+"""
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from xhtml2pdf import pisa
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 18 * mm
+ROW_HEIGHT = 18
+# Left edge of each table column: #, Description, Quantity, Unit Price, Total
+COLUMNS = (MARGIN, MARGIN + 28, MARGIN + 290, MARGIN + 360, MARGIN + 450)
+TABLE_RIGHT = PAGE_WIDTH - MARGIN
+TABLE_HEADERS = ('#', 'Description', 'Quantity', 'Unit Price', 'Total')
+# Cell text starts this far in from its column's left edge
+CELL_PADDING = 4
+# Part of the invoice fingerprint: bump when the drawing changes so cached PDFs are redrawn
+LAYOUT_VERSION = 2
+
+
+def html_to_pdf(html):
+    """Return ``(pdf_bytes, error_count)`` for an HTML document."""
+    buffer = BytesIO()
+    status = pisa.CreatePDF(html, dest=buffer)
+    return buffer.getvalue(), status.err
+
+
+@lru_cache(maxsize=None)
+def _fonts(regular=None, bold=None):
+    """Register the invoice fonts once per process; returns ``(regular, bold, currency)``.
+
+    The built-in Helvetica has no rupee glyph, so without a TrueType font
+    amounts are prefixed with "Rs." instead.
+    """
+    if not regular:
+        return 'Helvetica', 'Helvetica-Bold', 'Rs. '
+    pdfmetrics.registerFont(TTFont('Invoice', regular))
+    pdfmetrics.registerFont(TTFont('Invoice-Bold', bold or regular))
+    return 'Invoice', 'Invoice-Bold', '₹'
+
+
+@lru_cache(maxsize=8)
+def _store_header(store, fonts):
+    """Lay the store header and footer out once per process.
+
+    Returns ``(lines, footer)`` where ``lines`` is a list of
+    ``(font, size, x, text)`` drawn top-down from the top margin.
+    """
+    regular, bold, _ = fonts
+    store = dict(store)
+    lines = []
+    for font, size, text in (
+        (bold, 18, store['name']),
+        (regular, 10, store['address']),
+        (regular, 10, f"Phone: {store['phone']} | Email: {store['email']}"),
+    ):
+        lines.append((font, size, (PAGE_WIDTH - pdfmetrics.stringWidth(text, font, size)) / 2, text))
+    footer = f"{store['name']} | {store['address']} | {store['phone']}"
+    return lines, footer
+
+
+def _table_header(c, y, fonts):
+    regular, bold, _ = fonts
+    c.setFillColorRGB(0.95, 0.95, 0.95)
+    c.rect(MARGIN, y - 5, TABLE_RIGHT - MARGIN, ROW_HEIGHT, stroke=0, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont(bold, 10)
+    for x, label in zip(COLUMNS, TABLE_HEADERS):
+        c.drawString(x + CELL_PADDING, y, label)
+    return y - ROW_HEIGHT
+
+
+def _clip(text, font, size, width):
+    """``text``, shortened with an ellipsis if needed to fit in ``width`` points."""
+    if pdfmetrics.stringWidth(text, font, size) <= width:
+        return text
+    while text and pdfmetrics.stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text.rstrip() + '...'
+
+
+def _footer(c, footer, fonts):
+    c.setFont(fonts[0], 8)
+    c.drawCentredString(PAGE_WIDTH / 2, MARGIN - 8, 'Thank you for your business!')
+    c.drawCentredString(PAGE_WIDTH / 2, MARGIN - 18, footer)
+
+
+def invoice_to_pdf(invoice, store, font=None, bold_font=None):
+    """Return ``(pdf_bytes, 0)`` for an invoice drawn directly with reportlab.
+
+    ``invoice`` is the plain dict built by ``orders.invoices.invoice_data``;
+    ``store`` is a tuple of ``(key, value)`` pairs so the laid-out header can
+    be cached per process. The return value matches ``html_to_pdf``.
+    """
+    fonts = _fonts(font, bold_font)
+    regular, bold, currency = fonts
+    header, footer = _store_header(store, fonts)
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    c.setTitle(f"Invoice #{invoice['number']}")
+
+    y = PAGE_HEIGHT - MARGIN
+    for font_name, size, x, text in header:
+        y -= size + 4
+        c.setFont(font_name, size)
+        c.drawString(x, y, text)
+
+    y -= 36
+    c.setFont(bold, 14)
+    c.drawString(MARGIN, y, 'INVOICE')
+    c.setFont(regular, 10)
+    y -= 18
+    c.drawString(MARGIN, y, f"Invoice #: {invoice['number']}")
+    y -= 14
+    c.drawString(MARGIN, y, f"Date: {invoice['date']}")
+
+    y -= 28
+    c.setFont(bold, 12)
+    c.drawString(MARGIN, y, 'Bill To:')
+    c.setFont(regular, 10)
+    for line in invoice['customer']:
+        y -= 14
+        c.drawString(MARGIN, y, line)
+
+    y = _table_header(c, y - 30, fonts)
+    c.setFont(regular, 10)
+    name_width = COLUMNS[2] - COLUMNS[1] - 2 * CELL_PADDING
+    for n, (name, quantity, price, total) in enumerate(invoice['items'], 1):
+        if y < MARGIN + ROW_HEIGHT * 4:
+            _footer(c, footer, fonts)
+            c.showPage()
+            y = _table_header(c, PAGE_HEIGHT - MARGIN - ROW_HEIGHT, fonts)
+            c.setFont(regular, 10)
+        c.drawString(COLUMNS[0] + CELL_PADDING, y, str(n))
+        c.drawString(COLUMNS[1] + CELL_PADDING, y, _clip(name, regular, 10, name_width))
+        c.drawString(COLUMNS[2] + CELL_PADDING, y, str(quantity))
+        c.drawString(COLUMNS[3] + CELL_PADDING, y, currency + price)
+        c.drawString(COLUMNS[4] + CELL_PADDING, y, currency + total)
+        c.line(MARGIN, y - 5, TABLE_RIGHT, y - 5)
+        y -= ROW_HEIGHT
+
+    c.setFont(bold, 10)
+    for label, amount in (('Subtotal:', invoice['total']), ('Tax:', '0.00'), ('Total:', invoice['total'])):
+        c.drawRightString(COLUMNS[4] - 8, y, label)
+        c.drawString(COLUMNS[4] + CELL_PADDING, y, currency + amount)
+        y -= ROW_HEIGHT
+
+    _footer(c, footer, fonts)
+    c.save()
+    return buffer.getvalue(), 0
@@ -0,0 +1,48 @@
+from rest_framework import serializers
+
+from grocery_management.api import SparseFieldsSerializer
+from .models import Order, OrderItem
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    """An item as listed inside its order."""
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'quantity', 'price', 'total']
+        read_only_fields = fields
+
+
+class OrderItemSerializer(SparseFieldsSerializer):
+    # Lines are always sold at the product's current price
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'order', 'product', 'quantity', 'price', 'total']
+        read_only_fields = ['price', 'total']
+
+    def validate(self, attrs):
+        if self.instance is not None and attrs.get('order', self.instance.order) != self.instance.order:
+            raise serializers.ValidationError({'order': 'Items cannot be moved to another order.'})
+        return attrs
+
+    def create(self, validated_data):
+        validated_data['price'] = validated_data['product'].price
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'product' in validated_data:
+            validated_data['price'] = validated_data['product'].price
+        return super().update(instance, validated_data)
+
+
+class OrderSerializer(SparseFieldsSerializer):
+    items = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'order_number', 'customer_name', 'customer_phone', 'customer_email',
+                  'customer_address', 'notes', 'status', 'total_amount', 'created_by',
+                  'created_at', 'updated_at', 'items']
+        # Status only changes through the cancel/complete actions
+        read_only_fields = ['order_number', 'status', 'total_amount', 'created_by',
+                            'created_at', 'updated_at']
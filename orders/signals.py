@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after Order.total_amount is changed in place with an UPDATE rather than
+# Order.save(). Arguments: order_id, order (the cached instance or None), delta,
+# and quantity when items were added without OrderItem.save() (bulk_create).
+order_total_changed = Signal()
@@ -0,0 +1,161 @@
+"""Deterministic synthetic catalogue and order history for benchmarks.
+
+The same seed and end date always produce the same rows. Sales are
+skewed, with Zipf-like product popularity and a few regular customers. They
+are also seasonal: a December peak, busier weekends, lunch and evening rush
+hours, and steady growth over the period. Rows are written the way
+orders/ingest.py loads history. Products, categories and their opening
+stock movements are bulk inserted. Orders and items go through
+_write_chunk, so live stock isn't touched and the sales aggregates have to
+be rebuilt afterwards.
+"""
+import itertools
+import math
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from products.models import Category, Product, StockMovement
+from .ingest import INGEST_CHUNK_SIZE, IngestResult, _write_chunk
+from .models import Order, start_of_day
+
+# name -> (products, orders, mean lines per order)
+SCALES = {
+    'tiny': (200, 2_000, 5),
+    'small': (2_000, 20_000, 8),
+    'medium': (20_000, 200_000, 10),
+    'large': (100_000, 1_000_000, 10),
+}
+
+CATEGORIES = (
+    'Fruit', 'Vegetables', 'Dairy', 'Bakery', 'Meat', 'Fish', 'Frozen', 'Rice & Grains',
+    'Pulses', 'Spices', 'Oils', 'Snacks', 'Beverages', 'Tea & Coffee', 'Breakfast',
+    'Sweets', 'Household', 'Personal Care', 'Baby Care', 'Pet Food',
+)
+ADJECTIVES = ('Fresh', 'Organic', 'Classic', 'Premium', 'Daily', 'Farm', 'Golden', 'Family',
+              'Natural', 'Select', 'Royal', 'Village')
+NOUNS = ('Mix', 'Pack', 'Blend', 'Choice', 'Harvest', 'Special', 'Basket', 'Value', 'Pure', 'Treat')
+SIZES = ('100g', '200g', '250g', '500g', '1kg', '2kg', '5kg', '250ml', '500ml', '1L', '6 pack', '12 pack')
+FIRST_NAMES = ('Aarav', 'Asha', 'Dev', 'Farah', 'Isha', 'Kabir', 'Lata', 'Meera', 'Nikhil', 'Priya',
+               'Ravi', 'Sana', 'Tara', 'Vikram', 'Zoya', 'Arjun', 'Neha', 'Rohan', 'Anita', 'Imran')
+LAST_NAMES = ('Sharma', 'Patel', 'Khan', 'Iyer', 'Reddy', 'Singh', 'Das', 'Nair', 'Joshi', 'Mehta',
+              'Gupta', 'Rao', 'Fernandes', 'Bose', 'Kulkarni')
+# Relative order volume by hour of day, shop open 08:00-21:59
+HOUR_WEIGHTS = {8: 3, 9: 5, 10: 8, 11: 10, 12: 9, 13: 7, 14: 5, 15: 5, 16: 6, 17: 9, 18: 11, 19: 10, 20: 7, 21: 4}
+WEEKDAY_WEIGHTS = (1.0, 0.95, 0.95, 1.0, 1.1, 1.35, 1.25)
+
+
+def synthetic_products(rng, count):
+    """Yield unsaved Products; their categories are set by name in ``category_name``."""
+    for n in range(1, count + 1):
+        price = Decimal(str(max(1.0, round(rng.lognormvariate(4.2, 0.9), 2)))).quantize(Decimal('0.01'))
+        stock = 0 if rng.random() < 0.04 else rng.randint(1, 250)
+        product = Product(
+            barcode=f'2{n:011d}',
+            name=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {n} {rng.choice(SIZES)}',
+            price=price, stock=stock, min_stock_level=rng.choice((5, 5, 10, 10, 20)),
+        )
+        product.category_name = rng.choice(CATEGORIES)
+        yield product
+
+
+def daily_order_counts(total, start, days):
+    """Split ``total`` orders over ``days`` days from ``start`` with season, weekday and growth weights."""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        # Peak around Christmas and New Year, trough in early summer
+        season = 1 + 0.25 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 358) / 365)
+        growth = 1 + 0.5 * offset / max(days - 1, 1)
+        weights.append(season * growth * WEEKDAY_WEIGHTS[day.weekday()])
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Hand out what truncation left over to the largest remainders
+    by_remainder = sorted(range(days), key=lambda i: weights[i] * scale - counts[i], reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def synthetic_orders(rng, products, total, mean_lines, end, days):
+    """Yield ``(unsaved Order, [(product_id, quantity, price, total), ...])`` in creation order.
+
+    ``products`` is ``[(product_id, price), ...]``. Popularity follows list
+    order, so callers shuffle it first.
+    """
+    cumulative = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(products))))
+    customers = [
+        (f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', f'9{rng.randrange(10 ** 9):09d}')
+        for _ in range(max(total // 8, 1))
+    ]
+    hours = list(HOUR_WEIGHTS)
+    hour_weights = list(itertools.accumulate(HOUR_WEIGHTS.values()))
+    start = end - timedelta(days=days - 1)
+    number = 0
+    for offset, count in enumerate(daily_order_counts(total, start, days)):
+        day = start + timedelta(days=offset)
+        opening = start_of_day(day)
+        recent = (end - day).days < 2
+        seconds = sorted(
+            hour * 3600 + rng.randrange(3600)
+            for hour in rng.choices(hours, cum_weights=hour_weights, k=count)
+        )
+        for second in seconds:
+            number += 1
+            # A third of orders come from regulars, who are a small pool
+            if rng.random() < 0.35:
+                name, phone = customers[rng.randrange(min(len(customers), 50))]
+            else:
+                name, phone = rng.choice(customers)
+            roll = rng.random()
+            status = 'pending' if recent and roll < 0.3 else 'cancelled' if roll > 0.95 else 'completed'
+            lines = min(1 + round(rng.expovariate(1 / max(mean_lines - 1, 0.01))), 60)
+            items = []
+            for product_id, price in rng.choices(products, cum_weights=cumulative, k=lines):
+                quantity = rng.choice((1, 1, 1, 1, 2, 2, 3, 4, 6))
+                items.append((product_id, quantity, price, price * quantity))
+            yield Order(
+                order_number=f'SYN{number:011d}',
+                customer_name=name, customer_phone=phone,
+                created_at=opening + timedelta(seconds=second), status=status,
+                total_amount=sum(line[3] for line in items),
+            ), items
+
+
+@transaction.atomic
+def create_catalogue(rng, count, batch_size=1000):
+    """Insert ``count`` products with opening IMPORT movements; returns ``[(product_id, price), ...]``."""
+    categories = {
+        category.name: category
+        for category in Category.objects.bulk_create([Category(name=name) for name in CATEGORIES])
+    }
+    created = []
+    products = synthetic_products(rng, count)
+    while batch := list(itertools.islice(products, batch_size)):
+        for product in batch:
+            product.category = categories[product.category_name]
+        created.extend(Product.objects.bulk_create(batch))
+    StockMovement.objects.bulk_create(
+        [StockMovement(product_id=p.pk, delta=p.stock, reason=StockMovement.IMPORT, reference='synthetic')
+         for p in created if p.stock],
+        batch_size=batch_size,
+    )
+    return [(product.pk, product.price) for product in created]
+
+
+def generate(products, orders, mean_lines, end, days, seed=0, chunk_size=INGEST_CHUNK_SIZE):
+    """Fill an empty database; returns the IngestResult of the order history."""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    catalogue = create_catalogue(rng, products)
+    rng.shuffle(catalogue)
+    result = IngestResult()
+    history = synthetic_orders(rng, catalogue, orders, mean_lines, end, days)
+    while chunk := list(itertools.islice(history, chunk_size)):
+        # No source lines: order numbers are generated, so never repeated
+        _write_chunk([(None, order, items) for order, items in chunk], result)
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -1,3 +1,592 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from reportlab.pdfbase import pdfmetrics
+
+from grocery_management import metrics, writer
+from products.models import Product, InsufficientStock
+from reports.models import DailySales
+from users.models import User
+from . import invoices, pdf
+from .models import Order, OrderItem
+
+
+class OrderItemWritePathTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(barcode='1001', name='Milk', price=Decimal('2.50'), stock=10)
+        self.order = Order.objects.create(customer_name='Asha', customer_phone='555')
+
+    def add(self, quantity):
+        item = OrderItem(order=self.order, product=self.product, quantity=quantity, price=self.product.price)
+        item.save()
+        return item
+
+    def test_save_applies_deltas(self):
+        self.add(2)
+        item = self.add(3)
+        item.quantity = 1
+        item.save()
+
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('7.50'))
+        self.assertEqual(self.product.stock, 7)
+
+    def test_save_refuses_to_oversell(self):
+        self.add(8)
+        with self.assertRaises(InsufficientStock):
+            self.add(3)
+
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(self.order.total_amount, Decimal('20.00'))
+        self.assertEqual(self.order.items.count(), 1)
+
+    def test_delete_and_cancel_restore_stock(self):
+        first = self.add(2)
+        self.add(3)
+        first.delete()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('7.50'))
+        self.assertTrue(self.order.cancel())
+        self.assertFalse(self.order.cancel())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'cancelled')
+
+    def sales(self, product):
+        product.refresh_from_db()
+        daily = product.daily_sales.aggregate(units=Sum('units_sold'), revenue=Sum('revenue'))
+        self.assertEqual((daily['units'] or 0, daily['revenue'] or 0), (product.units_sold, product.revenue))
+        return product.units_sold, product.revenue
+
+    def test_sales_counters_follow_item_writes(self):
+        other = Product.objects.create(barcode='1002', name='Curd', price=Decimal('1.00'), stock=10)
+        first = self.add(2)
+        self.add(3)
+        first.product = other
+        first.price = other.price
+        first.save()
+        self.assertEqual(self.sales(self.product), (3, Decimal('7.50')))
+        self.assertEqual(self.sales(other), (2, Decimal('2.00')))
+
+        self.order.add_items([(other, 4)])
+        first.delete()
+        self.assertEqual(self.sales(other), (4, Decimal('4.00')))
+
+        call_command('rebuild_product_sales', stdout=io.StringIO())
+        self.assertEqual(self.sales(other), (4, Decimal('4.00')))
+
+        self.order.cancel()
+        self.assertEqual(self.sales(self.product), (0, 0))
+        self.assertEqual(self.sales(other), (0, 0))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    workers = 8
+    sales_per_worker = 5
+    # Each attempt already waits out SQLite's busy timeout before failing
+    attempts_per_sale = 20
+
+    def test_parallel_checkouts_keep_stock_consistent(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a file-backed test database shared between threads')
+        initial_stock = 30
+        product = Product.objects.create(barcode='2001', name='Bread', price=Decimal('1.00'), stock=initial_stock)
+        orders = [
+            Order.objects.create(customer_name=f'Till {n}', customer_phone='1')
+            for n in range(self.workers)
+        ]
+        sold = []
+        refused = []
+        failed = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.workers, timeout=30)
+
+        def checkout(order):
+            try:
+                start.wait()
+                for _ in range(self.sales_per_worker):
+                    for _ in range(self.attempts_per_sale):
+                        try:
+                            OrderItem(order=order, product_id=product.pk, quantity=1, price=product.price).save()
+                        except InsufficientStock:
+                            with lock:
+                                refused.append(order.pk)
+                        except OperationalError as e:
+                            # SQLite reports a busy writer; retry like a till would
+                            error = e
+                            continue
+                        else:
+                            with lock:
+                                sold.append(order.pk)
+                        break
+                    else:
+                        with lock:
+                            failed.append(error)
+                        return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failed:
+            self.fail(f'{len(failed)} sales failed {self.attempts_per_sale} times in a row, last with: {failed[-1]!r}')
+
+        product.refresh_from_db()
+        attempts = self.workers * self.sales_per_worker
+        self.assertEqual(len(sold) + len(refused), attempts)
+        self.assertEqual(len(sold), min(attempts, initial_stock))
+        self.assertEqual(product.stock, initial_stock - len(sold))
+        self.assertEqual(product.units_sold, len(sold))
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), len(sold))
+
+
+@override_settings(WRITE_QUEUE=True)
+class QueuedCheckoutTests(ConcurrentCheckoutTests):
+    """The same race with every write going through the group-commit writer."""
+
+    def tearDown(self):
+        # Its connection has to be closed before the test database is flushed
+        writer.shutdown()
+        super().tearDown()
+
+    def test_parallel_checkouts_keep_stock_consistent(self):
+        super().test_parallel_checkouts_keep_stock_consistent()
+        calls, batches = writer.stats()['default']
+        # The orders, then every sale or refusal
+        self.assertEqual(calls, self.workers + self.workers * self.sales_per_worker)
+        self.assertLessEqual(batches, calls)
+
+    @override_settings(WRITE_QUEUE_WINDOW=1)
+    def test_a_failing_call_only_undoes_its_own_savepoint(self):
+        product = Product.objects.create(barcode='2002', name='Milk', price=Decimal('0.90'), stock=3)
+        orders = [Order.objects.create(customer_name=f'Till {n}', customer_phone='1') for n in range(3)]
+        lines = [OrderItem(order=order, product_id=product.pk, quantity=quantity, price=product.price)
+                 for order, quantity in zip(orders, (1, 5, 2))]
+        calls, batches = writer.stats()['default']
+        # Queued together, so the window puts them in one batch
+        futures = [writer.writer().submit(line.save, (), {}) for line in lines]
+        futures[0].result()
+        with self.assertRaises(InsufficientStock):
+            futures[1].result()
+        futures[2].result()
+
+        self.assertEqual(writer.stats()['default'], (calls + 3, batches + 1))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(list(OrderItem.objects.order_by('pk').values_list('order_id', 'quantity')),
+                         [(orders[0].pk, 1), (orders[2].pk, 2)])
+        self.assertEqual([Order.objects.get(pk=order.pk).total_amount for order in orders],
+                         [Decimal('0.90'), Decimal('0.00'), Decimal('1.80')])
+
+    def test_writes_inside_a_transaction_run_inline(self):
+        with transaction.atomic():
+            order = Order.objects.create(customer_name='Asha', customer_phone='1')
+            self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(writer.stats(), {})
+
+
+class CheckoutLoadTestTests(TransactionTestCase):
+    def test_tills_leave_stock_consistent(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a file-backed test database shared between threads')
+        for n in range(5):
+            Product.objects.create(barcode=f'300{n}', name=f'Jam {n}', price=Decimal('2.25'), stock=6)
+        out = io.StringIO()
+        with mock.patch('orders.views.prebuild_invoice'):
+            call_command('loadtest_checkout', '--workers', '3', '--checkouts', '6', '--lines', '3',
+                         '--flow', 'basket', '--strict', stdout=out)
+        report = out.getvalue()
+        self.assertIn('0 consistency violations', report)
+        completed = Order.objects.filter(status='completed').count()
+        self.assertEqual(Order.objects.count(), 6)
+        self.assertGreater(completed, 0)
+        # Orders left empty or not completed aren't checkouts
+        self.assertTrue(report.startswith(f'{completed} checkouts in'), report)
+        abandoned, empty = map(int, re.search(r'(\d+) abandoned, (\d+) left empty', report).groups())
+        self.assertEqual(abandoned + empty, 6 - completed)
+
+
+class OrderBasketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='till', password='secret')
+        self.client.force_login(self.user)
+        self.products = [
+            Product.objects.create(barcode=f'{n:012d}', name=f'Item {n}', price=Decimal('1.25'), stock=5)
+            for n in range(40)
+        ]
+
+    def post_basket(self, order, lines):
+        return self.client.post(
+            reverse('orders:order_add_basket', args=[order.pk]),
+            data=json.dumps({'items': lines}),
+            content_type='application/json',
+        )
+
+    def basket_queries(self, size):
+        order = Order.objects.create(customer_name='Ravi', customer_phone='1')
+        lines = [{'barcode': p.barcode, 'quantity': 1} for p in self.products[:size]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_basket(order, lines)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_basket_is_priced_and_stock_taken(self):
+        order = Order.objects.create(customer_name='Ravi', customer_phone='1')
+        response = self.post_basket(order, [
+            {'barcode': self.products[0].barcode, 'quantity': 2},
+            {'product_id': self.products[1].pk, 'quantity': 1},
+            {'product_id': self.products[0].pk, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order']['total_amount'], '5.00')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 2)
+        self.assertEqual(order.items.count(), 2)
+
+    def test_query_count_does_not_grow_with_basket(self):
+        self.assertEqual(self.basket_queries(2), self.basket_queries(40))
+
+    def test_short_stock_rejects_whole_basket(self):
+        order = Order.objects.create(customer_name='Ravi', customer_phone='1')
+        response = self.post_basket(order, [
+            {'barcode': self.products[0].barcode, 'quantity': 1},
+            {'barcode': self.products[1].barcode, 'quantity': 6},
+        ])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(order.items.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 5)
+
+
+class OrderListPaginationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+        now = timezone.now()
+        # Three orders share a timestamp, so the id has to break the tie
+        stamps = [now, now, now] + [now - timedelta(minutes=n) for n in range(1, 5)]
+        self.orders = [
+            Order.objects.create(customer_name='Lata' if n % 2 else 'Ravi', customer_phone='4', created_at=stamp)
+            for n, stamp in enumerate(stamps)
+        ]
+        self.newest_first = sorted(self.orders, key=lambda order: (order.created_at, order.pk), reverse=True)
+        patcher = mock.patch('orders.views.ORDERS_PER_PAGE', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def page(self, **params):
+        response = self.client.get(reverse('orders:order_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, response.context['page_obj']
+
+    def test_links_walk_forward_and_back_over_ties(self):
+        pages = []
+        response, page = self.page()
+        while True:
+            self.assertEqual(page.has_previous, bool(pages))
+            pages.append([order.pk for order in page])
+            if not page.has_next:
+                break
+            self.assertContains(response, f'?after={page.next_cursor}')
+            response, page = self.page(after=page.next_cursor)
+        self.assertEqual(sum(pages, []), [order.pk for order in self.newest_first])
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+
+        for expected in reversed(pages[:-1]):
+            self.assertContains(response, f'?before={page.previous_cursor}')
+            response, page = self.page(before=page.previous_cursor)
+            self.assertEqual([order.pk for order in page], expected)
+        self.assertFalse(page.has_previous)
+
+    def test_malformed_cursors_serve_the_first_page(self):
+        first = [order.pk for order in self.newest_first[:3]]
+        for params in ({'after': 'not base64!'}, {'before': 'bm90LWEtY3Vyc29y'}, {'after': 'MjAyNnwx'}):
+            with self.subTest(**params):
+                _, page = self.page(**params)
+                self.assertEqual([order.pk for order in page], first)
+                self.assertFalse(page.has_previous)
+
+    def test_search_is_kept_while_paging(self):
+        matching = [order.pk for order in self.newest_first if order.customer_name == 'Ravi']
+        response, page = self.page(q='ravi')
+        self.assertContains(response, f'?after={page.next_cursor}&q=ravi')
+        seen = [order.pk for order in page]
+        _, page = self.page(q='ravi', after=page.next_cursor)
+        seen += [order.pk for order in page]
+        self.assertFalse(page.has_next)
+        self.assertEqual(seen, matching)
+
+
+class InvoiceCacheTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.enterContext(override_settings(INVOICE_CACHE_DIR=cache_dir))
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+        self.product = Product.objects.create(barcode='3001', name='Rice', price=Decimal('4.00'), stock=10)
+        self.order = Order.objects.create(customer_name='Meera', customer_phone='9')
+        OrderItem(order=self.order, product=self.product, quantity=2, price=self.product.price).save()
+
+    def download(self):
+        response = self.client.get(reverse('orders:generate_invoice_pdf', args=[self.order.pk]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def cached_files(self):
+        return sorted(os.listdir(invoices.cache_dir()))
+
+    def test_repeat_download_is_served_from_cache(self):
+        pdf = self.download()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        files = self.cached_files()
+        self.assertEqual(len(files), 1)
+
+        with mock.patch.object(invoices, 'render_pool') as pool:
+            self.assertEqual(self.download(), pdf)
+        pool.assert_not_called()
+
+    def test_changed_order_gets_fresh_invoice(self):
+        self.download()
+        before = self.cached_files()
+        OrderItem(order=self.order, product=self.product, quantity=1, price=self.product.price).save()
+        self.download()
+        after = self.cached_files()
+        self.assertEqual(len(after), 1)
+        self.assertNotEqual(before, after)
+
+    def test_batch_export_zips_cached_and_new_invoices(self):
+        self.download()
+        second = Order.objects.create(customer_name='Ravi', customer_phone='8')
+        OrderItem(order=second, product=self.product, quantity=1, price=self.product.price).save()
+        today = timezone.localdate().isoformat()
+
+        response = self.client.get(
+            reverse('orders:invoice_batch_export'),
+            {'start_date': today, 'end_date': today, 'job': 'nightly'},
+        )
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'Invoice_{o.order_number}.pdf' for o in (self.order, second)),
+        )
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+        self.assertEqual(len(self.cached_files()), 2)
+
+        progress = self.client.get(reverse('orders:invoice_batch_progress', args=['nightly'])).json()
+        self.assertEqual((progress['total'], progress['done'], progress['finished']), (2, 2, True))
+
+    def test_reportlab_engine(self):
+        self.download()
+        with override_settings(INVOICE_ENGINE='reportlab'):
+            pdf = self.download()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # Switching engines renders a new file in place of the old one
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_reportlab_clips_long_names_to_their_column(self):
+        name = 'Extra virgin cold pressed organic sunflower oil, family pack ' * 3
+        invoice = {'number': 'N1', 'date': 'May 1, 2024', 'customer': ['Asha'], 'total': '1.00',
+                   'items': [(name, 1, '1.00', '1.00'), ('Salt', 1, '0.80', '0.80')]}
+        with mock.patch.object(pdf.canvas.Canvas, 'drawString', autospec=True) as draw:
+            pdf.invoice_to_pdf(invoice, tuple(sorted(invoices.STORE.items())))
+        cells = [call.args[3] for call in draw.call_args_list if call.args[1] == pdf.COLUMNS[1] + pdf.CELL_PADDING]
+        self.assertEqual(cells[1:], [cells[1][:-3].rstrip() + '...', 'Salt'])
+        self.assertTrue(name.startswith(cells[1][:-3]))
+        width = pdfmetrics.stringWidth(cells[1], 'Helvetica', 10)
+        self.assertLessEqual(width, pdf.COLUMNS[2] - pdf.COLUMNS[1] - 2 * pdf.CELL_PADDING)
+
+
+class OrderIngestTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(barcode='6001', name='Dal', price=Decimal('3.00'), stock=5)
+
+    def ingest(self, path):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('ingest_orders', path, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def write(self, name, text):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_history_is_loaded_without_stock_side_effects(self):
+        path = self.write('history.csv', (
+            'order,created_at,customer_name,customer_phone,status,barcode,quantity,price\n'
+            'H1,2023-03-01T10:00:00,Asha,1,completed,6001,2,3.00\n'
+            'H1,2023-03-01T10:00:00,Asha,1,completed,6001,1,2.50\n'
+            'H2,2023-03-02T11:00:00,Ravi,2,completed,9999,1,1.00\n'
+        ))
+        out, err = self.ingest(path)
+        self.assertIn('line 4: Unknown product barcode', err)
+
+        order = Order.objects.get(order_number='H1')
+        self.assertEqual(order.total_amount, Decimal('8.50'))
+        self.assertEqual(order.items.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(self.product.units_sold, 3)
+        self.assertEqual(DailySales.objects.get(status='completed').revenue, Decimal('8.50'))
+
+        out, _ = self.ingest(path)
+        self.assertIn('1 already loaded', out)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_jsonl_orders_with_items(self):
+        path = self.write('history.jsonl', json.dumps({
+            'created_at': '2023-03-01T10:00:00', 'customer_name': 'Meera', 'customer_phone': '3',
+            'items': [{'barcode': '6001', 'quantity': 4, 'price': '3.00'}],
+        }) + '\n')
+        self.ingest(path)
+        order = Order.objects.get()
+        self.assertEqual((order.status, order.total_amount), ('completed', Decimal('12.00')))
+        self.assertEqual(len(order.order_number), 20)
+
+    def test_unrepresentable_prices_skip_the_order(self):
+        path = self.write('history.csv', (
+            'order,created_at,customer_name,customer_phone,status,barcode,quantity,price\n'
+            'N1,2023-03-01T10:00:00,Asha,1,completed,6001,1,NaN\n'
+            'N2,2023-03-01T10:00:00,Asha,1,completed,6001,1,-2.00\n'
+            'N3,2023-03-01T10:00:00,Asha,1,completed,6001,1,99999999999.00\n'
+            'N4,2023-03-01T10:00:00,Asha,1,completed,6001,2,60000000.00\n'
+            'N5,2023-03-01T10:00:00,Asha,1,completed,6001,1,3.00\n'
+        ))
+        _, err = self.ingest(path)
+        self.assertEqual(err.count('line '), 4)
+        self.assertEqual(list(Order.objects.values_list('order_number', flat=True)), ['N5'])
+
+    def test_repeated_order_numbers_in_one_chunk_are_errors(self):
+        path = self.write('history.csv', (
+            'order,created_at,customer_name,customer_phone,status,barcode,quantity,price\n'
+            'D1,2023-03-01T10:00:00,Asha,1,completed,6001,1,3.00\n'
+            'D2,2023-03-01T11:00:00,Ravi,2,completed,6001,1,3.00\n'
+            'D1,2023-03-01T12:00:00,Asha,1,completed,6001,2,3.00\n'
+        ))
+        out, err = self.ingest(path)
+        self.assertIn("line 4: Order number 'D1' appears more than once", err)
+        self.assertIn('2 orders with 2 lines', out)
+        self.assertEqual(Order.objects.get(order_number='D1').total_amount, Decimal('3.00'))
+
+
+class OrderApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+        self.product = Product.objects.create(barcode='9001', name='Oil', price=Decimal('5.00'), stock=4)
+
+    def post(self, name, data=None, **kwargs):
+        return self.client.post(reverse(name, **kwargs), data or {}, content_type='application/json')
+
+    def test_order_lifecycle(self):
+        order = self.post('api-order-list', {'customer_name': 'Lata', 'customer_phone': '4'}).json()
+        url = reverse('api-order-detail', args=[order['id']])
+        etag = self.client.get(url)['ETag']
+
+        item = self.post('api-orderitem-list', {'order': order['id'], 'product': self.product.pk, 'quantity': 3})
+        self.assertEqual(item.json()['price'], '5.00')
+        short = self.post('api-orderitem-list', {'order': order['id'], 'product': self.product.pk, 'quantity': 2})
+        self.assertEqual(short.status_code, 409)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_amount'], '15.00')
+        self.assertEqual([line['quantity'] for line in response.json()['items']], [3])
+
+        self.assertEqual(self.post('api-order-cancel', args=[order['id']]).json()['status'], 'cancelled')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+        item_url = reverse('api-orderitem-detail', args=[item.json()['id']])
+        self.assertEqual(self.client.delete(item_url).status_code, 409)
+
+    def test_list_queries_do_not_grow_with_orders(self):
+        def list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse('api-order-list')).status_code, 200)
+            return len(queries)
+
+        order = Order.objects.create(customer_name='Lata', customer_phone='4')
+        order.add_items([(self.product, 1)])
+        before = list_queries()
+        for _ in range(3):
+            Order.objects.create(customer_name='Lata', customer_phone='4').add_items([(self.product, 1)])
+        self.assertEqual(list_queries(), before)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.user = User.objects.create_user(username='manager', password='secret')
+        self.client.force_login(self.user)
+
+    def test_views_are_timed_and_exposed(self):
+        self.client.get(reverse('orders:order_list'))
+        self.client.get(reverse('orders:order_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="orders:order_list"} 2', text)
+        self.assertIn('http_request_queries_bucket{view="orders:order_list",le="+Inf"} 2', text)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+    def test_streamed_bodies_are_measured_once_sent(self):
+        for n in range(3):
+            Product.objects.create(barcode=f'96{n}', name='Jam', price=2, stock=1)
+        view = 'products:product_export'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(view))
+            self.assertNotIn(('http_request_duration_seconds', view), metrics.snapshot())
+            content = b''.join(response.streaming_content)
+
+        values = metrics.snapshot()
+        self.assertEqual(values[('http_request_duration_seconds', view)][2], 1)
+        # The export's own SELECT runs while the body streams, and is counted with the rest
+        self.assertEqual(values[('http_request_queries', view)][1], len(queries))
+        self.assertEqual(values[('http_response_size_bytes', view)][1], len(content))
+
+    def test_repeated_query_shapes_are_flagged(self):
+        products = [Product.objects.create(barcode=f'95{n}', name='Tea', price=1, stock=1) for n in range(3)]
+
+        def view(request):
+            for product in products:
+                list(Product.objects.filter(pk__in=[product.pk] * (product.pk % 3 + 1)))
+            return HttpResponse('ok')
+
+        middleware = metrics.RequestMetricsMiddleware(view)
+        with override_settings(METRICS_N_PLUS_ONE_THRESHOLD=3), self.assertLogs(metrics.logger, 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertIn('3 x SELECT', logs.output[0])
+        self.assertEqual(metrics.snapshot()[('http_request_n_plus_one_total', metrics.UNRESOLVED)], 1)
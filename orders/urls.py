@@ -9,9 +9,12 @@ urlpatterns = [
     path('create/', views.order_create, name='order_create'),
     path('<int:order_id>/', views.order_detail, name='order_detail'),
     path('<int:order_id>/add-items/', views.order_add_items, name='order_add_items'),
+    path('<int:order_id>/basket/', views.order_add_basket, name='order_add_basket'),
     path('<int:order_id>/complete/', views.order_complete, name='order_complete'),
     path('<int:order_id>/cancel/', views.order_cancel, name='order_cancel'),
     path('<int:order_id>/invoice/', views.generate_invoice_pdf, name='generate_invoice_pdf'),
+    path('invoices/export/', views.invoice_batch_export, name='invoice_batch_export'),
+    path('invoices/export/<str:job_id>/progress/', views.invoice_batch_progress, name='invoice_batch_progress'),
     
     # Order Item URLs
     path('<int:order_id>/items/<int:item_id>/delete/', views.order_item_delete, name='order_item_delete'),
@@ -1,18 +1,59 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from io import BytesIO
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+import json
+import uuid
+from datetime import datetime
+from django.db import transaction
 from .models import Order, OrderItem
-from products.models import Product
+from .invoices import (
+    InvoiceRenderError, batch_invoice_zip, batch_progress, get_invoice_pdf, invoice_queryset,
+    prebuild_invoice,
+)
+from .pagination import KeysetPage
+from products.models import Product, InsufficientStock
 from .forms import OrderForm, OrderItemForm
 
+ORDERS_PER_PAGE = 25
+
 @login_required
 def order_list(request):
-    orders = Order.objects.all().order_by('-created_at')
-    return render(request, 'orders/list.html', {'orders': orders})
+    # A correlated subquery is only evaluated for the rows on the page,
+    # where a JOIN + GROUP BY would aggregate the whole table first
+    item_count = (
+        OrderItem.objects
+        .filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    orders = Order.objects.annotate(item_count=Coalesce(Subquery(item_count), 0))
+    
+    query = request.GET.get('q', '').strip()
+    if query:
+        orders = orders.filter(
+            Q(order_number__icontains=query) |
+            Q(customer_name__icontains=query) |
+            Q(customer_phone__icontains=query)
+        )
+    
+    page = KeysetPage(
+        orders,
+        ORDERS_PER_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return render(request, 'orders/list.html', {
+        'orders': page,
+        'page_obj': page,
+        'is_paginated': page.has_next or page.has_previous,
+        'q': query,
+    })
 
 @login_required
 def order_add_items(request, order_id):
@@ -24,9 +65,13 @@ def order_add_items(request, order_id):
             order_item = form.save(commit=False)
             order_item.order = order
             order_item.price = order_item.product.price
-            order_item.save()
-            messages.success(request, 'Item added to order!')
-            return redirect('orders:order_add_items', order_id=order.id)
+            try:
+                order_item.save()
+            except InsufficientStock:
+                messages.error(request, f'Not enough {order_item.product.name} left in stock')
+            else:
+                messages.success(request, 'Item added to order!')
+                return redirect('orders:order_add_items', order_id=order.id)
     else:
         form = OrderItemForm()
     
@@ -40,32 +85,110 @@ def order_add_items(request, order_id):
         'products': products,
     })
 
+def _basket_error(message, status=400):
+    return JsonResponse({'success': False, 'message': message}, status=status)
+
+@login_required
+@require_POST
+def order_add_basket(request, order_id):
+    """Add a whole basket to an order in one request.
+
+    Expects a JSON body like ``{"items": [{"barcode": "...", "quantity": 2},
+    {"product_id": 7, "quantity": 1}]}`` and answers with the priced order.
+    """
+    order = get_object_or_404(Order, id=order_id)
+    if order.status != 'pending':
+        return _basket_error(f'Cannot add items to a {order.get_status_display().lower()} order', status=409)
+    
+    try:
+        lines = json.loads(request.body)['items']
+        keys = []
+        for line in lines:
+            quantity = int(line.get('quantity', 1))
+            if quantity < 1:
+                return _basket_error('Quantities must be at least 1')
+            if line.get('product_id') is not None:
+                keys.append(('id', int(line['product_id']), quantity))
+            elif line.get('barcode'):
+                keys.append(('barcode', str(line['barcode']), quantity))
+            else:
+                return _basket_error('Each line needs a barcode or product_id')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return _basket_error('Invalid basket')
+    if not keys:
+        return _basket_error('The basket is empty')
+    
+    # One query for every product in the basket
+    ids = {value for kind, value, _ in keys if kind == 'id'}
+    barcodes = {value for kind, value, _ in keys if kind == 'barcode'}
+    products = {}
+    for product in Product.objects.filter(Q(pk__in=ids) | Q(barcode__in=barcodes)):
+        products['id', product.pk] = product
+        products['barcode', product.barcode] = product
+    
+    quantities = {}
+    missing = []
+    for kind, value, quantity in keys:
+        product = products.get((kind, value))
+        if product is None:
+            missing.append(value)
+        else:
+            quantities[product] = quantities.get(product, 0) + quantity
+    if missing:
+        return _basket_error(f'Products not found: {", ".join(map(str, missing))}', status=404)
+    
+    short = [product.name for product, quantity in quantities.items() if quantity > product.stock]
+    if short:
+        return _basket_error(f'Not enough stock for: {", ".join(short)}', status=409)
+    
+    try:
+        items = order.add_items(quantities.items())
+    except InsufficientStock:
+        return _basket_error('Stock changed while checking out, please retry', status=409)
+    
+    return JsonResponse({
+        'success': True,
+        'order': {
+            'id': order.id,
+            'order_number': order.order_number,
+            'status': order.status,
+            'total_amount': str(order.total_amount),
+            'added': [
+                {
+                    'product_id': item.product_id,
+                    'name': item.product.name,
+                    'quantity': item.quantity,
+                    'price': str(item.price),
+                    'total': str(item.total),
+                }
+                for item in items
+            ],
+        }
+    })
+
 @login_required
 def order_complete(request, order_id):
     order = get_object_or_404(Order, id=order_id)
     if order.items.count() == 0:
         messages.error(request, 'Cannot complete an empty order!')
-        return redirect('order_add_items', order_id=order.id)
+        return redirect('orders:order_add_items', order_id=order.id)
     
     order.status = 'completed'
     order.save()
+    transaction.on_commit(lambda: prebuild_invoice(order.id))
     messages.success(request, 'Order marked as completed!')
-    return redirect('order_list')
+    return redirect('orders:order_list')
 
 @login_required
 def order_cancel(request, order_id):
     order = get_object_or_404(Order, id=order_id)
     if request.method == 'POST':
-        # Restore stock for each item
-        for item in order.items.all():
-            product = item.product
-            product.stock += item.quantity
-            product.save()
-        
-        order.status = 'cancelled'
-        order.save()
-        messages.success(request, 'Order cancelled and stock restored!')
-        return redirect('order_list')
+        # Restores stock for every item in the same transaction
+        if order.cancel():
+            messages.success(request, 'Order cancelled and stock restored!')
+        else:
+            messages.info(request, 'Order was already cancelled.')
+        return redirect('orders:order_list')
     return render(request, 'orders/confirm_cancel.html', {'order': order})
 
 @login_required
@@ -75,51 +198,60 @@ def order_detail(request, order_id):
 
 @login_required
 def generate_invoice_pdf(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    
-    # Add store information (you can move this to settings or database)
-    store = {
-        'name': 'Grocery Store',
-        'address': 'Pimpri, Pune, Maharashtra 411017',
-        'phone': '9699970785',
-        'email': 'omvirshette@gmail.com'
-    }
-    
-    template_path = 'orders/invoice_pdf.html'
-    context = {
-        'order': order,
-        'store': store
-    }
+    order = get_object_or_404(invoice_queryset(), id=order_id)
     
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Invoice_{order.order_number}.pdf"'
+    try:
+        path = get_invoice_pdf(order)
+    except InvoiceRenderError as e:
+        return HttpResponse('We had some errors <pre>' + e.html + '</pre>')
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=f'Invoice_{order.order_number}.pdf',
+        content_type='application/pdf',
+    )
+
+@login_required
+def invoice_batch_export(request):
+    """Stream a ZIP of the invoices for every order in a date range.
+
+    The client may pass its own ``job`` id to poll invoice_batch_progress
+    while the download runs; otherwise one is returned in ``X-Invoice-Job``.
+    """
+    try:
+        start = datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return HttpResponse('start_date and end_date are required (YYYY-MM-DD)', status=400)
     
-    template = get_template(template_path)
-    html = template.render(context)
+    orders = invoice_queryset().created_between(start, end).order_by('created_at', 'id')
+    status = request.GET.get('status')
+    if status:
+        orders = orders.filter(status=status)
     
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+    job_id = request.GET.get('job') or uuid.uuid4().hex
+    response = StreamingHttpResponse(batch_invoice_zip(orders, job_id), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="invoices_{start}_{end}.zip"'
+    response['X-Invoice-Job'] = job_id
     return response
 
+@login_required
+def invoice_batch_progress(request, job_id):
+    progress = batch_progress(job_id)
+    if progress is None:
+        return JsonResponse({'success': False, 'message': 'Unknown export job'}, status=404)
+    return JsonResponse({'success': True, **progress})
+
 @login_required
 def order_item_delete(request, order_id, item_id):
     order = get_object_or_404(Order, pk=order_id)
     item = get_object_or_404(OrderItem, pk=item_id, order=order)
     
     if request.method == 'POST':
-        # Restore product stock before deletion
-        product = item.product
-        product.stock += item.quantity
-        product.save()
-        
-        # Delete the item
+        # Restores product stock and adjusts the order total atomically
+        item.order = order
         item.delete()
         
-        # Update order total
-        order.total_amount = sum(item.total for item in order.items.all())
-        order.save()
-        
         messages.success(request, 'Order item removed successfully!')
         return redirect('orders:order_add_items', order_id=order.id)
     
@@ -0,0 +1,35 @@
+from rest_framework import viewsets
+from rest_framework.settings import api_settings
+
+from grocery_management.api import Conflict, ConditionalGetMixin, UpdatedCursorPagination, UpdatedSinceFilter
+from .models import Category, Product
+from .serializers import CategorySerializer, ProductSerializer
+
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = UpdatedCursorPagination
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, UpdatedSinceFilter]
+    filterset_fields = ['name']
+
+    def perform_destroy(self, instance):
+        if Product.objects.filter(category=instance).exists():
+            raise Conflict('Cannot delete category with associated products.')
+        instance.delete()
+
+
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    # The category is rendered as its id, so no join is needed
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    pagination_class = UpdatedCursorPagination
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, UpdatedSinceFilter]
+    filterset_fields = ['category', 'barcode']
+
+    def perform_create(self, serializer):
+        product = serializer.save()
+        # Same numbering as product_create for products without a usable barcode
+        if not product.barcode or not product.barcode.isdigit():
+            product.barcode = f"{product.id:012d}"
+            product.save()
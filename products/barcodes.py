@@ -0,0 +1,88 @@
+"""Barcode images rendered once per barcode value and kept on disk.
+
+Files are addressed by a hash of everything that goes into the rendering
+(symbology, value, writer options, library version), so a product whose
+barcode changes simply points at a different file and an unchanged barcode
+is never rendered twice.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import barcode
+from barcode.writer import ImageWriter
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+WRITER_OPTIONS = {'format': 'PNG'}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='barcode-images')
+
+
+def symbology(value):
+    # product_create hands out 12-digit codes; anything else can't be EAN-13
+    return 'ean13' if value.isdigit() and len(value) in (12, 13) else 'code128'
+
+
+def barcode_digest(value):
+    key = f'{symbology(value)}:{value}:{sorted(WRITER_OPTIONS.items())}:{barcode.version}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def image_dir():
+    return getattr(settings, 'BARCODE_IMAGE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'barcodes')
+
+
+def barcode_image_path(value, digest=None):
+    digest = digest or barcode_digest(value)
+    return os.path.join(image_dir(), digest[:2], f'{digest}.png')
+
+
+def ensure_barcode_image(value):
+    """Return the path of the PNG for ``value``, rendering it if needed."""
+    path = barcode_image_path(value)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    code = barcode.get(symbology(value), value, writer=ImageWriter())
+    # Render next to the target and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            code.write(tmp, options=WRITER_OPTIONS)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def _render_quietly(values):
+    for value in values:
+        try:
+            ensure_barcode_image(value)
+        except Exception:
+            logger.exception('Could not render barcode image for %r', value)
+
+
+def queue_barcode_images(values):
+    """Render any missing images for ``values`` on a background thread."""
+    missing = [v for v in values if v and not os.path.exists(barcode_image_path(v))]
+    if missing:
+        return _executor.submit(_render_quietly, missing)
+    return None
+
+
+@receiver(post_save, sender=Product)
+def render_new_barcode(sender, instance, raw=False, **kwargs):
+    if instance.barcode and not raw:
+        value = instance.barcode
+        transaction.on_commit(lambda: queue_barcode_images([value]))
@@ -0,0 +1,198 @@
+"""Barcode → product payload cache for the POS scanners.
+
+Lookups go through a small per-process LRU, then Django's shared cache, then
+the database. Product saves, deletes and stock updates invalidate both layers
+once the transaction commits, bumping generations that shared entries are
+checked against, so a slow lookup can't put back what was just invalidated. Other processes' LRUs can't be reached from
+here, so their entries also expire after BARCODE_LOOKUP_LOCAL_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Product
+from .signals import stock_changed
+
+LRU_SIZE = getattr(settings, 'BARCODE_LOOKUP_LRU_SIZE', 4096)
+LOCAL_TTL = getattr(settings, 'BARCODE_LOOKUP_LOCAL_TTL', 2.0)
+SHARED_TIMEOUT = getattr(settings, 'BARCODE_LOOKUP_TIMEOUT', 60 * 60)
+
+# Cached in place of a payload for barcodes that don't exist
+NOT_FOUND = {}
+
+stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+
+
+def _barcode_key(barcode):
+    return f'products:barcode:{barcode}'
+
+
+def _product_key(product_id):
+    return f'products:lookup:{product_id}'
+
+
+def _barcode_generation_key(barcode):
+    return f'products:barcode-gen:{barcode}'
+
+
+def _product_generation_key(product_id):
+    return f'products:lookup-gen:{product_id}'
+
+
+def _generation(key, known=None):
+    if known is not None:
+        return known
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock so a generation that was evicted can't come back
+        # at a value an older entry was tagged with
+        cache.add(key, time.time_ns() // 1000, None)
+        value = cache.get(key)
+    return value
+
+
+def _bump_generations(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            _generation(key)
+
+
+def product_payload(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'barcode': product.barcode,
+        'price': str(product.price),
+        'stock': product.stock,
+    }
+
+
+_local_epoch = 0
+
+
+def _remember(barcode, payload, epoch):
+    with _lock:
+        # Something was invalidated while this payload was being read
+        if epoch != _local_epoch:
+            return
+        _lru[barcode] = (time.monotonic() + LOCAL_TTL, payload)
+        _lru.move_to_end(barcode)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _count(name):
+    with _lock:
+        stats[name] += 1
+
+
+def lookup_stats():
+    with _lock:
+        return dict(stats)
+
+
+def lookup(barcode):
+    """Return ``(payload, source)`` for a barcode; payload is None if unknown.
+
+    ``source`` is 'local', 'shared' or 'db' depending on which layer answered.
+    Shared entries are tagged with the barcode's or product's generation as it
+    was before the database read, and invalidate() bumps it. A lookup that
+    read old rows and stores them after an invalidation leaves entries that
+    no reader accepts.
+    """
+    with _lock:
+        epoch = _local_epoch
+        entry = _lru.get(barcode)
+        if entry is not None and entry[0] > time.monotonic():
+            _lru.move_to_end(barcode)
+            stats['local_hits'] += 1
+            return entry[1] or None, 'local'
+
+    barcode_key, barcode_generation_key = _barcode_key(barcode), _barcode_generation_key(barcode)
+    found = cache.get_many([barcode_key, barcode_generation_key])
+    barcode_generation = found.get(barcode_generation_key)
+    mapping = found.get(barcode_key)
+    product_id = product_generation = payload = None
+    if mapping is not None and mapping[0] == barcode_generation:
+        product_id = mapping[1]
+        if product_id == 0:
+            payload = NOT_FOUND
+        else:
+            product_key, product_generation_key = _product_key(product_id), _product_generation_key(product_id)
+            found = cache.get_many([product_key, product_generation_key])
+            product_generation = found.get(product_generation_key)
+            entry = found.get(product_key)
+            # The barcode may have moved to another product since it was cached
+            if entry is not None and entry[0] == product_generation and entry[1]['barcode'] == barcode:
+                payload = entry[1]
+
+    if payload is not None:
+        _count('shared_hits')
+        _remember(barcode, payload, epoch)
+        return payload or None, 'shared'
+
+    _count('misses')
+    product = None
+    if product_id:
+        # Known product whose entry went stale, typically after a sale
+        product_generation = _generation(_product_generation_key(product_id), product_generation)
+        product = Product.objects.filter(pk=product_id, barcode=barcode).first()
+    if product is None:
+        barcode_generation = _generation(barcode_generation_key, barcode_generation)
+        product_id = Product.objects.filter(barcode=barcode).values_list('pk', flat=True).first() or 0
+        cache.set(barcode_key, (barcode_generation, product_id), SHARED_TIMEOUT)
+        if product_id:
+            product_generation = _generation(_product_generation_key(product_id))
+            product = Product.objects.filter(pk=product_id, barcode=barcode).first()
+    payload = product_payload(product) if product else NOT_FOUND
+    if product:
+        cache.set(_product_key(product.id), (product_generation, payload), SHARED_TIMEOUT)
+    _remember(barcode, payload, epoch)
+    return payload or None, 'db'
+
+
+def invalidate(product_ids=(), barcodes=()):
+    global _local_epoch
+    product_ids = set(product_ids)
+    barcodes = set(barcodes)
+    with _lock:
+        _local_epoch += 1
+        for barcode, (_, payload) in list(_lru.items()):
+            if barcode in barcodes or payload.get('id') in product_ids:
+                del _lru[barcode]
+    _bump_generations(
+        [_product_generation_key(pk) for pk in product_ids] + [_barcode_generation_key(code) for code in barcodes]
+    )
+    cache.delete_many(
+        [_product_key(pk) for pk in product_ids] + [_barcode_key(code) for code in barcodes]
+    )
+
+
+@receiver(post_init, sender=Product)
+def remember_barcode(sender, instance, **kwargs):
+    instance._lookup_barcode = instance.__dict__.get('barcode')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_saved_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    barcodes = {instance.barcode, instance._lookup_barcode} - {None, ''}
+    instance._lookup_barcode = instance.barcode
+    transaction.on_commit(lambda: invalidate([product_id], barcodes))
+
+
+@receiver(stock_changed)
+def invalidate_stock(sender, product_ids, **kwargs):
+    transaction.on_commit(lambda: invalidate(product_ids))
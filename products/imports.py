@@ -0,0 +1,228 @@
+"""Bulk product import from the CSV layout ``product_export`` writes.
+
+Rows are streamed and written in batches: one query looks up the barcodes
+that already exist and one INSERT ... ON CONFLICT upserts the batch by
+barcode. Rows without a barcode are inserted and then given the same
+zero-padded id barcode product_create hands out. A bad row is reported with its line
+number and skipped; it never aborts the rest of the import.
+"""
+import csv
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .barcodes import queue_barcode_images
+from .cache import invalidate
+from .models import Category, Product, StockMovement
+from .signals import stock_changed
+
+PRODUCT_CSV_HEADER = ['Barcode', 'Name', 'Category', 'Price', 'Stock', 'Min Stock', 'Status']
+REQUIRED_COLUMNS = {'Name', 'Price', 'Stock'}
+
+IMPORT_BATCH_SIZE = getattr(settings, 'PRODUCT_IMPORT_BATCH_SIZE', 1000)
+
+# Written on update; barcode is the lookup key and never changes here
+UPDATE_FIELDS = ['name', 'category', 'price', 'stock', 'min_stock_level', 'updated_at']
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'{self.rows} rows: {self.created} created, {self.updated} updated, '
+                f'{len(self.errors)} errors in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s)')
+
+
+def _parse_int(value, column):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{column} must be a whole number, got {value!r}')
+    if number < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return number
+
+
+def _parse_price(value):
+    field = Product._meta.get_field('price')
+    try:
+        price = Decimal((value or '').strip())
+    except InvalidOperation:
+        raise ValueError(f'Price must be a number, got {value!r}')
+    # NaN and Infinity parse, but would only fail later, inside the batch's INSERT
+    if not price.is_finite():
+        raise ValueError(f'Price must be a finite number, got {value!r}')
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    try:
+        price = price.quantize(Decimal(1).scaleb(-field.decimal_places))
+    except InvalidOperation:
+        # More digits than the decimal context holds: far over the limit
+        raise ValueError(f'Price must be less than {limit}')
+    if price < Decimal('0.01'):
+        raise ValueError('Price must be at least 0.01')
+    if price >= limit:
+        raise ValueError(f'Price must be less than {limit}')
+    return price
+
+
+def parse_row(row):
+    """Validate one CSV row and return the product fields it sets."""
+    barcode = (row.get('Barcode') or '').strip()
+    if barcode and not barcode.isdigit():
+        raise ValueError('Barcode must contain only numbers')
+    name = (row.get('Name') or '').strip()
+    if not name:
+        raise ValueError('Name is required')
+    if len(name) > 200:
+        raise ValueError('Name is longer than 200 characters')
+    fields = {
+        'barcode': barcode,
+        'name': name,
+        'price': _parse_price(row.get('Price')),
+        'stock': _parse_int(row.get('Stock'), 'Stock'),
+    }
+    if 'Category' in row:
+        fields['category'] = (row['Category'] or '').strip()
+    if (row.get('Min Stock') or '').strip():
+        fields['min_stock_level'] = _parse_int(row['Min Stock'], 'Min Stock')
+    return fields
+
+
+def _resolve_categories(rows, categories):
+    missing = {fields['category'] for _, fields in rows if fields.get('category')} - categories.keys()
+    if missing:
+        for category in Category.objects.bulk_create([Category(name=name) for name in sorted(missing)]):
+            categories[category.name] = category.pk
+
+
+def _upsert(rows, categories):
+    """Write parsed ``rows`` in one transaction; returns ``(created, updated)`` counts."""
+    with transaction.atomic():
+        # Read inside the transaction, locking the rows where the database can: the
+        # ledger records stock changes against these values
+        existing = {
+            barcode: (pk, category_id, min_stock_level, stock)
+            for barcode, pk, category_id, min_stock_level, stock in Product.objects.select_for_update()
+            .filter(barcode__in=[fields['barcode'] for _, fields in rows if fields['barcode']])
+            .values_list('barcode', 'pk', 'category_id', 'min_stock_level', 'stock')
+        }
+        products, unnumbered, updated_ids = [], [], []
+        for _, fields in rows:
+            fields = dict(fields)
+            current = existing.get(fields['barcode'])
+            if current is not None:
+                updated_ids.append(current[0])
+                # Columns missing from the file keep their current values
+                fields.setdefault('category_id', current[1])
+                fields.setdefault('min_stock_level', current[2])
+            if 'category' in fields:
+                fields['category_id'] = categories.get(fields.pop('category'))
+            product = Product(**fields)
+            if product.barcode:
+                products.append(product)
+            else:
+                # Unique placeholder until the row has an id to number it by
+                product.barcode = f'import-{uuid.uuid4().hex}'
+                unnumbered.append(product)
+
+        # INSERT ... ON CONFLICT (barcode) DO UPDATE: one statement for new and known barcodes
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=['barcode'], update_fields=UPDATE_FIELDS,
+        )
+        Product.objects.bulk_create(unnumbered)
+        for product in unnumbered:
+            product.barcode = f'{product.pk:012d}'
+        Product.objects.bulk_update(unnumbered, ['barcode'])
+        _record_movements(products + unnumbered, existing)
+        # bulk writes skip post_save: tell the lookup cache, dashboard and reports
+        stock_changed.send(sender=Product, product_ids=updated_ids + [product.pk for product in unnumbered])
+        barcodes = [product.barcode for product in products + unnumbered]
+        transaction.on_commit(lambda: (invalidate(barcodes=barcodes), queue_barcode_images(barcodes)))
+    return len(products) + len(unnumbered) - len(updated_ids), len(updated_ids)
+
+
+def _record_movements(products, existing):
+    # ON CONFLICT doesn't hand back ids, so look up the ones that were inserted
+    inserted = dict(
+        Product.objects.filter(barcode__in=[p.barcode for p in products if p.barcode not in existing])
+        .values_list('barcode', 'pk')
+    )
+    movements = []
+    for product in products:
+        if product.barcode in existing:
+            product_id, previous = existing[product.barcode][0], existing[product.barcode][3]
+        else:
+            product_id, previous = inserted.get(product.barcode, product.pk), 0
+        if product.stock != previous:
+            movements.append(StockMovement(product_id=product_id, delta=product.stock - previous,
+                                           reason=StockMovement.IMPORT))
+    StockMovement.objects.bulk_create(movements)
+
+
+def _write_batch(rows, categories, result):
+    # Within a batch a barcode's last row wins, as it would row by row
+    latest = {}
+    for line, fields in rows:
+        latest[fields['barcode'] or f'line:{line}'] = (line, fields)
+    rows = list(latest.values())
+    _resolve_categories(rows, categories)
+    try:
+        created, updated = _upsert(rows, categories)
+    except (DatabaseError, InvalidOperation):
+        # Find the offending rows one by one rather than losing the batch
+        created = updated = 0
+        for line, fields in rows:
+            try:
+                row_created, row_updated = _upsert([(line, fields)], categories)
+            except DatabaseError as e:
+                result.errors.append((line, str(e)))
+            except InvalidOperation:
+                # Decimal values are quantized to their columns as the INSERT is built
+                result.errors.append((line, 'Price does not fit the price column'))
+            else:
+                created += row_created
+                updated += row_updated
+    result.created += created
+    result.updated += updated
+
+
+def import_products(lines, batch_size=IMPORT_BATCH_SIZE):
+    """Import products from an iterable of CSV lines; returns an ImportResult.
+
+    Raises ValueError if the header lacks a required column.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    reader = csv.DictReader(lines)
+    missing = REQUIRED_COLUMNS - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+
+    categories = dict(Category.objects.values_list('name', 'pk'))
+    batch = []
+    for row in reader:
+        result.rows += 1
+        try:
+            batch.append((reader.line_num, parse_row(row)))
+        except ValueError as e:
+            result.errors.append((reader.line_num, str(e)))
+        if len(batch) >= batch_size:
+            _write_batch(batch, categories, result)
+            batch = []
+    if batch:
+        _write_batch(batch, categories, result)
+
+    result.elapsed = time.perf_counter() - started
+    return result
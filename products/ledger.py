@@ -0,0 +1,52 @@
+"""Point-in-time stock from the stock movement ledger.
+
+Stock at a moment is the most recent StockSnapshot taken at or before it
+plus the movements since, so an as-of query reads one row per product and
+only the movements after that snapshot, however long the history is.
+Products created without stock have no movement until their first stock
+change; they count as existing with none from their created_at on.
+"""
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import Product, StockMovement, StockSnapshot
+
+
+def stock_as_of(when):
+    """Return ``{product_id: stock}`` at ``when`` for products that existed then."""
+    taken_at = StockSnapshot.objects.filter(taken_at__lte=when).aggregate(at=Max('taken_at'))['at']
+    stock = {}
+    movements = StockMovement.objects.filter(created_at__lte=when)
+    if taken_at is not None:
+        stock = dict(StockSnapshot.objects.filter(taken_at=taken_at).values_list('product_id', 'stock'))
+        movements = movements.filter(created_at__gt=taken_at)
+    for product_id, delta in (movements.values('product_id').annotate(delta=Sum('delta'))
+                              .values_list('product_id', 'delta').order_by()):
+        stock[product_id] = stock.get(product_id, 0) + delta
+    for product_id in Product.objects.filter(created_at__lte=when).values_list('pk', flat=True):
+        stock.setdefault(product_id, 0)
+    return stock
+
+
+def compact(before, keep_movements=False):
+    """Snapshot every product's stock at ``before`` and drop the movements it covers.
+
+    Returns ``(snapshot_rows, movements_deleted)``. With ``keep_movements``
+    only the snapshot is taken, which still speeds up as-of queries.
+    """
+    if before > timezone.now():
+        # Movements that haven't happened yet would land behind the snapshot
+        raise ValueError(f'Cannot compact the ledger at {before}, which is in the future')
+    with transaction.atomic():
+        stock = stock_as_of(before)
+        StockSnapshot.objects.bulk_create(
+            [StockSnapshot(product_id=product_id, taken_at=before, stock=value)
+             for product_id, value in stock.items()],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        deleted = 0
+        if not keep_movements:
+            deleted, _ = StockMovement.objects.filter(created_at__lte=before).delete()
+    return len(stock), deleted
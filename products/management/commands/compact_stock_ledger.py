@@ -0,0 +1,34 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from products.ledger import compact
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = ('Snapshot every product\'s stock at the start of a day and fold the stock '
+            'movements before it into that snapshot.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=_parse_date,
+                            help='Day to snapshot at, today at the latest (YYYY-MM-DD, default: 90 days ago)')
+        parser.add_argument('--keep-movements', action='store_true',
+                            help='Only take the snapshot; keep the movements it covers')
+
+    def handle(self, *args, **options):
+        day = options['before'] or timezone.localdate() - timedelta(days=90)
+        if day > timezone.localdate():
+            raise CommandError(f'--before {day} is in the future; the snapshot would miss movements still to come')
+        before = timezone.make_aware(datetime.combine(day, time.min))
+        snapshots, deleted = compact(before, keep_movements=options['keep_movements'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshotted {snapshots} products at {day}; removed {deleted} stock movements.'
+        ))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.imports import IMPORT_BATCH_SIZE, import_products
+
+
+class Command(BaseCommand):
+    help = ('Import or update products from a CSV in the product_export layout '
+            '(Barcode, Name, Category, Price, Stock, Min Stock, Status).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import, or '-' for stdin")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Rows written per bulk query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            if path == '-':
+                result = import_products(sys.stdin, options['batch_size'])
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as f:
+                    result = import_products(f, options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {result}.'))
@@ -0,0 +1,24 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from products.barcodes import barcode_image_path, ensure_barcode_image
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Render barcode images for every product that does not have one on disk yet.'
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        barcodes = Product.objects.exclude(barcode='').values_list('barcode', flat=True)
+        for value in barcodes.iterator(chunk_size=2000):
+            if os.path.exists(barcode_image_path(value)):
+                continue
+            try:
+                ensure_barcode_image(value)
+                rendered += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{value}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} barcode images ({failed} failed).'))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock', 'min_stock_level'], name='product_stock_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lt', models.F('min_stock_level'))), fields=['stock'], name='product_low_stock_idx'),
+        ),
+    ]
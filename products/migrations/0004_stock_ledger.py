@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def snapshot_current_stock(apps, schema_editor):
+    # The ledger starts from the stock on hand when it is introduced
+    Product = apps.get_model('products', 'Product')
+    StockSnapshot = apps.get_model('products', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create(
+        [StockSnapshot(product_id=pk, taken_at=now, stock=stock)
+         for pk, stock in Product.objects.values_list('pk', 'stock').iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_sales_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stock', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('sale', 'Sale'), ('restock', 'Restock / cancellation'), ('adjustment', 'Manual adjustment'), ('import', 'Catalogue import')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('taken_at', 'product'), name='products_stocksnapshot_taken_product'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at', 'product', 'delta'], name='stock_movement_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+        ),
+        migrations.RunPython(snapshot_current_stock, migrations.RunPython.noop),
+    ]
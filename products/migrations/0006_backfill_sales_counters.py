@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_sales_counters(apps, schema_editor):
+    # The counters start at zero when they are introduced; count the existing
+    # history in, as the rebuild_product_sales command does
+    Product = apps.get_model('products', 'Product')
+    DailyProductSales = apps.get_model('products', 'DailyProductSales')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    items = OrderItem.objects.exclude(order__status='cancelled').order_by()
+    totals = {
+        row['product_id']: (row['units'], row['revenue'])
+        for row in items.values('product_id').annotate(units=Sum('quantity'), revenue=Sum('total'))
+    }
+    products = list(Product.objects.filter(pk__in=totals).only('pk'))
+    for product in products:
+        product.units_sold, product.revenue = totals[product.pk]
+    Product.objects.bulk_update(products, ['units_sold', 'revenue'], batch_size=500)
+
+    DailyProductSales.objects.all().delete()
+    if getattr(settings, 'PRODUCT_DAILY_SALES', True):
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(product_id=row['product_id'], date=row['day'],
+                               units_sold=row['units'], revenue=row['revenue'])
+             for row in items.annotate(day=TruncDate('order__created_at'))
+             .values('product_id', 'day')
+             .annotate(units=Sum('quantity'), revenue=Sum('total'))],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+        ('products', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sales_counters, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,23 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, When
 from django.core.validators import MinValueValidator
+from django.urls import reverse
 from django.utils import timezone
+from .signals import sales_recorded, stock_changed
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+class InsufficientStock(Exception):
+    """Raised when a sale would take a product's stock below zero."""
+
+
 class Product(models.Model):
     barcode = models.CharField(max_length=50, unique=True, blank=True)
     name = models.CharField(max_length=200)
@@ -20,12 +29,232 @@ class Product(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Lifetime sales over orders that aren't cancelled, kept by record_sales()
+    units_sold = models.IntegerField(default=0, editable=False)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
+    SALES_FIELDS = ('units_sold', 'revenue')
+
+    class Meta:
+        indexes = [
+            # Top/bottom-N rankings read these in index order
+            models.Index(fields=['units_sold'], name='product_units_sold_idx'),
+            models.Index(fields=['revenue'], name='product_revenue_idx'),
+            # API delta sync: ?updated_since= and cursor pages in update order
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # Out-of-stock filters and inventory ordering by stock; with
+            # min_stock_level it also covers the dashboard's catalogue counts
+            models.Index(fields=['stock', 'min_stock_level'], name='product_stock_level_idx'),
+            # Only the (few) low-stock rows, for low stock reports and counts
+            models.Index(
+                fields=['stock'],
+                condition=Q(stock__lt=F('min_stock_level')),
+                name='product_low_stock_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.barcode})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock')
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Never write back counters or stock read before a concurrent sale;
+            # stock is only written when it was edited
+            skipped = set(self.SALES_FIELDS)
+            if self.stock == getattr(self, '_loaded_stock', None):
+                skipped.add('stock')
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in skipped
+            ]
+        update_fields = kwargs.get('update_fields')
+        writes_stock = update_fields is None or 'stock' in update_fields
+
+        with transaction.atomic():
+            previous = 0 if adding else None
+            if writes_stock and not adding:
+                previous = (Product.objects.select_for_update().filter(pk=self.pk)
+                            .values_list('stock', flat=True).first())
+            super().save(*args, **kwargs)
+            if writes_stock and previous is not None and self.stock != previous:
+                StockMovement.objects.create(product=self, delta=self.stock - previous,
+                                             reason=StockMovement.ADJUSTMENT)
+        self._loaded_stock = self.stock
+
+    @property
+    def barcode_image_url(self):
+        return reverse('products:barcode_image', args=[self.barcode]) if self.barcode else ''
+
     def is_low_stock(self):
         return self.stock < self.min_stock_level
 
     def is_out_of_stock(self):
-        return self.stock <= 0
\ No newline at end of file
+        return self.stock <= 0
+
+    @classmethod
+    def adjust_stock(cls, product_id, delta, reason='adjustment', reference=''):
+        """Atomically add ``delta`` to a product's stock in a single UPDATE.
+
+        Negative deltas only apply while enough stock is left, otherwise
+        InsufficientStock is raised and nothing is written. The change is
+        recorded in the stock ledger in the same transaction.
+        """
+        products = cls.objects.filter(pk=product_id)
+        if delta < 0:
+            products = products.filter(stock__gte=-delta)
+        with transaction.atomic():
+            if not products.update(stock=F('stock') + delta, updated_at=timezone.now()):
+                raise InsufficientStock(f"Not enough stock for product {product_id}")
+            StockMovement.objects.create(product_id=product_id, delta=delta, reason=reason, reference=reference)
+        stock_changed.send(sender=cls, product_ids=[product_id])
+
+    @classmethod
+    def take_stock(cls, quantities, reference=''):
+        """Take ``{product_id: quantity}`` out of stock with one conditional UPDATE.
+
+        Either every product has enough stock and all are decremented, or
+        InsufficientStock is raised; callers should run this inside a
+        transaction so a failure rolls back the rest of their write,
+        including the sale movements written to the stock ledger.
+        """
+        if not quantities:
+            return
+        enough = Q()
+        for product_id, quantity in quantities.items():
+            enough |= Q(pk=product_id, stock__gte=quantity)
+        updated = cls.objects.filter(enough).update(
+            stock=Case(
+                *[When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+                default=F('stock'),
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise InsufficientStock("Not enough stock for every product in the basket")
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, delta=-quantity, reason=StockMovement.SALE, reference=reference)
+            for product_id, quantity in quantities.items()
+        ])
+        stock_changed.send(sender=cls, product_ids=list(quantities))
+
+    @classmethod
+    def record_sales(cls, day, sales):
+        """Add ``{product_id: (units, revenue)}`` to the sales counters for ``day``.
+
+        Negative values take sales back out (cancellations, removed lines).
+        Lifetime counters are updated with one UPDATE; the per-day counters,
+        when PRODUCT_DAILY_SALES is on, with one INSERT and one UPDATE.
+        Callers run this in the transaction that changes the order items.
+        """
+        sales = {pk: (units, revenue) for pk, (units, revenue) in sales.items() if units or revenue}
+        if not sales:
+            return
+        cls.objects.filter(pk__in=sales).update(**_sales_increments(sales))
+        if getattr(settings, 'PRODUCT_DAILY_SALES', True):
+            DailyProductSales.objects.bulk_create(
+                [DailyProductSales(product_id=pk, date=day) for pk in sales],
+                ignore_conflicts=True,
+            )
+            DailyProductSales.objects.filter(date=day, product_id__in=sales).update(
+                **_sales_increments(sales, key='product_id')
+            )
+        sales_recorded.send(sender=cls, day=day, product_ids=list(sales))
+
+
+class DailyProductSales(models.Model):
+    """Per-product, per-day sales for rankings over a date window."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='products_dailyproductsales_product_date'),
+        ]
+        indexes = [
+            # Windowed rankings aggregate a date range by product
+            models.Index(fields=['date', 'product', 'units_sold', 'revenue'], name='product_sales_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}: {self.units_sold}"
+
+
+class StockMovement(models.Model):
+    """One change to a product's stock. Rows are only ever appended.
+
+    A product's stock is its latest StockSnapshot plus the movements after
+    it; compact_stock_ledger folds old movements into a new snapshot.
+    """
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    IMPORT = 'import'
+    REASONS = (
+        (SALE, 'Sale'),
+        (RESTOCK, 'Restock / cancellation'),
+        (ADJUSTMENT, 'Manual adjustment'),
+        (IMPORT, 'Catalogue import'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASONS)
+    # Order number for sales and restocks
+    reference = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # As-of queries sum a time range; compaction deletes by age
+            models.Index(fields=['created_at', 'product', 'delta'], name='stock_movement_created_idx'),
+            models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.delta:+d} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """Stock of every product at one instant; all rows of a snapshot share ``taken_at``."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    taken_at = models.DateTimeField()
+    stock = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taken_at', 'product'], name='products_stocksnapshot_taken_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} at {self.taken_at}: {self.stock}"
+
+
+def _sales_increments(sales, key='pk'):
+    return {
+        'units_sold': Case(
+            *[When(**{key: pk}, then=F('units_sold') + units) for pk, (units, _) in sales.items()],
+            default=F('units_sold'), output_field=IntegerField(),
+        ),
+        'revenue': Case(
+            *[When(**{key: pk}, then=F('revenue') + revenue) for pk, (_, revenue) in sales.items()],
+            default=F('revenue'), output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    }
+
+
+def stock_status(stock, min_stock_level):
+    """Human readable stock status, matching Product.is_out_of_stock/is_low_stock."""
+    if stock <= 0:
+        return "Out of Stock"
+    if stock < min_stock_level:
+        return "Low Stock"
+    return "In Stock"
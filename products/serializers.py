@@ -0,0 +1,18 @@
+from grocery_management.api import SparseFieldsSerializer
+from .models import Category, Product
+
+
+class CategorySerializer(SparseFieldsSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'updated_at']
+
+
+class ProductSerializer(SparseFieldsSerializer):
+    class Meta:
+        model = Product
+        # The category is referenced by id so a rename doesn't change every product
+        fields = ['id', 'barcode', 'name', 'category', 'description', 'price',
+                  'stock', 'min_stock_level', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+        extra_kwargs = {'barcode': {'required': False}}
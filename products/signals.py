@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent after Product.stock is changed with an UPDATE rather than Product.save().
+# Arguments: product_ids.
+stock_changed = Signal()
+
+# Sent by Product.record_sales() after it changes the sales counters.
+# Arguments: day, product_ids.
+sales_recorded = Signal()
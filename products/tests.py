@@ -1,3 +1,302 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from users.models import User
+from . import barcodes, cache as product_cache, imports, ledger
+from .models import Category, Product, StockMovement, StockSnapshot
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BarcodeLookupCacheTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(barcode='4006381333931', name='Pen', price=Decimal('1.20'), stock=9)
+
+    def scan(self):
+        return self.client.post(reverse('products:barcode_scan'), {'barcode': self.product.barcode})
+
+    def test_repeat_scans_are_served_from_cache(self):
+        self.assertEqual(self.scan()['X-Cache'], 'db')
+        with self.assertNumQueries(0):
+            product_cache.lookup(self.product.barcode)
+        self.assertEqual(self.scan()['X-Cache'], 'local')
+
+    def test_price_and_stock_changes_invalidate(self):
+        self.scan()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('1.50')
+            self.product.save()
+        self.assertEqual(self.scan().json()['product']['price'], '1.50')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.adjust_stock(self.product.pk, -4)
+        self.assertEqual(self.scan().json()['product']['stock'], 5)
+
+    def test_lookup_racing_an_invalidation_does_not_store_stale_rows(self):
+        read_payload = product_cache.product_payload
+
+        def change_after_read(product):
+            payload = read_payload(product)
+            # A price change commits between this lookup's read and its cache writes
+            Product.objects.filter(pk=product.pk).update(price=Decimal('2.00'))
+            product_cache.invalidate([product.pk], [product.barcode])
+            return payload
+
+        with mock.patch.object(product_cache, 'product_payload', side_effect=change_after_read):
+            self.assertEqual(product_cache.lookup(self.product.barcode)[0]['price'], '1.20')
+        payload, source = product_cache.lookup(self.product.barcode)
+        self.assertEqual((payload['price'], source), ('2.00', 'db'))
+
+    def test_get_lookup_revalidates_with_etag(self):
+        url = reverse('products:barcode_lookup', args=[self.product.barcode])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('products:barcode_lookup', args=['0000'])).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BarcodeImageTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+
+    def test_image_rendered_once_and_revalidated(self):
+        Product.objects.create(barcode='000000000042', name='Salt', price=Decimal('0.80'), stock=1)
+        url = reverse('products:barcode_image', args=['000000000042'])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+
+        path = barcodes.barcode_image_path('000000000042')
+        mtime = os.path.getmtime(path)
+        self.client.get(url)
+        self.assertEqual(os.path.getmtime(path), mtime)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_only_product_barcodes_are_rendered(self):
+        for value in ('000000000044', 'x' * 5000):
+            with self.subTest(length=len(value)):
+                response = self.client.get(reverse('products:barcode_image', args=[value]))
+                self.assertEqual(response.status_code, 404)
+                self.assertFalse(os.path.exists(barcodes.barcode_image_path(value)))
+
+    def test_new_products_are_rendered_in_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(barcode='000000000043', name='Tea', price=Decimal('3.00'), stock=1)
+        barcodes._executor.submit(lambda: None).result()
+        self.assertTrue(os.path.exists(barcodes.barcode_image_path('000000000043')))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='manager', password='secret'))
+        self.existing = Product.objects.create(barcode='111', name='Salt', price=Decimal('1.00'), stock=3)
+
+    def test_import_round_trips_export(self):
+        exported = b''.join(self.client.get(reverse('products:product_export')).streaming_content).decode()
+        lines = exported.replace('Salt,', 'Sea Salt,').splitlines(keepends=True) + [
+            ',Flour,Baking,2.50,40,5,In Stock\r\n',
+            ',Sugar,Baking,3.00,10,,\r\n',
+            'abc,Bad barcode,,1.00,1,1,\r\n',
+            '222,Bad price,,free,1,1,\r\n',
+        ]
+        upload = SimpleUploadedFile('catalogue.csv', ''.join(lines).encode())
+
+        with mock.patch.object(imports, 'queue_barcode_images') as queue:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('products:product_import'), {'file': upload})
+        result = response.context['result']
+
+        self.assertEqual((result.rows, result.created, result.updated), (5, 2, 1))
+        self.assertEqual([line for line, _ in result.errors], [5, 6])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Sea Salt')
+        flour = Product.objects.get(name='Flour')
+        self.assertEqual(flour.barcode, f'{flour.pk:012d}')
+        self.assertEqual(flour.category.name, 'Baking')
+        self.assertEqual(Product.objects.get(name='Sugar').category, flour.category)
+        queue.assert_called_once()
+        self.assertIn(flour.barcode, queue.call_args.args[0])
+
+    def test_unrepresentable_prices_are_row_errors(self):
+        lines = ['Barcode,Name,Price,Stock\r\n'] + [
+            f'90{n},Odd {n},{price},1\r\n'
+            for n, price in enumerate(['NaN', 'Infinity', '1e999', '99999999999.00', '99999999.999', '12.5'])
+        ]
+        result = imports.import_products(lines)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5, 6])
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Product.objects.get(barcode='905').price, Decimal('12.50'))
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(barcode='7001', name='Ghee', price=Decimal('9.00'), stock=10)
+
+    def ledger_total(self):
+        return self.product.stock_movements.aggregate(total=Sum('delta'))['total'] or 0
+
+    def test_every_stock_change_is_recorded(self):
+        order = Order.objects.create(customer_name='Ana', customer_phone='1')
+        OrderItem(order=order, product=self.product, quantity=3, price=self.product.price).save()
+        order.add_items([(self.product, 2)])
+        order.cancel()
+        self.product.refresh_from_db()
+        self.product.stock = 4
+        self.product.save()
+        # Saving without touching stock writes no movement
+        self.product.name = 'Cow Ghee'
+        self.product.save()
+
+        self.assertEqual(
+            list(self.product.stock_movements.order_by('pk').values_list('reason', 'delta')),
+            [('adjustment', 10), ('sale', -3), ('sale', -2), ('restock', 5), ('adjustment', -6)],
+        )
+        self.assertEqual(self.ledger_total(), 4)
+
+    def test_as_of_survives_compaction(self):
+        start = timezone.now()
+        Product.adjust_stock(self.product.pk, -4, reason=StockMovement.SALE)
+        middle = timezone.now()
+        Product.adjust_stock(self.product.pk, 7, reason=StockMovement.RESTOCK)
+        self.assertEqual(ledger.stock_as_of(start)[self.product.pk], 10)
+        self.assertEqual(ledger.stock_as_of(middle)[self.product.pk], 6)
+
+        snapshots, deleted = ledger.compact(middle)
+        self.assertEqual((snapshots, deleted), (1, 2))
+        self.assertEqual(ledger.stock_as_of(middle)[self.product.pk], 6)
+        self.assertEqual(ledger.stock_as_of(timezone.now())[self.product.pk], 13)
+
+    def test_compaction_refuses_the_future(self):
+        with self.assertRaises(ValueError):
+            ledger.compact(timezone.now() + timedelta(hours=1))
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with self.assertRaisesMessage(CommandError, 'in the future'):
+            call_command('compact_stock_ledger', '--before', tomorrow.isoformat())
+        self.assertFalse(StockSnapshot.objects.exists())
+
+    def test_products_created_without_stock_exist_as_of_creation(self):
+        before = timezone.now()
+        empty = Product.objects.create(barcode='7002', name='Jam', price=Decimal('2.00'), stock=0)
+        self.assertFalse(empty.stock_movements.exists())
+        self.assertNotIn(empty.pk, ledger.stock_as_of(before))
+        self.assertEqual(ledger.stock_as_of(timezone.now())[empty.pk], 0)
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='clerk', password='secret'))
+        self.dairy = Category.objects.create(name='Dairy')
+        self.products = {
+            name: Product.objects.create(
+                barcode=barcode, name=name, price=Decimal(price), stock=stock,
+                category=self.dairy if name in ('Milk', 'Curd') else None,
+            )
+            for barcode, name, price, stock in [
+                ('2001', 'Milk', '2.50', 0),
+                ('2002', 'Curd', '1.75', 3),
+                ('3001', 'Rice', '9.00', 40),
+                ('3002', 'Flour', '4.00', 12),
+            ]
+        }
+
+    def names(self, **params):
+        response = self.client.get(reverse('products:product_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [product.name for product in response.context['products']]
+
+    def test_filters(self):
+        self.assertEqual(self.names(q='ri'), ['Rice'])
+        self.assertEqual(self.names(q='300'), ['Rice', 'Flour'])
+        self.assertEqual(self.names(category=self.dairy.pk), ['Milk', 'Curd'])
+        self.assertEqual(self.names(category='dairy'), ['Milk', 'Curd', 'Rice', 'Flour'])
+        self.assertEqual(self.names(status='out_of_stock'), ['Milk'])
+        self.assertEqual(self.names(status='low_stock'), ['Curd'])
+        self.assertEqual(self.names(status='in_stock'), ['Rice', 'Flour'])
+        self.assertEqual(self.names(status='discontinued'), ['Milk', 'Curd', 'Rice', 'Flour'])
+        self.assertEqual(self.names(category=self.dairy.pk, status='low_stock'), ['Curd'])
+
+    def test_only_whitelisted_sorts_apply(self):
+        self.assertEqual(self.names(sort='name'), ['Curd', 'Flour', 'Milk', 'Rice'])
+        self.assertEqual(self.names(sort='-price'), ['Rice', 'Flour', 'Milk', 'Curd'])
+        self.assertEqual(self.names(sort='stock'), ['Milk', 'Curd', 'Flour', 'Rice'])
+        for sort in ('category__name', 'password', '-barcode', '?'):
+            with self.subTest(sort=sort):
+                self.assertEqual(self.names(sort=sort), ['Milk', 'Curd', 'Rice', 'Flour'])
+
+    @mock.patch('products.views.PRODUCTS_PER_PAGE', 3)
+    def test_pagination(self):
+        self.assertEqual(self.names(sort='name'), ['Curd', 'Flour', 'Milk'])
+        response = self.client.get(reverse('products:product_list'), {'sort': 'name', 'page': 2})
+        self.assertEqual([product.name for product in response.context['products']], ['Rice'])
+        self.assertContains(response, '?page=1&sort=name')
+        # Out of range and non-numeric pages fall back rather than 404
+        self.assertEqual(self.names(sort='name', page=9), ['Rice'])
+        self.assertEqual(self.names(sort='name', page='last'), ['Curd', 'Flour', 'Milk'])
+
+
+class ProductApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='sync', password='secret'))
+        self.products = [
+            Product.objects.create(barcode=f'80{n:02d}', name=f'Soap {n}', price=Decimal('2.00'), stock=5)
+            for n in range(3)
+        ]
+
+    def test_cursor_pages_and_sparse_fields(self):
+        url = reverse('api-product-list')
+        page = self.client.get(url, {'page_size': 2, 'fields': 'id,stock'}).json()
+        self.assertEqual(page['results'][0], {'id': self.products[0].pk, 'stock': 5})
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([p['id'] for p in rest['results']], [self.products[2].pk])
+        self.assertIsNone(rest['next'])
+
+    def test_conditional_get_and_delta_sync(self):
+        since = timezone.now()
+        Product.adjust_stock(self.products[1].pk, -2)
+        url = reverse('api-product-detail', args=[self.products[1].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['stock'], 3)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(3):  # session, user, then only the validator lookup
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        changed = self.client.get(reverse('api-product-list'), {'updated_since': since.isoformat()})
+        self.assertEqual([p['id'] for p in changed.json()['results']], [self.products[1].pk])
+        self.assertEqual(
+            self.client.get(reverse('api-product-list'), HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api-product-list'), {'updated_since': 'soon'}).status_code, 400)
+
+        Product.adjust_stock(self.products[1].pk, -1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_list_etag_covers_only_the_served_page(self):
+        url = reverse('api-product-list')
+        first = self.client.get(url, {'page_size': 2})
+        with self.assertNumQueries(3):  # session, user, then the page's keys
+            self.assertEqual(self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        # Rows changed after the page only move further back
+        Product.adjust_stock(self.products[2].pk, -1)
+        self.assertEqual(self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        Product.adjust_stock(self.products[0].pk, -1)
+        self.assertEqual(self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_create_numbers_product_without_barcode(self):
+        response = self.client.post(reverse('api-product-list'), {
+            'name': 'Brush', 'price': '1.50', 'stock': 4,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['barcode'], f"{response.json()['id']:012d}")
@@ -19,7 +19,11 @@ urlpatterns = [
     
     # Barcode URLs
     path('barcode/scan/', views.barcode_scan, name='barcode_scan'),
+    path('barcode/lookup/stats/', views.barcode_lookup_stats, name='barcode_lookup_stats'),
+    path('barcode/lookup/<str:barcode>/', views.barcode_lookup, name='barcode_lookup'),
+    path('barcode/image/<str:value>.png', views.barcode_image, name='barcode_image'),
     path('barcode/generate/', views.barcode_generate, name='barcode_generate'),
     path('barcode/generate/<int:product_id>/', views.barcode_generate, name='barcode_generate_for_product'),
-    path('export/', views.product_export, name='product_export')
+    path('export/', views.product_export, name='product_export'),
+    path('import/', views.product_import, name='product_import'),
 ]
\ No newline at end of file
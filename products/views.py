@@ -1,20 +1,65 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Product, Category
-from django.http import HttpResponse, JsonResponse
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from .models import Product, Category, stock_status
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET
+from . import cache as product_cache
+import hashlib
+import io
+import json
+import os
 from .forms import ProductForm, CategoryForm
-import barcode
-from barcode.writer import ImageWriter
-from io import BytesIO
-from django.core.files import File
-import base64
-import csv
+from barcode.errors import BarcodeError
+from .barcodes import barcode_digest, barcode_image_path, ensure_barcode_image
+from .imports import PRODUCT_CSV_HEADER, import_products
+from grocery_management.exports import EXPORT_CHUNK_SIZE, csv_stream_response
+
+PRODUCTS_PER_PAGE = 50
+
+PRODUCT_SORTS = {'name', '-name', 'price', '-price', 'stock', '-stock'}
+
+# Written as plain column comparisons so they can use the stock indexes
+PRODUCT_STATUS_FILTERS = {
+    'out_of_stock': Q(stock=0),
+    'low_stock': Q(stock__gt=0, stock__lt=F('min_stock_level')),
+    'in_stock': Q(stock__gt=0, stock__gte=F('min_stock_level')),
+}
 
 @login_required
 def product_list(request):
-    products = Product.objects.all()
-    return render(request, 'products/list.html', {'products': products})
+    products = Product.objects.select_related('category')
+    
+    query = request.GET.get('q', '').strip()
+    if query:
+        products = products.filter(Q(name__icontains=query) | Q(barcode__startswith=query))
+    
+    category = request.GET.get('category')
+    if category and category.isdigit():
+        products = products.filter(category_id=category)
+    
+    status = request.GET.get('status')
+    if status in PRODUCT_STATUS_FILTERS:
+        products = products.filter(PRODUCT_STATUS_FILTERS[status])
+    
+    sort = request.GET.get('sort')
+    if sort in PRODUCT_SORTS:
+        products = products.order_by(sort, 'pk')
+    else:
+        products = products.order_by('pk')
+    
+    paginator = Paginator(products, PRODUCTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'products/list.html', {
+        'products': page_obj.object_list,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        'categories': Category.objects.order_by('name'),
+    })
 
 @login_required
 def product_create(request):
@@ -28,23 +73,11 @@ def product_create(request):
                 # Create a temporary product to get ID
                 product.save()
                 product.barcode = f"{product.id:012d}"  # 12-digit zero-padded ID
-                product.save()
+            product.save()
             
-            try:
-                # Generate barcode image
-                ean = barcode.get('ean13', product.barcode, writer=ImageWriter())
-                buffer = BytesIO()
-                ean.write(buffer)
-                product.barcode_image.save(f'barcode_{product.barcode}.png', File(buffer), save=False)
-                product.save()
-                
-                messages.success(request, 'Product created successfully!')
-                return redirect('products:product_list')
-            except Exception as e:
-                # If barcode generation fails, still save the product
-                product.save()
-                messages.warning(request, f'Product created but barcode generation failed: {str(e)}')
-                return redirect('products:product_list')
+            # The barcode image is rendered in the background once the product is saved
+            messages.success(request, 'Product created successfully!')
+            return redirect('products:product_list')
     else:
         form = ProductForm()
     return render(request, 'products/product_form.html', {'form': form})
@@ -127,25 +160,42 @@ def category_create(request):
 @login_required
 def barcode_scan(request):
     if request.method == 'POST':
-        barcode_data = request.POST.get('barcode')
-        try:
-            product = Product.objects.get(barcode=barcode_data)
-            return JsonResponse({
-                'success': True,
-                'product': {
-                    'id': product.id,
-                    'name': product.name,
-                    'price': str(product.price),
-                    'stock': product.stock
-                }
-            })
-        except Product.DoesNotExist:
-            return JsonResponse({
+        payload, source = product_cache.lookup(request.POST.get('barcode', ''))
+        if payload is None:
+            response = JsonResponse({
                 'success': False,
                 'message': 'Product not found'
             }, status=404)
+        else:
+            response = JsonResponse({'success': True, 'product': payload})
+        response['X-Cache'] = source
+        return response
     return render(request, 'products/barcode_scan.html')
 
+@login_required
+@require_GET
+def barcode_lookup(request, barcode):
+    """Idempotent, conditionally cacheable variant of the scan lookup."""
+    payload, source = product_cache.lookup(barcode)
+    if payload is None:
+        response = JsonResponse({'success': False, 'message': 'Product not found'}, status=404)
+    else:
+        body = json.dumps({'success': True, 'product': payload})
+        etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+    # Price and stock can change at any time: let clients keep the body but revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    response['X-Cache'] = source
+    return response
+
+@login_required
+def barcode_lookup_stats(request):
+    return JsonResponse(product_cache.lookup_stats())
+
 @login_required
 def barcode_generate(request, product_id=None):
     if product_id:
@@ -154,15 +204,9 @@ def barcode_generate(request, product_id=None):
             product.barcode = str(product.id).zfill(12)  # Generate a simple barcode
             product.save()
         
-        # Generate barcode image
-        code = barcode.get('ean13', product.barcode, writer=ImageWriter())
-        buffer = BytesIO()
-        code.write(buffer)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
         return JsonResponse({
             'barcode': product.barcode,
-            'image': image_base64,
+            'image_url': product.barcode_image_url,
             'product_name': product.name
         })
     
@@ -175,37 +219,62 @@ def barcode_generate(request, product_id=None):
         'products': products
     })
 
+@login_required
+@require_GET
+def barcode_image(request, value):
+    """PNG for a barcode value, rendered once and then served from disk."""
+    etag = quote_etag(barcode_digest(value))
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        path = barcode_image_path(value)
+        # Only product barcodes are rendered, so made-up values can't fill the disk
+        if not os.path.exists(path) and not Product.objects.filter(barcode=value).exists():
+            raise Http404('No product has this barcode')
+        try:
+            path = ensure_barcode_image(value)
+        except BarcodeError:
+            raise Http404('Not a valid barcode')
+        response = FileResponse(open(path, 'rb'), content_type='image/png')
+    response['ETag'] = etag
+    # The same value renders the same image, so a day's freshness is safe
+    patch_cache_control(response, private=True, max_age=60 * 60 * 24)
+    return response
+
 def product_export(request):
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="products_export.csv"'
+    products = (
+        Product.objects
+        .order_by('pk')
+        .values_list('barcode', 'name', 'category__name', 'price', 'stock', 'min_stock_level')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    rows = (
+        (barcode_value, name, category or '', price, stock, min_stock, stock_status(stock, min_stock))
+        for barcode_value, name, category, price, stock, min_stock in products
+    )
+    return csv_stream_response('products_export.csv', PRODUCT_CSV_HEADER, rows)
 
-    # Create a CSV writer
-    writer = csv.writer(response)
-    
-    # Write headers
-    writer.writerow(['Barcode', 'Name', 'Category', 'Price', 'Stock', 'Min Stock', 'Status'])
-    
-    # Get all products
-    products = Product.objects.all()
-    
-    # Write product data
-    for product in products:
-        if product.is_out_of_stock():
-            status = "Out of Stock"
-        elif product.is_low_stock():
-            status = "Low Stock"
+# Errors listed on the import result page; the counts cover all of them
+IMPORT_ERRORS_SHOWN = 100
+
+@login_required
+def product_import(request):
+    result = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, 'Choose a CSV file to import.')
         else:
-            status = "In Stock"
-            
-        writer.writerow([
-            product.barcode,
-            product.name,
-            product.category.name if product.category else '',
-            product.price,
-            product.stock,
-            product.min_stock_level,
-            status
-        ])
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_products(lines)
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, f'Could not import {upload.name}: {e}')
+            else:
+                messages.success(request, f'Imported {upload.name}: {result}')
     
-    return response
\ No newline at end of file
+    return render(request, 'products/import.html', {
+        'result': result,
+        'errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+        'columns': PRODUCT_CSV_HEADER,
+    })
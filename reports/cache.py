@@ -0,0 +1,151 @@
+"""Report results cached by report name and normalized parameters.
+
+Keys for reports over open periods include a data version that is bumped
+whenever an Order, OrderItem or Product row changes, so a cached result is
+reused only while nothing it could depend on has changed; REPORT_CACHE_TIMEOUT
+is only a safety net. Reports over closed periods (a past month or year)
+are kept for REPORT_CLOSED_CACHE_TIMEOUT and keyed on a separate epoch.
+That epoch is bumped by bulk rebuilds of historical data, by any sales
+write that lands on a day before today (e.g. cancelling an old order), by
+edits to orders placed before today, and by any product edit, since past
+inventories show current product names.
+
+The counters and entries live in the default cache, which has to be shared
+between worker processes (see CACHES in settings) for a bump in one worker
+to reach the others.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from orders.signals import order_total_changed
+from products.models import Product
+from products.signals import sales_recorded, stock_changed
+
+CACHE_TIMEOUT = getattr(settings, 'REPORT_CACHE_TIMEOUT', 10 * 60)
+CLOSED_CACHE_TIMEOUT = getattr(settings, 'REPORT_CLOSED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+VERSION_KEY = 'reports:data-version'
+EPOCH_KEY = 'reports:closed-epoch'
+
+# Per-report counters for this process: hits, misses and seconds spent computing
+stats = {}
+_stats_lock = threading.Lock()
+
+
+def _counter(key):
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock rather than 1 so a counter that was evicted
+        # can't come back at a value older cache entries were keyed on
+        cache.add(key, time.time_ns() // 1000, None)
+        value = cache.get(key)
+    return value
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _counter(key)
+
+
+def data_version():
+    return _counter(VERSION_KEY)
+
+
+def bump_data_version():
+    _bump(VERSION_KEY)
+
+
+def invalidate_closed_periods():
+    """Drop cached reports for closed periods, e.g. after loading historical orders."""
+    _bump(EPOCH_KEY)
+    _bump(VERSION_KEY)
+
+
+def sales_changed_on(day):
+    """Call when sales counted on ``day`` change; drops closed-period reports if ``day`` has passed."""
+    if day < timezone.localdate():
+        transaction.on_commit(invalidate_closed_periods)
+
+
+def report_key(name, params, closed=False):
+    normalized = '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    digest = hashlib.sha256(normalized.encode()).hexdigest()[:32]
+    if closed:
+        return f'reports:{name}:closed-{_counter(EPOCH_KEY)}:{digest}'
+    return f'reports:{name}:v{data_version()}:{digest}'
+
+
+def _record(name, hit, elapsed=0.0):
+    with _stats_lock:
+        entry = stats.setdefault(name, {'hits': 0, 'misses': 0, 'compute_seconds': 0.0})
+        entry['hits' if hit else 'misses'] += 1
+        entry['compute_seconds'] += elapsed
+
+
+def cached_report(name, params, compute, closed=False):
+    """Return ``compute()`` for report ``name`` and ``params``, from the cache if possible.
+
+    ``compute`` must return something picklable (lists, dicts, model instances),
+    not a lazy queryset. Pass ``closed=True`` when every period the parameters
+    cover has ended, so the result is kept until historical data changes.
+    """
+    key = report_key(name, params, closed)
+    result = cache.get(key)
+    if result is not None:
+        _record(name, True)
+        return result
+
+    started = time.perf_counter()
+    result = compute()
+    _record(name, False, time.perf_counter() - started)
+    cache.set(key, result, CLOSED_CACHE_TIMEOUT if closed else CACHE_TIMEOUT)
+    return result
+
+
+def report_stats():
+    with _stats_lock:
+        summary = {}
+        for name, entry in stats.items():
+            requests = entry['hits'] + entry['misses']
+            summary[name] = {
+                **entry,
+                'hit_ratio': entry['hits'] / requests if requests else 0.0,
+                'avg_compute_ms': 1000 * entry['compute_seconds'] / entry['misses'] if entry['misses'] else 0.0,
+            }
+    return summary
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(order_total_changed)
+@receiver(stock_changed)
+def data_changed(sender, instance=None, raw=False, **kwargs):
+    if raw:
+        return
+    if isinstance(instance, Product) or (
+        isinstance(instance, Order) and timezone.localdate(instance.created_at) < timezone.localdate()
+    ):
+        # Shown by closed-period reports too: past orders in sales lists, product names in past inventories
+        transaction.on_commit(invalidate_closed_periods)
+    else:
+        transaction.on_commit(bump_data_version)
+
+
+@receiver(sales_recorded)
+def past_sales_recorded(sender, day, **kwargs):
+    sales_changed_on(day)
@@ -0,0 +1,79 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+SALES_HEADERS = ['Order Number', 'Customer', 'Date', 'Amount', 'Status']
+CURRENCY_FORMAT = '$#,##0.00'
+
+
+def column_width(max_length):
+    return (max_length + 2) * 1.2
+
+
+def write_sales_workbook(fileobj, rows, max_lengths):
+    """Write sales ``rows`` to ``fileobj`` using a write-only worksheet.
+
+    ``rows`` yields ``(order_number, customer, date, amount, status)`` tuples
+    and is consumed once. Write-only sheets emit their column definitions
+    before the first row, so ``max_lengths`` (one per column, longest value
+    as text) has to be known up front; header lengths are folded in here.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sales Report")
+
+    for col_num, (header, length) in enumerate(zip(SALES_HEADERS, max_lengths), 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = column_width(max(len(header), length))
+
+    # One styled cell per column kind, reused for every row
+    font = Font(bold=True)
+    alignment = Alignment(horizontal='center')
+    header_row = []
+    for header in SALES_HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = font
+        cell.alignment = alignment
+        header_row.append(cell)
+    ws.append(header_row)
+
+    amount = WriteOnlyCell(ws)
+    amount.number_format = CURRENCY_FORMAT
+    for number, customer, date, value, status in rows:
+        amount.value = value
+        ws.append([number, customer, date, amount, status])
+
+    wb.save(fileobj)
+
+
+def legacy_sales_workbook(fileobj, rows):
+    """The original in-memory export, kept as the baseline for benchmarks."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sales Report"
+
+    for col_num, header in enumerate(SALES_HEADERS, 1):
+        col_letter = get_column_letter(col_num)
+        ws[f'{col_letter}1'] = header
+        ws[f'{col_letter}1'].font = Font(bold=True)
+        ws[f'{col_letter}1'].alignment = Alignment(horizontal='center')
+
+    for row_num, (number, customer, date, value, status) in enumerate(rows, 2):
+        ws[f'A{row_num}'] = number
+        ws[f'B{row_num}'] = customer
+        ws[f'C{row_num}'] = date
+        ws[f'D{row_num}'] = value
+        ws[f'E{row_num}'] = status
+
+    for col in ws.columns:
+        max_length = 0
+        column = col[0].column_letter
+        for cell in col:
+            if len(str(cell.value)) > max_length:
+                max_length = len(str(cell.value))
+        ws.column_dimensions[column].width = column_width(max_length)
+
+    for row in ws.iter_rows(min_row=2, min_col=4, max_col=4):
+        for cell in row:
+            cell.number_format = CURRENCY_FORMAT
+
+    wb.save(fileobj)
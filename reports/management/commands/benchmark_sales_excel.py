@@ -0,0 +1,63 @@
+import random
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from orders.models import Order
+from reports.excel import legacy_sales_workbook, write_sales_workbook
+
+
+def synthetic_sales_rows(count, seed=0):
+    rng = random.Random(seed)
+    labels = [label for _, label in Order.ORDER_STATUS]
+    for i in range(count):
+        yield (
+            f'{i:020X}',
+            f'Customer {rng.randrange(100000)}',
+            f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            round(rng.uniform(1, 5000), 2),
+            rng.choice(labels),
+        )
+
+
+class Command(BaseCommand):
+    help = ('Compare the write-only sales Excel export against the legacy in-memory '
+            'workbook on synthetic rows (time and peak Python memory).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, nargs='+', default=[100000, 1000000],
+                            help='Row counts to benchmark')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='Only run the write-only engine (the legacy one needs GBs at 1M rows)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Record peak Python memory with tracemalloc (slows both engines down)')
+
+    def _run(self, label, count, build, trace_memory):
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with tempfile.TemporaryFile() as output:
+            build(output)
+            size = output.tell()
+        elapsed = time.perf_counter() - started
+        line = (f'{label:<10} {count:>9} rows  {elapsed:8.2f}s  '
+                f'{count / elapsed:10.0f} rows/s  file {size / 2**20:6.1f} MiB')
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            line += f'  peak {peak / 2**20:8.1f} MiB'
+        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        trace_memory = options['trace_memory']
+        max_lengths = [20, len('Customer 99999'), 10, len('5000.0'), len('Cancelled')]
+        for count in options['orders']:
+            self._run('write-only', count, lambda out: write_sales_workbook(
+                out, synthetic_sales_rows(count, seed), max_lengths), trace_memory)
+            if not options['skip_legacy']:
+                self._run('legacy', count, lambda out: legacy_sales_workbook(
+                    out, synthetic_sales_rows(count, seed)), trace_memory)
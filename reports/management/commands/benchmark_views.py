@@ -0,0 +1,217 @@
+import json
+import logging
+import math
+import platform
+import time
+import tracemalloc
+from importlib import import_module
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from products.models import Category, Product
+
+APPS = ('products', 'orders', 'reports')
+
+# GETs that change data, views that only take POST, and progress of an export job
+# that cache.clear() has already forgotten
+SKIP = {'orders:order_complete', 'orders:order_add_basket', 'orders:invoice_batch_progress'}
+
+
+class Samples:
+    """Existing rows to fill URL arguments with: the busiest product and a recent, full order."""
+
+    def __init__(self):
+        self.product = Product.objects.order_by('-units_sold', 'pk').first()
+        self.category = Category.objects.order_by('pk').first()
+        self.order = (Order.objects.filter(status='completed')
+                      .annotate(lines=Count('items')).filter(lines__gt=0)
+                      .order_by('-created_at').first())
+        self.item = OrderItem.objects.filter(order=self.order).order_by('pk').first() if self.order else None
+
+    def kwargs(self, name, pattern):
+        values = {
+            'order_id': self.order and self.order.pk,
+            'item_id': self.item and self.item.pk,
+            'product_id': self.product and self.product.pk,
+            'pk': (self.category if name.startswith('products:category') else self.product),
+            'barcode': self.product and self.product.barcode,
+            'value': self.product and self.product.barcode,
+            'job_id': 'benchmark',
+        }
+        kwargs = {}
+        for argument in pattern.pattern.converters:
+            value = values.get(argument)
+            if value is None:
+                return None
+            kwargs[argument] = value.pk if hasattr(value, 'pk') else value
+        return kwargs
+
+    def query(self, name):
+        if name == 'orders:invoice_batch_export' and self.order:
+            # One day of invoices; the whole history would be a different benchmark
+            day = timezone.localdate(self.order.created_at).isoformat()
+            return {'start_date': day, 'end_date': day, 'job': 'benchmark'}
+        return {}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Time every GET view in the products, orders and reports URLconfs (exports included) '
+            'against the current database, write latency percentiles, query counts and peak memory '
+            'to a JSON baseline, and optionally flag regressions against an earlier one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the results')
+        parser.add_argument('--compare', metavar='BASELINE', help='Earlier results to compare against')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per view')
+        parser.add_argument('--only', action='append', default=[],
+                            help='Only views whose name contains this (repeatable)')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slow-down before a view is flagged')
+        parser.add_argument('--noise-ms', type=float, default=2.0,
+                            help='Ignore latency changes smaller than this')
+
+    def _views(self, samples):
+        for app in APPS:
+            for pattern in import_module(f'{app}.urls').urlpatterns:
+                if not isinstance(pattern, URLPattern) or not pattern.name:
+                    continue
+                name = f'{app}:{pattern.name}'
+                if name in SKIP:
+                    continue
+                kwargs = samples.kwargs(name, pattern)
+                if kwargs is None:
+                    self.stderr.write(f'{name}: skipped, no data for its URL arguments')
+                    continue
+                yield name, reverse(name, kwargs=kwargs), samples.query(name)
+
+    def _get(self, client, path, query):
+        started = time.perf_counter()
+        response = client.get(path, query)
+        # Reading a streaming body to the end also closes it, as a WSGI server would
+        size = sum(map(len, response.streaming_content)) if response.streaming else len(response.content)
+        return time.perf_counter() - started, response.status_code, size
+
+    def _measure(self, client, path, query, repeat):
+        # Cold: empty caches, as after a deploy or an invalidation
+        cache.clear()
+        cold, status, size = self._get(client, path, query)
+        timings = [self._get(client, path, query)[0] for _ in range(repeat)]
+        with CaptureQueriesContext(connection) as queries:
+            self._get(client, path, query)
+        cache.clear()
+        with CaptureQueriesContext(connection) as cold_queries:
+            tracemalloc.start()
+            try:
+                self._get(client, path, query)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        ms = [t * 1000 for t in timings]
+        return {
+            'path': path,
+            'status': status,
+            'bytes': size,
+            'cold_ms': round(cold * 1000, 2),
+            'p50_ms': round(percentile(ms, 50), 2),
+            'p90_ms': round(percentile(ms, 90), 2),
+            'p99_ms': round(percentile(ms, 99), 2),
+            'max_ms': round(max(ms), 2),
+            'queries': len(queries),
+            'cold_queries': len(cold_queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def _regressions(self, current, baseline, tolerance, noise_ms):
+        for name, now in current.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            flags = []
+            # Tail and cold timings are a sample or two each, too noisy to gate on
+            if now['p50_ms'] > before['p50_ms'] * (1 + tolerance) and now['p50_ms'] - before['p50_ms'] > noise_ms:
+                flags.append(f"p50 {before['p50_ms']:.1f} -> {now['p50_ms']:.1f} ms")
+            for key in ('queries', 'cold_queries'):
+                if now[key] > before[key]:
+                    flags.append(f'{key} {before[key]} -> {now[key]}')
+            if now['peak_kib'] > before['peak_kib'] * (1 + tolerance) and now['peak_kib'] - before['peak_kib'] > 256:
+                flags.append(f"peak {before['peak_kib']:.0f} -> {now['peak_kib']:.0f} KiB")
+            if now['status'] != before['status']:
+                flags.append(f"status {before['status']} -> {now['status']}")
+            if flags:
+                yield name, flags
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        user = get_user_model().objects.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            user = get_user_model().objects.create_superuser('benchmark', password=None)
+        # Broken views are recorded with their 500 instead of stopping the run
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+
+        meta = {
+            'created': timezone.now().isoformat(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+            'items': OrderItem.objects.count(),
+            'repeat': options['repeat'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+        results = {}
+        # Repeated queries already show in the query counts
+        logging.getLogger('grocery_management.metrics').setLevel(logging.ERROR)
+        # Production-like: no per-query debug logging, and the test client's host allowed
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            for name, path, query in self._views(Samples()):
+                if options['only'] and not any(part in name for part in options['only']):
+                    continue
+                result = results[name] = self._measure(client, path, query, options['repeat'])
+                self.stdout.write(
+                    f"{name:<42} {result['status']} p50 {result['p50_ms']:8.1f} ms  p90 {result['p90_ms']:8.1f} ms  "
+                    f"cold {result['cold_ms']:8.1f} ms  {result['queries']:>4} queries  "
+                    f"peak {result['peak_kib']:9.1f} KiB"
+                )
+
+        with open(options['output'], 'w') as f:
+            json.dump({'meta': meta, 'views': results}, f, indent=2)
+        self.stdout.write(f"Wrote {len(results)} views to {options['output']}")
+
+        if baseline is None:
+            return
+        before = baseline.get('meta', {})
+        if any(before.get(key) != meta[key] for key in ('products', 'orders', 'items')):
+            self.stderr.write('Warning: the baseline was taken on a database of a different size')
+        regressions = list(self._regressions(
+            results, baseline.get('views', {}), options['tolerance'], options['noise_ms']))
+        for name, flags in regressions:
+            self.stdout.write(self.style.ERROR(f"{name}: {'; '.join(flags)}"))
+        if regressions:
+            raise CommandError(f'{len(regressions)} views regressed against {options["compare"]}')
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
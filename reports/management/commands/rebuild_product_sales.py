@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+from orders.models import OrderItem
+from products.models import DailyProductSales, Product
+
+
+class Command(BaseCommand):
+    help = ('Recompute the per-product sales counters (and per-day counters when '
+            'PRODUCT_DAILY_SALES is on) from order items, fixing any drift.')
+
+    def handle(self, *args, **options):
+        items = OrderItem.objects.exclude(order__status='cancelled').order_by()
+        totals = {
+            row['product_id']: (row['units'], row['revenue'])
+            for row in items.values('product_id').annotate(units=Sum('quantity'), revenue=Sum('total'))
+        }
+        products = list(Product.objects.only('pk'))
+        for product in products:
+            product.units_sold, product.revenue = totals.get(product.pk, (0, 0))
+
+        daily = []
+        if getattr(settings, 'PRODUCT_DAILY_SALES', True):
+            daily = [
+                DailyProductSales(product_id=row['product_id'], date=row['day'],
+                                  units_sold=row['units'], revenue=row['revenue'])
+                for row in items
+                .annotate(day=TruncDate('order__created_at'))
+                .values('product_id', 'day')
+                .annotate(units=Sum('quantity'), revenue=Sum('total'))
+            ]
+
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ['units_sold', 'revenue'], batch_size=500)
+            DailyProductSales.objects.all().delete()
+            DailyProductSales.objects.bulk_create(daily, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt sales counters for {len(products)} products and {len(daily)} product-days.'
+        ))
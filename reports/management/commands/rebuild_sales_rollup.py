@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.models import DailySales
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup used by the sales reports from the orders table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_parse_date, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', type=_parse_date, help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        written = DailySales.rebuild(start=options['start'], end=options['end'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} daily sales buckets.'))
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    # The rollup was only fed by new orders; fill it from the existing history,
+    # as DailySales.rebuild() does
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    DailySales = apps.get_model('reports', 'DailySales')
+    rows = {}
+    for row in (Order.objects.annotate(day=TruncDate('created_at'))
+                .values('day', 'status')
+                .annotate(revenue=Sum('total_amount'), order_count=Count('id'))
+                .order_by()):
+        rows[row['day'], row['status']] = DailySales(
+            date=row['day'], status=row['status'],
+            revenue=row['revenue'] or 0, order_count=row['order_count'],
+        )
+    for row in (OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+                .values('day', 'order__status')
+                .annotate(quantity=Sum('quantity'))
+                .order_by()):
+        bucket = rows.get((row['day'], row['order__status']))
+        if bucket is not None:
+            bucket.item_count = row['quantity'] or 0
+    DailySales.objects.all().delete()
+    DailySales.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,83 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from orders.models import Order, OrderItem
 
-# Create your models here.
+from .cache import invalidate_closed_periods, sales_changed_on
+
+
+class DailySales(models.Model):
+    """Per-day, per-status sales bucket maintained incrementally from orders.
+
+    The sales reports read from this table instead of aggregating the whole
+    ``orders.Order`` table, so their cost depends on the number of days in
+    the requested range rather than the number of orders.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # status first so yearly/monthly reports for one status are a range scan
+            models.UniqueConstraint(fields=['status', 'date'], name='reports_dailysales_status_date'),
+        ]
+        ordering = ['date', 'status']
+
+    def __str__(self):
+        return f"{self.date} [{self.status}] {self.revenue}"
+
+    @classmethod
+    def apply(cls, date, status, revenue=0, orders=0, items=0):
+        """Add the given deltas to the bucket for ``date``/``status``."""
+        if not (revenue or orders or items):
+            return
+        with transaction.atomic():
+            cls.objects.get_or_create(date=date, status=status)
+            cls.objects.filter(date=date, status=status).update(
+                revenue=F('revenue') + revenue,
+                order_count=F('order_count') + orders,
+                item_count=F('item_count') + items,
+            )
+            sales_changed_on(date)
+
+    @classmethod
+    def rebuild(cls, start=None, end=None):
+        """Recompute buckets from ``orders`` for the given day range (inclusive).
+
+        Returns the number of buckets written. Cached reports for closed
+        periods are dropped once the rebuild commits.
+        """
+        orders = Order.objects.created_between(start, end)
+        items = OrderItem.objects.filter(order__in=orders)
+        buckets = cls.objects.all()
+        if start:
+            buckets = buckets.filter(date__gte=start)
+        if end:
+            buckets = buckets.filter(date__lte=end)
+
+        rows = {}
+        for row in (orders.annotate(day=TruncDate('created_at'))
+                    .values('day', 'status')
+                    .annotate(revenue=Sum('total_amount'), order_count=Count('id'))
+                    .order_by()):
+            rows[row['day'], row['status']] = cls(
+                date=row['day'], status=row['status'],
+                revenue=row['revenue'] or 0, order_count=row['order_count'],
+            )
+        for row in (items.annotate(day=TruncDate('order__created_at'))
+                    .values('day', 'order__status')
+                    .annotate(quantity=Sum('quantity'))
+                    .order_by()):
+            bucket = rows.get((row['day'], row['order__status']))
+            if bucket is not None:
+                bucket.item_count = row['quantity'] or 0
+
+        with transaction.atomic():
+            buckets.delete()
+            cls.objects.bulk_create(rows.values(), batch_size=1000)
+            # Past months may have changed too
+            transaction.on_commit(invalidate_closed_periods)
+        return len(rows)
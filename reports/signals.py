@@ -0,0 +1,109 @@
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from orders.models import Order, OrderItem, sales_day
+from orders.signals import order_total_changed
+from .models import DailySales
+
+
+def _order_state(order):
+    # Read straight from __dict__ so deferred fields never trigger a query
+    values = order.__dict__
+    if order.pk is None or not all(f in values for f in ('created_at', 'status', 'total_amount')):
+        return None
+    return sales_day(values['created_at']), values['status'], values['total_amount']
+
+
+def _stored_order_state(order_id):
+    row = Order.objects.filter(pk=order_id).values_list('created_at', 'status', 'total_amount').first()
+    if row is None:
+        return None
+    return sales_day(row[0]), row[1], row[2]
+
+
+@receiver(post_init, sender=Order)
+def remember_order_state(sender, instance, **kwargs):
+    instance._rollup_state = _order_state(instance)
+
+
+@receiver(post_save, sender=Order)
+def update_rollup_for_order(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = _order_state(instance)
+    old = None if created else instance._rollup_state
+    if new is None:
+        return
+
+    day, status, total = new
+    if old is None:
+        if created:
+            DailySales.apply(day, status, revenue=total, orders=1)
+    elif old[:2] != new[:2]:
+        # The order moved to another bucket: carry its items along with it
+        items = instance.items.aggregate(n=Sum('quantity'))['n'] or 0
+        DailySales.apply(old[0], old[1], revenue=-old[2], orders=-1, items=-items)
+        DailySales.apply(day, status, revenue=total, orders=1, items=items)
+    elif old[2] != total:
+        DailySales.apply(day, status, revenue=total - old[2])
+
+    instance._rollup_state = new
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollup(sender, instance, **kwargs):
+    # Item counts were already removed by the cascaded OrderItem deletes
+    state = instance._rollup_state
+    if state is not None:
+        DailySales.apply(state[0], state[1], revenue=-state[2], orders=-1)
+
+
+def _item_bucket(item):
+    order = item._state.fields_cache.get('order')
+    state = _order_state(order) if order is not None else None
+    if state is None:
+        state = _stored_order_state(item.order_id)
+    return state
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_item_quantity(sender, instance, **kwargs):
+    instance._rollup_quantity = instance.__dict__.get('quantity') if instance.pk else None
+
+
+@receiver(post_save, sender=OrderItem)
+def update_rollup_for_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = 0 if created else instance._rollup_quantity
+    if previous is None:
+        # Loaded without its quantity; leave any drift to rebuild_sales_rollup
+        return
+    delta = instance.quantity - previous
+    instance._rollup_quantity = instance.quantity
+    if not delta:
+        return
+    state = _item_bucket(instance)
+    if state is not None:
+        DailySales.apply(state[0], state[1], items=delta)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_from_rollup(sender, instance, **kwargs):
+    state = _item_bucket(instance)
+    if state is not None:
+        DailySales.apply(state[0], state[1], items=-instance.quantity)
+
+
+@receiver(order_total_changed)
+def update_rollup_for_total(sender, order_id, order, delta, quantity=0, **kwargs):
+    state = order._rollup_state if order is not None else None
+    if state is None:
+        state = _stored_order_state(order_id)
+        if state is None:
+            return
+    DailySales.apply(state[0], state[1], revenue=delta, items=quantity)
+    if order is not None and order._rollup_state is not None:
+        # Keep the snapshot in step with the row so a later save() doesn't count delta twice
+        order._rollup_state = (state[0], state[1], state[2] + delta)
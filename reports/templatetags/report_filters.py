@@ -6,5 +6,13 @@ register = template.Library()
 def div(value, arg):
     try:
         return float(value) / float(arg)
-    except (ValueError, ZeroDivisionError):
-        return 0
\ No newline at end of file
+    except (ValueError, TypeError, ZeroDivisionError):
+        return 0
+
+@register.filter
+def mul(value, arg):
+    """Multiply the value by the argument"""
+    try:
+        return float(value) * float(arg)
+    except (ValueError, TypeError):
+        return 0
@@ -1,3 +1,410 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from openpyxl import load_workbook
+
+from grocery_management import routers
+from orders import synthetic
+from orders.models import Order, OrderItem
+from products.models import Category, Product, StockMovement
+from users.models import User
+from . import cache as report_cache
+from .models import DailySales
+
+APP_TABLES = ('orders_', 'products_', 'reports_')
+# Any SCAN reads the whole table, in rowid or index order; only SEARCH is selective
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?')
+
+
+class QueryPlanTests(TestCase):
+    """Run EXPLAIN QUERY PLAN over every query a report, dashboard or export
+    issues against seeded data and fail if one scans a table, even through an index."""
+
+    # Scans that are the point of the query: a bare table name for a scan in
+    # rowid order, "table USING index" for a walk along an index
+    allowed_scans = {
+        # Catalogue counters over every product, from the covering index; the
+        # five newest orders, read off the end of the created_at index
+        'dashboard': {'products_product USING product_stock_level_idx', 'orders_order USING order_created_idx'},
+        # Full dumps, in the order they are written out
+        'products:product_export': {'products_product'},
+        'reports:export_sales_csv': {'orders_order USING order_created_idx'},
+        # Every product by stock level; the partial index holds only the low-stock rows
+        'reports:inventory_report': {'products_product USING product_stock_level_idx',
+                                     'products_product USING product_low_stock_idx'},
+        'reports:low_stock_report': {'products_product USING product_low_stock_idx'},
+        'reports:export_inventory_csv': {'products_product USING product_low_stock_idx'},
+        # Rankings walk the counter indexes, stopping at the LIMIT for top-N lists
+        'reports:product_performance': {'products_product USING product_revenue_idx'},
+        'reports:top_selling_products': {'products_product USING product_units_sold_idx'},
+        'reports:low_performing_products': {'products_product USING product_revenue_idx'},
+        'reports:export_product_csv': {'products_product USING product_revenue_idx',
+                                       'products_product USING product_units_sold_idx'},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='manager', password='secret')
+        # Enough categories that a lookup by id beats reading them all
+        categories = Category.objects.bulk_create([Category(name=f'Aisle {n}') for n in range(20)])
+        products = Product.objects.bulk_create([
+            Product(barcode=f'{n:012d}', name=f'Product {n}', category=categories[n % len(categories)],
+                    price=Decimal('1.50') + n, stock=n % 12, min_stock_level=5)
+            for n in range(200)
+        ])
+        now = timezone.now()
+        orders = Order.objects.bulk_create([
+            Order(order_number=f'ORD{n:08d}', customer_name=f'Customer {n}', customer_phone=str(n),
+                  created_at=now - timedelta(hours=n * 29), total_amount=Decimal('10.00'),
+                  status=('completed', 'pending', 'cancelled')[n % 3])
+            for n in range(300)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[(i * 7) % len(products)],
+                      quantity=2, price=Decimal('5.00'), total=Decimal('10.00'))
+            for i, order in enumerate(orders)
+        ])
+        DailySales.rebuild()
+        call_command('rebuild_product_sales', stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plans are checked with SQLite EXPLAIN QUERY PLAN')
+        # Cached reports wouldn't issue the queries under test
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return {
+            f'{m.group(1)} USING {m.group(2)}' if m.group(2) else m.group(1)
+            for m in map(FULL_SCAN.match, details) if m
+        }
+
+    def assertIndexed(self, name, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name) + query)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+        allowed = self.allowed_scans.get(name, set())
+        for captured in queries.captured_queries:
+            sql = captured['sql']
+            if not sql.startswith('SELECT') or not any(t in sql for t in APP_TABLES):
+                continue
+            scans = {t for t in self.full_scans(sql) if t.startswith(APP_TABLES)} - allowed
+            self.assertFalse(scans, f'{name}{query} scans {", ".join(sorted(scans))}:\n{sql}')
+
+    def test_dashboard(self):
+        self.assertIndexed('dashboard')
+
+    def test_sales_reports(self):
+        self.assertIndexed('reports:sales_report')
+        self.assertIndexed('reports:monthly_sales_report', f'?year={timezone.now().year}')
+        self.assertIndexed('reports:yearly_sales_report')
+
+    def test_inventory_reports(self):
+        self.assertIndexed('reports:inventory_report')
+        self.assertIndexed('reports:low_stock_report')
+        self.assertIndexed('reports:out_of_stock_report')
+
+    def test_product_reports(self):
+        self.assertIndexed('reports:product_performance')
+        self.assertIndexed('reports:top_selling_products')
+        self.assertIndexed('reports:low_performing_products')
+        self.assertIndexed('reports:top_selling_products', '?days=30')
+
+    def test_exports(self):
+        self.assertIndexed('reports:export_sales_csv')
+        self.assertIndexed('reports:export_sales_excel', '?status=completed&start_date=2020-01-01')
+        self.assertIndexed('reports:export_inventory_csv', '?type=low_stock')
+        self.assertIndexed('reports:export_inventory_csv', '?type=out_of_stock')
+        self.assertIndexed('reports:export_product_csv', '?type=performance')
+        self.assertIndexed('reports:export_product_csv', '?type=top')
+        self.assertIndexed('reports:export_product_csv', '?type=low')
+        self.assertIndexed('products:product_export')
+
+
+class ExportContentTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='manager', password='secret'))
+        self.now = timezone.now()
+        Order.objects.bulk_create([
+            Order(order_number=f'ORD{n:04d}', customer_name=f'Customer {n}', customer_phone=str(n),
+                  created_at=self.now - timedelta(days=n), total_amount=Decimal('12.50') * (n + 1),
+                  status=('completed', 'pending', 'cancelled')[n % 3])
+            for n in range(5)
+        ])
+        pantry = Category.objects.create(name='Pantry')
+        Product.objects.create(barcode='7001', name='Salt', category=pantry, price=Decimal('0.80'), stock=0)
+        Product.objects.create(barcode='7002', name='Sugar', price=Decimal('1.20'), stock=2)
+        Product.objects.create(barcode='7003', name='Rice', price=Decimal('9.00'), stock=30)
+        # Several chunks per export, so the rows really come from successive fetches
+        patcher = mock.patch('reports.views.EXPORT_CHUNK_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def download(self, name, query=''):
+        response = self.client.get(reverse(name) + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def csv_rows(self, name, query=''):
+        response, content = self.download(name, query)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return response, list(csv.reader(io.StringIO(content.decode())))
+
+    def test_sales_csv(self):
+        response, rows = self.csv_rows('reports:export_sales_csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.csv"')
+        self.assertEqual(rows[0], ['Order Number', 'Customer', 'Date', 'Amount', 'Status'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([row[0] for row in rows[1:]], [f'ORD{n:04d}' for n in range(5)])
+        day = (self.now - timedelta(days=2)).strftime('%Y-%m-%d')
+        self.assertEqual(rows[3], ['ORD0002', 'Customer 2', day, '37.50', 'Cancelled'])
+
+    def test_inventory_csv(self):
+        response, rows = self.csv_rows('reports:export_inventory_csv', '?type=low_stock')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="low_stock_report.csv"')
+        self.assertEqual(rows[0], ['Product', 'Category', 'Current Stock', 'Min Stock', 'Price', 'Status'])
+        self.assertEqual(sorted(rows[1:]), [
+            ['Salt', 'Pantry', '0', '5', '0.80', 'Out of Stock'],
+            ['Sugar', 'None', '2', '5', '1.20', 'Low Stock'],
+        ])
+        response, rows = self.csv_rows('reports:export_inventory_csv', '?type=out_of_stock')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="out_of_stock_report.csv"')
+        self.assertEqual([row[0] for row in rows], ['Product', 'Salt'])
+
+    def test_sales_excel(self):
+        response, content = self.download('reports:export_sales_excel', '?status=completed')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.xlsx"')
+        workbook = load_workbook(io.BytesIO(content))
+        self.assertEqual(workbook.sheetnames, ['Sales Report'])
+        sheet = workbook['Sales Report']
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], ('Order Number', 'Customer', 'Date', 'Amount', 'Status'))
+        self.assertEqual([row[0] for row in rows[1:]], ['ORD0000', 'ORD0003'])
+        self.assertEqual(rows[2][1:], (
+            'Customer 3', (self.now - timedelta(days=3)).strftime('%Y-%m-%d'), 50.0, 'Completed',
+        ))
+        self.assertTrue(sheet['A1'].font.bold)
+        self.assertEqual(sheet['D2'].number_format, '$#,##0.00')
+        self.assertGreater(sheet.column_dimensions['B'].width, len('Customer 3'))
+
+
+class DailySalesRollupTests(TestCase):
+    def buckets(self):
+        # Buckets emptied again by moves between statuses stay behind as zeros; they add nothing
+        return sorted(
+            DailySales.objects.exclude(order_count=0, item_count=0, revenue=0)
+            .values_list('date', 'status', 'revenue', 'order_count', 'item_count')
+        )
+
+    def test_signals_keep_rollup_equal_to_rebuild(self):
+        tea = Product.objects.create(barcode='8001', name='Tea', price=Decimal('4.50'), stock=50)
+        rice = Product.objects.create(barcode='8002', name='Rice', price=Decimal('7.25'), stock=50)
+        last_week = timezone.now() - timedelta(days=7)
+        kept = Order.objects.create(customer_name='Asha', customer_phone='1')
+        kept.add_items([(tea, 2), (rice, 1)])
+        kept.status = 'completed'
+        kept.save()
+        old = Order.objects.create(customer_name='Ravi', customer_phone='2', created_at=last_week)
+        line = OrderItem.objects.create(order=old, product=tea, quantity=3, price=tea.price)
+        line.quantity = 1
+        line.save()
+        OrderItem.objects.create(order=old, product=rice, quantity=2, price=rice.price).delete()
+        cancelled = Order.objects.create(customer_name='Isha', customer_phone='3')
+        OrderItem.objects.create(order=cancelled, product=rice, quantity=4, price=rice.price)
+        cancelled.cancel()
+        Order.objects.create(customer_name='Dev', customer_phone='4').delete()
+
+        incremental = self.buckets()
+        self.assertTrue(incremental)
+        DailySales.rebuild()
+        self.assertEqual(incremental, self.buckets())
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        report_cache.stats.clear()
+        self.client.force_login(User.objects.create_user(username='manager', password='secret'))
+        self.product = Product.objects.create(barcode='5001', name='Oats', price=Decimal('2.00'), stock=50)
+
+    def top_selling(self):
+        return self.client.get(reverse('reports:top_selling_products')).context['products']
+
+    def test_result_is_reused_until_data_changes(self):
+        self.top_selling()
+        with self.assertNumQueries(2):  # session and user
+            self.assertEqual(self.top_selling()[0].total_sold, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer_name='Ana', customer_phone='1')
+            OrderItem(order=order, product=self.product, quantity=3, price=self.product.price).save()
+        self.assertEqual(self.top_selling()[0].total_sold, 3)
+
+        stats = self.client.get(reverse('reports:report_cache_stats')).json()['top_selling_products']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_closed_year_survives_new_orders(self):
+        last_year = timezone.localdate().year - 1
+        url = reverse('reports:monthly_sales_report') + f'?year={last_year}'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(customer_name='Ana', customer_phone='1')
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DailySales.rebuild()
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_closed_year_follows_changes_to_old_orders(self):
+        last_year = timezone.localdate().year - 1
+        url = reverse('reports:monthly_sales_report') + f'?year={last_year}'
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer_name='Ana', customer_phone='1', status='completed',
+                                         created_at=timezone.now().replace(year=last_year, month=6, day=1))
+            order.add_items([(self.product, 2)])
+        self.assertEqual(sum(self.client.get(url).context['chart_data']['sales']), 4.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.cancel()
+        self.assertEqual(sum(self.client.get(url).context['chart_data']['sales']), 0)
+
+    def test_closed_reports_follow_edits_outside_the_rollup(self):
+        last_month = timezone.localdate().replace(day=1) - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer_name='Ana', customer_phone='1', status='completed',
+                                         created_at=timezone.now() - timedelta(days=40))
+            order.add_items([(self.product, 1)])
+        StockMovement.objects.filter(product=self.product).update(created_at=order.created_at)
+        dates = {'start_date': '2000-01-01', 'end_date': last_month.isoformat()}
+        inventory_url = reverse('reports:inventory_report') + f'?as_of={last_month}'
+        self.assertContains(self.client.post(reverse('reports:sales_report'), dates), 'Ana')
+        self.assertContains(self.client.get(inventory_url), 'Oats')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.customer_name = 'Anita'
+            order.save()
+            self.product.name = 'Rolled oats'
+            self.product.save()
+        self.assertContains(self.client.post(reverse('reports:sales_report'), dates), 'Anita')
+        self.assertContains(self.client.get(inventory_url), 'Rolled oats')
+
+
+class BenchmarkTests(TestCase):
+    def test_synthetic_history_is_deterministic(self):
+        def history(seed):
+            products = [(pk, Decimal('2.00')) for pk in range(1, 51)]
+            orders = synthetic.synthetic_orders(random.Random(seed), products, 300, 4, timezone.localdate(), 60)
+            return [(order.order_number, order.created_at, order.total_amount, items) for order, items in orders]
+
+        first = history(7)
+        self.assertEqual(len(first), 300)
+        self.assertEqual(first, history(7))
+        self.assertNotEqual(first, history(8))
+
+    def test_runner_writes_baseline_and_flags_regressions(self):
+        synthetic.generate(products=30, orders=40, mean_lines=3, end=timezone.localdate(), days=10)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = os.path.join(directory, 'baseline.json')
+
+        call_command('benchmark_views', '--only', 'top_selling', '--repeat', '2', '--output', baseline,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        with open(baseline) as f:
+            results = json.load(f)
+        self.assertEqual(results['meta']['orders'], 40)
+        view = results['views']['reports:top_selling_products']
+        self.assertEqual(view['status'], 200)
+
+        view.update(p50_ms=0.0, queries=view['queries'] - 1)
+        with open(baseline, 'w') as f:
+            json.dump(results, f)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '1 views regressed'):
+            call_command('benchmark_views', '--only', 'top_selling', '--repeat', '2', '--noise-ms', '0',
+                         '--compare', baseline, '--output', os.path.join(directory, 'now.json'),
+                         stdout=out, stderr=io.StringIO())
+        self.assertIn('queries', out.getvalue())
+
+
+class ReportDatabaseTests(SimpleTestCase):
+    def test_production_profile_connections(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        name = os.path.join(directory, 'shop.sqlite3')
+        handler = ConnectionHandler({
+            'default': {'ENGINE': 'grocery_management.sqlite', 'NAME': name},
+            'reports': {'ENGINE': 'grocery_management.sqlite', 'NAME': name, 'OPTIONS': {'read_only': True}},
+        })
+        self.addCleanup(handler.close_all)
+        with handler['default'].cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            cursor.execute('CREATE TABLE t (n integer)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        with handler['reports'].cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT n FROM t').fetchall(), [(1,)])
+            with self.assertRaises(OperationalError):
+                cursor.execute('INSERT INTO t VALUES (2)')
+
+    def test_report_and_export_reads_are_routed(self):
+        router = routers.ReportsRouter()
+        seen = []
+
+        def through_middleware(url, response):
+            def get_response(request):
+                middleware.process_view(request, None, (), {})
+                seen.append(router.db_for_read(Order))
+                return response
+            middleware = routers.ReportReadsMiddleware(get_response)
+            request = RequestFactory().get(url)
+            request.resolver_match = resolve(url)
+            return middleware(request)
+
+        def rows():
+            seen.append(router.db_for_read(Order))
+            yield b'row'
+
+        with mock.patch.object(routers, 'reports_alias', return_value='reports'):
+            through_middleware(reverse('reports:sales_report'), HttpResponse())
+            through_middleware(reverse('orders:order_list'), HttpResponse())
+            export = through_middleware(reverse('products:product_export'), StreamingHttpResponse(rows()))
+            # Between the view returning and the body being sent
+            seen.append(router.db_for_read(Order))
+            b''.join(export.streaming_content)
+        self.assertEqual(seen, ['reports', None, 'reports', None, 'reports'])
+        self.assertEqual(router.db_for_write(Order), 'default')
+        self.assertFalse(router.allow_migrate('reports', 'orders'))
@@ -26,4 +26,6 @@ urlpatterns = [
     path('export/sales/excel/', views.export_sales_excel, name='export_sales_excel'),
     path('export/inventory/csv/', views.export_inventory_csv, name='export_inventory_csv'),
     path('export/products/csv/', views.export_product_csv, name='export_product_csv'),
+    
+    path('cache/stats/', views.report_cache_stats, name='report_cache_stats'),
 ]
\ No newline at end of file
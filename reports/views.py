@@ -1,19 +1,27 @@
 from pyexpat.errors import messages
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count, F
+from django.db.models import Sum, Count, F, Max
 from django.utils import timezone
 from datetime import timedelta, datetime
-from django.http import HttpResponse
-import csv
-from orders.models import Order
-from products.models import Product
+from django.http import FileResponse, JsonResponse
+import tempfile
+from django.conf import settings
+from orders.models import Order, OrderItem, start_of_day
+from products.ledger import stock_as_of
+from products.models import DailyProductSales, Product
 from django.db.models.functions import TruncMonth
-from django.db.models.functions import ExtractYear
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from django.db.models.functions import ExtractYear, Length
+from grocery_management.exports import EXPORT_CHUNK_SIZE, csv_stream_response
+from .cache import cached_report, report_stats
+from .excel import write_sales_workbook
+from .models import DailySales
 
+# Cap on the individual orders listed under the sales report totals
+SALES_REPORT_ORDER_LIMIT = 200
+
+# Excel exports larger than this are spooled from memory to a temp file
+EXCEL_SPOOL_MAX_SIZE = 8 * 1024 * 1024
 
 
 
@@ -27,74 +35,95 @@ def sales_report(request):
         start_date = datetime.strptime(request.POST.get('start_date'), '%Y-%m-%d')
         end_date = datetime.strptime(request.POST.get('end_date'), '%Y-%m-%d')
     
-    orders = Order.objects.filter(
-        created_at__range=[start_date, end_date],
-        status='completed'
-    )
-    
-    total_sales = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    order_count = orders.count()
-    
     context = {
         'start_date': start_date.strftime('%Y-%m-%d'),
         'end_date': end_date.strftime('%Y-%m-%d'),
-        'total_sales': total_sales,
-        'order_count': order_count,
-        'orders': orders,
+        **cached_report(
+            'sales_report',
+            {'start': start_date.date(), 'end': end_date.date()},
+            lambda: _completed_sales(start_date.date(), end_date.date()),
+            closed=end_date.date() < timezone.localdate(),
+        ),
     }
     return render(request, 'reports/sales.html', context)
 
-@login_required
-def daily_sales_report(request):
-    today = timezone.now().date()
-    orders = Order.objects.filter(
-        created_at__date=today,
+def _completed_sales(start, end):
+    # Totals come from the daily rollup; only the listed orders hit the orders table
+    totals = DailySales.objects.filter(
+        date__range=[start, end],
         status='completed'
-    )
+    ).aggregate(total=Sum('revenue'), count=Sum('order_count'))
     
-    total_sales = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    order_count = orders.count()
+    orders = Order.objects.created_between(start, end).filter(
+        status='completed'
+    ).order_by('-created_at')[:SALES_REPORT_ORDER_LIMIT]
     
+    return {
+        'total_sales': totals['total'] or 0,
+        'order_count': totals['count'] or 0,
+        'orders': list(orders),
+    }
+
+@login_required
+def daily_sales_report(request):
+    today = timezone.localdate()
     context = {
         'date': today,
-        'total_sales': total_sales,
-        'order_count': order_count,
-        'orders': orders,
+        **cached_report('daily_sales_report', {'date': today}, lambda: _completed_sales(today, today)),
     }
     return render(request, 'reports/daily_sales.html', context)
 
 @login_required
 def inventory_report(request):
-    products = Product.objects.all().order_by('stock')
-    low_stock = products.filter(stock__lt=F('min_stock_level'))
-    out_of_stock = products.filter(stock=0)
+    as_of = _parse_report_date(request.GET.get('as_of'))
+    if as_of:
+        context = cached_report('inventory_report', {'as_of': as_of}, lambda: _inventory_as_of(as_of),
+                                closed=as_of < timezone.localdate())
+        return render(request, 'reports/inventory.html', {**context, 'as_of': as_of})
+    
+    def compute():
+        products = Product.objects.select_related('category').order_by('stock')
+        return {
+            'products': list(products),
+            'low_stock': list(products.filter(stock__lt=F('min_stock_level'))),
+            'out_of_stock': list(products.filter(stock=0)),
+        }
     
-    context = {
+    context = cached_report('inventory_report', {}, compute)
+    return render(request, 'reports/inventory.html', context)
+
+def _inventory_as_of(day):
+    # Stock at the end of ``day`` from the stock ledger
+    stock = stock_as_of(start_of_day(day + timedelta(days=1)))
+    products = [p for p in Product.objects.select_related('category') if p.pk in stock]
+    for product in products:
+        product.stock = stock[product.pk]
+    products.sort(key=lambda product: product.stock)
+    return {
         'products': products,
-        'low_stock': low_stock,
-        'out_of_stock': out_of_stock,
+        'low_stock': [p for p in products if p.stock < p.min_stock_level],
+        'out_of_stock': [p for p in products if p.stock == 0],
     }
-    return render(request, 'reports/inventory.html', context)
 
 @login_required
 def export_sales_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Order Number', 'Customer', 'Date', 'Amount', 'Status'])
-    
-    orders = Order.objects.all().order_by('-created_at')
-    for order in orders:
-        writer.writerow([
-            order.order_number,
-            order.customer_name,
-            order.created_at.strftime('%Y-%m-%d'),
-            order.total_amount,
-            order.get_status_display()
-        ])
-    
-    return response
+    status_labels = dict(Order.ORDER_STATUS)
+    orders = (
+        Order.objects
+        .order_by('-created_at')
+        .values_list('order_number', 'customer_name', 'created_at', 'total_amount', 'status')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    rows = (
+        (number, customer, created_at.strftime('%Y-%m-%d'), amount, status_labels.get(status, status))
+        for number, customer, created_at, amount, status in orders
+    )
+    return csv_stream_response(
+        'sales_report.csv',
+        ['Order Number', 'Customer', 'Date', 'Amount', 'Status'],
+        rows,
+    )
+
 @login_required
 def monthly_sales_report(request):
     # Get current year and month
@@ -106,18 +135,30 @@ def monthly_sales_report(request):
     except ValueError:
         year = now.year
     
+    context = {
+        'year': year,
+        'years': range(now.year - 5, now.year + 1),
+        **cached_report(
+            'monthly_sales_report', {'year': year},
+            lambda: _monthly_sales(year),
+            closed=year < timezone.localdate().year,
+        ),
+    }
+    return render(request, 'reports/monthly_sales.html', context)
+
+def _monthly_sales(year):
     # Get monthly sales data
-    monthly_data = (
-        Order.objects
+    monthly_data = list(
+        DailySales.objects
         .filter(
-            created_at__year=year,
+            date__year=year,
             status='completed'
         )
-        .annotate(month=TruncMonth('created_at'))
+        .annotate(month=TruncMonth('date'))
         .values('month')
         .annotate(
-            total_sales=Sum('total_amount'),
-            order_count=Count('id')
+            total_sales=Sum('revenue'),
+            order_count=Sum('order_count')
         )
         .order_by('month')
     )
@@ -132,9 +173,7 @@ def monthly_sales_report(request):
         sales.append(float(month_data['total_sales']))
         orders.append(month_data['order_count'])
     
-    context = {
-        'year': year,
-        'years': range(now.year - 5, now.year + 1),
+    return {
         'monthly_data': monthly_data,
         'chart_data': {
             'months': months,
@@ -142,19 +181,22 @@ def monthly_sales_report(request):
             'orders': orders,
         }
     }
-    return render(request, 'reports/monthly_sales.html', context)
 
 @login_required
 def yearly_sales_report(request):
+    context = cached_report('yearly_sales_report', {}, _yearly_sales)
+    return render(request, 'reports/yearly_sales.html', context)
+
+def _yearly_sales():
     # Get yearly sales data
-    yearly_data = (
-        Order.objects
+    yearly_data = list(
+        DailySales.objects
         .filter(status='completed')
-        .annotate(year=ExtractYear('created_at'))
+        .annotate(year=ExtractYear('date'))
         .values('year')
         .annotate(
-            total_sales=Sum('total_amount'),
-            order_count=Count('id')
+            total_sales=Sum('revenue'),
+            order_count=Sum('order_count')
         )
         .order_by('-year')
     )
@@ -169,7 +211,7 @@ def yearly_sales_report(request):
         sales.append(float(year_data['total_sales']))
         orders.append(year_data['order_count'])
     
-    context = {
+    return {
         'yearly_data': yearly_data,
         'chart_data': {
             'years': years,
@@ -177,23 +219,26 @@ def yearly_sales_report(request):
             'orders': orders,
         }
     }
-    return render(request, 'reports/yearly_sales.html', context)
 
 @login_required
 def low_stock_report(request):
-    # Get low stock items (below minimum stock level)
-    low_stock_items = Product.objects.filter(
-        stock__lt=F('min_stock_level')
-    ).order_by('stock')
-    
-    # Calculate total value of low stock items
-    total_value = low_stock_items.aggregate(
-        total=Sum(F('stock') * F('price'))
-    )
+    def compute():
+        # Get low stock items (below minimum stock level)
+        low_stock_items = Product.objects.select_related('category').filter(
+            stock__lt=F('min_stock_level')
+        ).order_by('stock')
+        
+        # Calculate total value of low stock items
+        total_value = low_stock_items.aggregate(
+            total=Sum(F('stock') * F('price'))
+        )
+        return {
+            'low_stock_items': list(low_stock_items),
+            'total_value': total_value['total'] or 0,
+        }
     
     context = {
-        'low_stock_items': low_stock_items,
-        'total_value': total_value['total'] or 0,
+        **cached_report('low_stock_report', {}, compute),
         'title': 'Low Stock Report'
     }
     return render(request, 'reports/inventory_list.html', context)
@@ -201,9 +246,9 @@ def low_stock_report(request):
 @login_required
 def out_of_stock_report(request):
     # Get out of stock items
-    out_of_stock_items = Product.objects.filter(
-        stock=0
-    ).order_by('name')
+    out_of_stock_items = cached_report('out_of_stock_report', {}, lambda: list(
+        Product.objects.select_related('category').filter(stock=0).order_by('name')
+    ))
     
     context = {
         'low_stock_items': out_of_stock_items,
@@ -223,31 +268,58 @@ def export_inventory_csv(request):
         products = Product.objects.filter(stock=0)
         filename = 'out_of_stock_report.csv'
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Product', 'Category', 'Current Stock', 'Min Stock', 'Price', 'Status'])
-    
-    for product in products:
-        writer.writerow([
-            product.name,
-            str(product.category),
-            product.stock,
-            product.min_stock_level,
-            product.price,
-            'Out of Stock' if product.stock == 0 else 'Low Stock'
-        ])
-    
-    return response
+    products = (
+        products
+        .values_list('name', 'category__name', 'stock', 'min_stock_level', 'price')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    rows = (
+        (name, category or 'None', stock, min_stock, price, 'Out of Stock' if stock == 0 else 'Low Stock')
+        for name, category, stock, min_stock, price in products
+    )
+    return csv_stream_response(
+        filename,
+        ['Product', 'Category', 'Current Stock', 'Min Stock', 'Price', 'Status'],
+        rows,
+    )
+
+def _product_sales():
+    # Lifetime counters kept on Product by Product.record_sales(), under the
+    # names the templates and CSV export expect
+    return Product.objects.annotate(total_sold=F('units_sold'), total_revenue=F('revenue'))
+
+def _top_sellers_since(day):
+    if getattr(settings, 'PRODUCT_DAILY_SALES', True):
+        rows = (
+            # Bounded on both sides: SQLite takes an open-ended range as too wide
+            # for the date index and walks the whole table in product order instead
+            DailyProductSales.objects.filter(date__range=(day, timezone.localdate()))
+            .values('product_id')
+            .annotate(total_sold=Sum('units_sold'), total_revenue=Sum('revenue'))
+        )
+    else:
+        rows = (
+            OrderItem.objects
+            .filter(order__in=Order.objects.created_between(day).exclude(status='cancelled'))
+            .values('product_id')
+            .annotate(total_sold=Sum('quantity'), total_revenue=Sum('total'))
+        )
+    rows = list(rows.order_by('-total_sold')[:10])
+    products = Product.objects.select_related('category').in_bulk([row['product_id'] for row in rows])
+    top_products = []
+    for row in rows:
+        product = products[row['product_id']]
+        product.total_sold = row['total_sold']
+        product.total_revenue = row['total_revenue']
+        top_products.append(product)
+    return top_products
 
 @login_required
 def product_performance(request):
     # Get product performance data (sales and revenue)
-    products = Product.objects.annotate(
-        total_sold=Sum('orderitem__quantity'),
-        total_revenue=Sum('orderitem__total')
-    ).order_by('-total_revenue')
+    products = cached_report('product_performance', {}, lambda: list(
+        _product_sales().select_related('category').order_by('-revenue')
+    ))
     
     context = {
         'products': products,
@@ -257,59 +329,35 @@ def product_performance(request):
 
 @login_required
 def top_selling_products(request):
-    # Get top 10 selling products
-    top_products = Product.objects.annotate(
-        total_sold=Sum('orderitem__quantity')
-    ).order_by('-total_sold')[:10]
+    # Get top 10 selling products, optionally over the last ?days=N
+    try:
+        days = max(int(request.GET['days']), 1)
+    except (KeyError, ValueError):
+        days = None
+    
+    if days:
+        since = timezone.localdate() - timedelta(days=days - 1)
+        top_products = cached_report('top_selling_products', {'since': since},
+                                     lambda: _top_sellers_since(since))
+        title = f'Top Selling Products (last {days} days)'
+    else:
+        top_products = cached_report('top_selling_products', {}, lambda: list(
+            _product_sales().select_related('category').order_by('-units_sold')[:10]
+        ))
+        title = 'Top Selling Products'
     
     context = {
         'products': top_products,
-        'title': 'Top Selling Products'
+        'title': title
     }
     return render(request, 'reports/product_performance.html', context)
 
-@login_required
-def export_product_csv(request):
-    report_type = request.GET.get('type', 'performance')
-    
-    if report_type == 'performance':
-        products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity'),
-            total_revenue=Sum('orderitem__total')
-        ).order_by('-total_revenue')
-        filename = 'product_performance.csv'
-    else:
-        products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity')
-        ).order_by('-total_sold')[:10]
-        filename = 'top_selling_products.csv'
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Product', 'Category', 'Units Sold', 'Total Revenue', 'Average Price', 'Current Stock'])
-    
-    for product in products:
-        avg_price = product.total_revenue / product.total_sold if product.total_sold else 0
-        writer.writerow([
-            product.name,
-            str(product.category),
-            product.total_sold or 0,
-            product.total_revenue or 0,
-            round(avg_price, 2),
-            product.stock
-        ])
-    
-    return response
-
 @login_required
 def low_performing_products(request):
     # Get products with low sales (bottom 10 by revenue)
-    low_performers = Product.objects.annotate(
-        total_sold=Sum('orderitem__quantity'),
-        total_revenue=Sum('orderitem__total')
-    ).order_by('total_revenue')[:10]  # Get 10 lowest performers
+    low_performers = cached_report('low_performing_products', {}, lambda: list(
+        _product_sales().select_related('category').order_by('revenue')[:10]  # Get 10 lowest performers
+    ))
     
     context = {
         'products': low_performers,
@@ -321,89 +369,85 @@ def low_performing_products(request):
 def export_product_csv(request):
     report_type = request.GET.get('type', 'performance')
     
+    products = _product_sales()
     if report_type == 'performance':
-        products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity'),
-            total_revenue=Sum('orderitem__total')
-        ).order_by('-total_revenue')
+        products = products.order_by('-revenue')
         filename = 'product_performance.csv'
     elif report_type == 'top':
-        products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity')
-        ).order_by('-total_sold')[:10]
+        products = products.order_by('-units_sold')[:10]
         filename = 'top_selling_products.csv'
     else:  # low performers
-        products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity'),
-            total_revenue=Sum('orderitem__total')
-        ).order_by('total_revenue')[:10]
+        products = products.order_by('revenue')[:10]
         filename = 'low_performing_products.csv'
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Product', 'Category', 'Units Sold', 'Total Revenue', 'Average Price', 'Current Stock'])
-    
-    for product in products:
-        avg_price = product.total_revenue / product.total_sold if product.total_sold else 0
-        writer.writerow([
-            product.name,
-            str(product.category),
-            product.total_sold or 0,
-            product.total_revenue or 0,
-            round(avg_price, 2),
-            product.stock
-        ])
-    
-    return response
+    rows = (
+        (
+            name,
+            category or 'None',
+            total_sold or 0,
+            total_revenue or 0,
+            round(total_revenue / total_sold if total_sold else 0, 2),
+            stock,
+        )
+        for name, category, total_sold, total_revenue, stock in products
+        .values_list('name', 'category__name', 'total_sold', 'total_revenue', 'stock')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return csv_stream_response(
+        filename,
+        ['Product', 'Category', 'Units Sold', 'Total Revenue', 'Average Price', 'Current Stock'],
+        rows,
+    )
+
+@login_required
+def report_cache_stats(request):
+    return JsonResponse(report_stats())
+
+def _parse_report_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
 @login_required
 def export_sales_excel(request):
-    # Create a workbook and add a worksheet
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sales Report"
-    
-    # Add headers with formatting
-    headers = ['Order Number', 'Customer', 'Date', 'Amount', 'Status']
-    for col_num, header in enumerate(headers, 1):
-        col_letter = get_column_letter(col_num)
-        ws[f'{col_letter}1'] = header
-        ws[f'{col_letter}1'].font = Font(bold=True)
-        ws[f'{col_letter}1'].alignment = Alignment(horizontal='center')
-    
-    # Get sales data
-    orders = Order.objects.all().order_by('-created_at')
-    
-    # Add data rows
-    for row_num, order in enumerate(orders, 2):
-        ws[f'A{row_num}'] = order.order_number
-        ws[f'B{row_num}'] = order.customer_name
-        ws[f'C{row_num}'] = order.created_at.strftime('%Y-%m-%d')
-        ws[f'D{row_num}'] = float(order.total_amount)
-        ws[f'E{row_num}'] = order.get_status_display()
-    
-    # Format columns
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column].width = adjusted_width
-    
-    # Format currency column
-    for row in ws.iter_rows(min_row=2, min_col=4, max_col=4):
-        for cell in row:
-            cell.number_format = '$#,##0.00'
-    
-    # Create response
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=sales_report.xlsx'
-    wb.save(response)
+    # Same date range/status filters as sales_report, passed as query params
+    start_date = _parse_report_date(request.GET.get('start_date'))
+    end_date = _parse_report_date(request.GET.get('end_date'))
+    status = request.GET.get('status')
+    orders = Order.objects.created_between(start_date, end_date)
+    if status in dict(Order.ORDER_STATUS):
+        orders = orders.filter(status=status)
+    
+    # Column widths have to be known before the first row is written
+    widths = orders.aggregate(
+        number=Max(Length('order_number')),
+        customer=Max(Length('customer_name')),
+        amount=Max('total_amount'),
+    )
+    status_labels = dict(Order.ORDER_STATUS)
+    max_lengths = [
+        widths['number'] or 0,
+        widths['customer'] or 0,
+        len('YYYY-MM-DD'),
+        len(str(float(widths['amount'] or 0))),
+        max(len(label) for label in status_labels.values()),
+    ]
+    
+    rows = (
+        (number, customer, created_at.strftime('%Y-%m-%d'), float(amount), status_labels.get(value, value))
+        for number, customer, created_at, amount, value in orders
+        .order_by('-created_at')
+        .values_list('order_number', 'customer_name', 'created_at', 'total_amount', 'status')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
     
-    return response
\ No newline at end of file
+    output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
+    write_sales_workbook(output, rows, max_lengths)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename='sales_report.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
@@ -0,0 +1,116 @@
+"""Dashboard counters and recent orders kept in the shared cache.
+
+The counters come from one aggregate query and are refreshed after at most
+DASHBOARD_CACHE_TIMEOUT seconds; in between, signals keep them current:
+new and deleted orders adjust today's count in place, product and stock
+changes drop the counters, and changes to a listed order drop the recent
+orders list. Everything runs once the transaction commits.
+
+Invalidation reaches other worker processes only because the default cache
+is shared between them (CACHES in settings). The file backend's incr() is
+not atomic across processes, so two orders created at the same moment may
+count once; the count is corrected within DASHBOARD_CACHE_TIMEOUT. Redis
+counts exactly.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Func, Max, Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from orders.models import Order
+from orders.signals import order_total_changed
+from products.models import Product
+from products.signals import stock_changed
+
+CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 30)
+RECENT_ORDERS = 5
+
+PRODUCTS_KEY = 'dashboard:products'
+RECENT_KEY = 'dashboard:recent'
+
+
+def _orders_key(day):
+    return f'dashboard:orders:{day.isoformat()}'
+
+
+def compute_counters(day):
+    """``product_count``, ``low_stock_count`` and ``todays_orders`` in a single query."""
+    todays = Order.objects.created_between(day, day).order_by()
+    counters = Product.objects.order_by().aggregate(
+        product_count=Count('pk'),
+        low_stock_count=Count('pk', filter=Q(stock__lt=F('min_stock_level'))),
+        # An aggregate over the uncorrelated subquery makes SQLite run it once
+        todays_orders=Max(Subquery(todays.values(n=Func('pk', function='COUNT')))),
+    )
+    if counters['todays_orders'] is None:
+        # No product rows to aggregate over
+        counters['todays_orders'] = todays.count()
+    return counters
+
+
+def counters():
+    day = timezone.localdate()
+    products = cache.get(PRODUCTS_KEY)
+    todays_orders = cache.get(_orders_key(day))
+    if products is None or todays_orders is None:
+        fresh = compute_counters(day)
+        todays_orders = fresh.pop('todays_orders')
+        products = fresh
+        cache.set_many({PRODUCTS_KEY: products, _orders_key(day): todays_orders}, CACHE_TIMEOUT)
+    return {**products, 'todays_orders': todays_orders}
+
+
+def recent_orders():
+    orders = cache.get(RECENT_KEY)
+    if orders is None:
+        orders = list(Order.objects.order_by('-created_at', '-id')[:RECENT_ORDERS])
+        cache.set(RECENT_KEY, orders, CACHE_TIMEOUT)
+    return orders
+
+
+def _adjust_todays_orders(day, delta):
+    try:
+        cache.incr(_orders_key(day), delta)
+    except ValueError:
+        # Not cached; the next dashboard view counts from scratch
+        pass
+
+
+def _forget_recent(order_id):
+    orders = cache.get(RECENT_KEY)
+    if orders is not None and any(order.pk == order_id for order in orders):
+        cache.delete(RECENT_KEY)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    order_id = instance.pk
+    if created:
+        day = timezone.localdate(instance.created_at)
+        transaction.on_commit(lambda: (_adjust_todays_orders(day, 1), cache.delete(RECENT_KEY)))
+    else:
+        transaction.on_commit(lambda: _forget_recent(order_id))
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    day = timezone.localdate(instance.created_at)
+    order_id = instance.pk
+    transaction.on_commit(lambda: (_adjust_todays_orders(day, -1), _forget_recent(order_id)))
+
+
+@receiver(order_total_changed)
+def order_total_updated(sender, order_id, **kwargs):
+    transaction.on_commit(lambda: _forget_recent(order_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(stock_changed)
+def products_changed(sender, **kwargs):
+    transaction.on_commit(lambda: cache.delete(PRODUCTS_KEY))
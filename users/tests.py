@@ -1,3 +1,43 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from orders.models import Order
+from products.models import Product
+from .models import User
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_user(username='till', password='secret'))
+        self.product = Product.objects.create(barcode='4001', name='Tea', price=Decimal('3.00'),
+                                              stock=10, min_stock_level=5)
+
+    def dashboard(self):
+        return self.client.get(reverse('dashboard')).context
+
+    def test_counters_are_cached(self):
+        self.dashboard()
+        with self.assertNumQueries(2):  # session and user
+            context = self.dashboard()
+        self.assertEqual(
+            (context['product_count'], context['low_stock_count'], context['todays_orders']), (1, 0, 0)
+        )
+
+    def test_signals_keep_counters_current(self):
+        self.dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer_name='Ana', customer_phone='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.adjust_stock(self.product.pk, -8)
+        context = self.dashboard()
+        self.assertEqual((context['todays_orders'], context['low_stock_count']), (1, 1))
+        self.assertEqual([o.pk for o in context['recent_orders']], [order.pk])
 
-# Create your tests here.
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertEqual(self.dashboard()['todays_orders'], 0)
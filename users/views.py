@@ -4,10 +4,7 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from products.models import Product
-from orders.models import Order
-from django.utils import timezone
-from django.db.models import F
+from .dashboard import counters as dashboard_counters, recent_orders
 from .forms import (
     UserRegistrationForm, 
     StaffRegistrationForm, 
@@ -113,14 +110,9 @@ def staff_list(request):
     return render(request, 'users/staff_list.html', {'staff_members': staff_members})
 
 def dashboard(request):
+    # Served from the shared cache; see users/dashboard.py for invalidation
     context = {
-        'product_count': Product.objects.count(),
-        'todays_orders': Order.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count(),
-        'low_stock_count': Product.objects.filter(
-            stock__lt=F('min_stock_level')
-        ).count(),
-        'recent_orders': Order.objects.all().order_by('-created_at')[:5]
+        **dashboard_counters(),
+        'recent_orders': recent_orders(),
     }
     return render(request, 'dashboard.html', context)
\ No newline at end of file